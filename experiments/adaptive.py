@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+# error_class values that mean "send less"; other errors say nothing about load
+THROTTLE_CLASSES = ("rate_limit", "overloaded", "quota", "timeout")
+
+
+class _Group:
+    def __init__(self, limit: float) -> None:
+        self.limit = limit
+        self.last_decrease = 0.0
+        # Latency per call key: fast-moving average and the best average seen (slowly forgotten)
+        self.latency_ema: Dict[str, float] = {}
+        self.latency_floor: Dict[str, float] = {}
+        self.throttles = 0
+        self.successes = 0
+
+
+class AdaptiveConcurrency:
+    """AIMD in-flight limits per provider.
+
+    Each success raises a group's limit by ``increase / limit`` (about
+    ``increase`` per round of calls); a throttling signal multiplies it by
+    ``decrease``. Signals from calls that started before the last decrease
+    are ignored, so one burst of 429s from calls already in flight counts as
+    a single congestion event. Signals are:
+
+    - ``error_class`` in THROTTLE_CLASSES (rate_limit, overloaded, quota, timeout)
+    - rate-limit headers reporting no remaining requests/tokens (no increase
+      while below ``headroom`` of the advertised limit)
+    - a call key's latency average exceeding ``latency_factor`` times the best
+      average seen for that key (gentle 0.9x decrease)
+
+    Thread-safe: calls report from worker threads while the dispatcher reads
+    ``limit()``.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_factor: Optional[float] = 3.0,
+        headroom: float = 0.05,
+    ) -> None:
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.initial = float(min(self.max_limit, max(self.min_limit, int(initial))))
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self.latency_factor = latency_factor
+        self.headroom = float(headroom)
+        self._lock = threading.Lock()
+        self._groups: Dict[str, _Group] = {}
+
+    def _group(self, group: str) -> _Group:
+        g = self._groups.get(group)
+        if g is None:
+            g = _Group(self.initial)
+            self._groups[group] = g
+        return g
+
+    def limit(self, group: str) -> int:
+        with self._lock:
+            return max(self.min_limit, int(self._group(group).limit))
+
+    def _decrease(self, g: _Group, factor: float, started: float) -> None:
+        if started < g.last_decrease:
+            return
+        g.limit = max(float(self.min_limit), g.limit * factor)
+        g.last_decrease = time.monotonic()
+
+    def on_success(self, group: str, key: str, started: float, latency_s: Optional[float], rate_limit: Optional[Dict[str, Any]] = None) -> None:
+        """Report a completed call; started is its time.monotonic() at dispatch."""
+        with self._lock:
+            g = self._group(group)
+            g.successes += 1
+            if self._near_exhaustion(rate_limit):
+                # The provider says we're at the edge: hold, and back off if fully spent
+                if rate_limit.get("remaining_requests") == 0 or rate_limit.get("remaining_tokens") == 0:
+                    self._decrease(g, self.decrease, started)
+                return
+            if latency_s is not None and self.latency_factor:
+                ema = g.latency_ema.get(key)
+                ema = latency_s if ema is None else 0.8 * ema + 0.2 * latency_s
+                g.latency_ema[key] = ema
+                # Floor tracks the best average, drifting up slowly so a permanent shift is accepted
+                floor = g.latency_floor.get(key)
+                floor = ema if floor is None else min(ema, floor * 1.01)
+                g.latency_floor[key] = floor
+                if ema > floor * self.latency_factor:
+                    self._decrease(g, 0.9, started)
+                    return
+            g.limit = min(float(self.max_limit), g.limit + self.increase / max(1.0, g.limit))
+
+    def on_error(self, group: str, started: float, error_class: Optional[str]) -> None:
+        """Report a failed call; only throttling classes lower the limit."""
+        if error_class not in THROTTLE_CLASSES:
+            return
+        with self._lock:
+            g = self._group(group)
+            g.throttles += 1
+            self._decrease(g, self.decrease, started)
+
+    def _near_exhaustion(self, rate_limit: Optional[Dict[str, Any]]) -> bool:
+        if not rate_limit:
+            return False
+        for kind in ("requests", "tokens"):
+            remaining = rate_limit.get(f"remaining_{kind}")
+            limit = rate_limit.get(f"limit_{kind}")
+            if remaining is None:
+                continue
+            if remaining == 0 or (limit and remaining < limit * self.headroom):
+                return True
+        return False
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {"limit": round(g.limit, 2), "successes": g.successes, "throttles": g.throttles}
+                for name, g in self._groups.items()
+            }
@@ -0,0 +1,314 @@
+"""
+Adaptive testing mode for the runner (`runner --mode adaptive`).
+
+Each target is given problems one at a time (up to `parallel` in flight)
+chosen where they say most about its ability: under the Rasch model fitted
+by `python -m experiments.irt calibrate`, the problem whose difficulty is
+closest to the target's current ability estimate. After every answer the
+estimate is refitted, and the target stops once its standard error is at
+most `target_se` (after `min_items`), at `max_items`, or when the
+calibrated problems run out. Only problems present in the difficulty file
+are used. Rows go to the usual results / provenance / summary files, and
+the summary gains an `adaptive_testing` object with the ability, its
+standard error and the accuracy it implies over all calibrated problems of
+the dataset, which is comparable with a full run's accuracy. Re-running with
+the same --run resumes from the answers already written.
+
+Calls go through the interactive runner's scheduler and engine, so
+workers, provider / model caps, weights, concurrency.engine, AIMD,
+hedging, the circuit breaker and the metrics endpoint all apply. A
+problem deferred by an open circuit goes back to its target's pool for
+the next of `deferred_rounds`.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    from .schema import RunConfig, ResultRow
+    from .irt import DifficultyIndex, ItemPool, estimate_ability, expected_accuracy
+    from .runner import (
+        ProblemStore,
+        _build_outpath,
+        _commit_result,
+        _configure_circuit,
+        _configure_rate_limits,
+        _expand_targets,
+        _fill_deferred_visible_tokens,
+        _hedge_policy,
+        _in_flight_caps,
+        _is_deferred,
+        _leaf_targets,
+        _new_scheduler,
+        _new_stats,
+        _new_writer,
+        _open_checkpoint,
+        _processed_ids,
+        _provenance_path,
+        _run_engine,
+        _start_metrics,
+        _target_key,
+        _write_summary,
+        get_problem_store,
+    )
+    from .circuit import get_circuit_breaker
+    from .metrics import get_run_metrics
+    from ..utils.rate_limiter import rate_limit_key
+except Exception:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from experiments.schema import RunConfig, ResultRow
+    from experiments.irt import DifficultyIndex, ItemPool, estimate_ability, expected_accuracy
+    from experiments.runner import (
+        ProblemStore,
+        _build_outpath,
+        _commit_result,
+        _configure_circuit,
+        _configure_rate_limits,
+        _expand_targets,
+        _fill_deferred_visible_tokens,
+        _hedge_policy,
+        _in_flight_caps,
+        _is_deferred,
+        _leaf_targets,
+        _new_scheduler,
+        _new_stats,
+        _new_writer,
+        _open_checkpoint,
+        _processed_ids,
+        _provenance_path,
+        _run_engine,
+        _start_metrics,
+        _target_key,
+        _write_summary,
+        get_problem_store,
+    )
+    from experiments.circuit import get_circuit_breaker
+    from experiments.metrics import get_run_metrics
+    from utils.rate_limiter import rate_limit_key
+
+
+def _answered(outpath: str) -> Dict[Any, bool]:
+    """{id: correct} for rows already in a results file (errors excluded)."""
+    out: Dict[Any, bool] = {}
+    if not os.path.exists(outpath):
+        return out
+    with open(outpath, "r") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except Exception:
+                continue
+            if row.get("error"):
+                continue
+            correct = row.get("correct")
+            satflag = (row.get("meta") or {}).get("satflag")
+            if not isinstance(correct, bool) and satflag is not None and "parsed_answer" in row:
+                correct = row["parsed_answer"] == satflag
+            if isinstance(correct, bool):
+                out[row.get("id")] = correct
+    return out
+
+
+class _AdaptiveTarget:
+    """One target's item pool, answers and ability estimate."""
+
+    def __init__(self, cfg: RunConfig, t: Dict[str, Any], run_id: Optional[str], store: ProblemStore, index: DifficultyIndex) -> None:
+        self.cfg = cfg
+        self.t = t
+        self.key = _target_key(t)
+        self.settings = cfg.adaptive_testing
+        self.outpath = _build_outpath(cfg, t, t.get("model"), run_id)
+        self.responses_path = _provenance_path(self.outpath) if cfg.outputs.provenance.enabled else None
+        self.checkpoint = _open_checkpoint(cfg, self.outpath, self.responses_path)
+        processed = _processed_ids(cfg, self.checkpoint)
+        answered = _answered(self.outpath) if processed else {}
+        self.stats = _new_stats(t)
+        self.responses: List[Tuple[float, int]] = []
+        self.difficulties: List[float] = []
+        entries: List[Tuple[float, int]] = []
+        for idx, problem in enumerate(store.problems):
+            b = index.difficulty(problem)
+            if b is None:
+                continue
+            self.difficulties.append(b)
+            pid = store.pids[idx]
+            if pid in processed:
+                if pid in answered:
+                    self.responses.append((b, int(answered[pid])))
+            else:
+                entries.append((b, idx))
+        self.pool = ItemPool(entries)
+        self.in_flight: Dict[int, float] = {}
+        # Problems whose call met an open circuit, with their difficulty; back to the pool next round
+        self.deferred: List[Tuple[int, float]] = []
+        self.ever_deferred: Set[int] = set()
+        self.theta, self.se = estimate_ability(self.responses, self.settings.prior_sd)
+        self.stop_reason: Optional[str] = None
+
+    def _stop_reason(self, pending: int) -> Optional[str]:
+        n = len(self.responses)
+        if n + pending >= self.settings.max_items:
+            return "max_items"
+        if n >= self.settings.min_items and self.se <= self.settings.target_se:
+            return "precision"
+        if not len(self.pool):
+            return "exhausted"
+        return None
+
+    def next_item(self) -> Optional[int]:
+        # Once a call met an open circuit, hand out nothing more this round rather than defer the whole pool
+        if self.stop_reason or self.deferred or len(self.in_flight) >= max(1, self.settings.parallel):
+            return None
+        reason = self._stop_reason(len(self.in_flight))
+        if reason:
+            if not self.in_flight:
+                self.stop_reason = reason
+            return None
+        idx, b = self.pool.take(self.theta)  # type: ignore[misc]
+        self.in_flight[idx] = b
+        return idx
+
+    def record(self, idx: int, row: ResultRow) -> None:
+        b = self.in_flight.pop(idx)
+        # API errors say nothing about ability; the problem is used up either way
+        if not row.error and row.correct is not None:
+            self.responses.append((b, int(bool(row.correct))))
+            self.theta, self.se = estimate_ability(self.responses, self.settings.prior_sd, self.theta)
+        if not self.in_flight:
+            self.stop_reason = self._stop_reason(0)
+
+    def defer(self, idx: int) -> None:
+        self.deferred.append((idx, self.in_flight.pop(idx)))
+        if idx not in self.ever_deferred:
+            self.ever_deferred.add(idx)
+            self.stats["deferred"] = self.stats.get("deferred", 0) + 1
+
+    def waiting_on_circuit(self) -> bool:
+        """Deferred problems that may still be asked (the target ran out of problems rather than stopping)."""
+        return bool(self.deferred) and self.stop_reason in (None, "exhausted")
+
+    def restore(self) -> None:
+        for idx, b in self.deferred:
+            self.pool.put(idx, b)
+        self.deferred = []
+        if self.stop_reason == "exhausted":
+            self.stop_reason = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "difficulty_file": self.settings.difficulty_file,
+            "theta": self.theta,
+            "se": self.se,
+            "items": len(self.responses),
+            "calibrated_problems": len(self.difficulties),
+            "expected_accuracy": expected_accuracy(self.theta, self.difficulties),
+            "stop_reason": self.stop_reason,
+        }
+
+
+def run_adaptive(
+    cfg: RunConfig,
+    targets: List[Dict[str, Any]],
+    only_providers: Optional[List[str]] = None,
+    model_overrides: Optional[Dict[str, List[str]]] = None,
+    dry_run: bool = False,
+    run_id: Optional[str] = None,
+) -> None:
+    path = cfg.adaptive_testing.difficulty_file
+    if not os.path.exists(path):
+        raise RuntimeError(f"Difficulty file {path} not found; create it with `python -m experiments.irt calibrate --out {path}`")
+    index = DifficultyIndex.load(path)
+    store = get_problem_store(cfg)
+    expanded = _expand_targets(targets, only_providers, model_overrides)
+    if not expanded:
+        return
+    _configure_rate_limits(cfg, expanded)
+    _configure_circuit(cfg)
+    unique: Dict[str, Dict[str, Any]] = {}
+    for t in expanded:
+        unique.setdefault(_target_key(t), t)
+    states = [_AdaptiveTarget(cfg, t, run_id, store, index) for t in unique.values()]
+    if dry_run:
+        for st in states:
+            print(f"[adaptive] {st.key}: {len(st.difficulties)} of {len(store)} problems calibrated, {len(st.responses)} answered, "
+                  f"theta={st.theta:+.2f} se={st.se:.2f}")
+        for st in states:
+            st.checkpoint.close()
+        return
+
+    by_key = {st.key: st for st in states}
+    key_to_target = {k: st.t for k, st in by_key.items()}
+    metrics_server = _start_metrics(cfg, by_key)
+    metrics = get_run_metrics()
+    writer = _new_writer(cfg)
+    scheduler = None
+    try:
+        def record(k: str, idx: int, result: Dict[str, Any]) -> None:
+            st = by_key[k]
+            if _is_deferred(result):
+                st.defer(idx)
+                return
+            row = _commit_result(
+                cfg, st.t, store.problems[idx], store.pids[idx], store.prompts[idx], result,
+                st.outpath, st.responses_path, st.stats, writer, st.checkpoint, store.prompt_hashes[idx],
+            )
+            metrics.observe_row(k, row.timing_ms, row.error_class, row.usage)
+            st.record(idx, row)
+            if st.stop_reason:
+                print(f"[adaptive] {st.key}: theta={st.theta:+.2f} se={st.se:.2f} after {len(st.responses)} problems ({st.stop_reason})")
+
+        def depths() -> Dict[str, Dict[str, int]]:
+            out = scheduler.depths() if scheduler is not None else {}
+            for k, st in by_key.items():
+                out.setdefault(k, {"in_flight": 0, "queued": 0, "buffered": 0})["deferred"] = len(st.deferred)
+            return out
+
+        metrics.set_sources(queues=depths, writer=writer.backlog)
+        max_workers, aimd = _in_flight_caps(cfg, key_to_target.values())
+        hedge = _hedge_policy(cfg, key_to_target.values())
+
+        def drive() -> None:
+            nonlocal scheduler
+            # No fixed queues: each target is fed its next problem from the answers so far
+            scheduler = _new_scheduler(cfg, key_to_target, {k: [] for k in by_key}, 1, max_workers, aimd, feed=lambda k: by_key[k].next_item())
+            _run_engine(cfg, scheduler, lambda k, idx: store.prompts[idx], lambda k, idx: store.prefix, None, aimd, hedge, record)
+
+        drive()
+        breaker = get_circuit_breaker()
+        for _ in range(cfg.concurrency.circuit.deferred_rounds):
+            waiting = [st for st in states if st.waiting_on_circuit()]
+            if not waiting:
+                break
+            wait_s = breaker.wait_s(rate_limit_key(u.get("provider"), u.get("model")) for st in waiting for u in _leaf_targets([st.t]))
+            print(f"[circuit] retrying {sum(len(st.deferred) for st in waiting)} deferred calls" + (f" in {wait_s:.0f}s" if wait_s else ""))
+            time.sleep(wait_s)
+            for st in waiting:
+                st.restore()
+            drive()
+        for st in states:
+            if st.waiting_on_circuit():
+                st.stats["deferred_unresolved"] = len(st.deferred)
+                st.stop_reason = "circuit_open"
+                print(f"[circuit] {st.key}: {len(st.deferred)} problems still deferred (circuit open); rerun with the same --run to resume them")
+    finally:
+        writer.close()
+        metrics.set_sources()
+        if metrics_server is not None:
+            metrics_server.close()
+
+    for st in states:
+        st.checkpoint.close()
+        if not st.stats["total"]:
+            print(f"[adaptive] {st.key}: theta={st.theta:+.2f} se={st.se:.2f} after {len(st.responses)} problems ({st.stop_reason}, nothing left to run)")
+        extra: Dict[str, Any] = {"adaptive_testing": st.snapshot()}
+        circuits = [c for c in get_circuit_breaker().snapshot(rate_limit_key(u.get("provider"), u.get("model")) for u in _leaf_targets([st.t])) if c["trips"]]
+        if circuits:
+            extra["circuit"] = circuits
+        try:
+            _write_summary(cfg, st.outpath, st.stats, run_id, extra=extra)
+        except Exception:
+            pass
+    _fill_deferred_visible_tokens(cfg, [(st.t, st.responses_path) for st in states])
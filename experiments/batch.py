@@ -0,0 +1,282 @@
+"""
+Batch-API execution mode for the runner (`runner --mode batch`).
+
+Each target's outstanding prompts are submitted as provider batch jobs
+(OpenAI Batch, Anthropic Message Batches, Gemini batchGenerateContent),
+which are billed at roughly half the interactive price and are not subject
+to the interactive rate limits. Job handles are persisted next to the
+results file in <base>.batch.json, so an interrupted or `wait: false` run
+picks the same jobs up again when re-run with the same --run. Completed
+jobs are folded into the same results / provenance / summary files the
+interactive mode writes; requests a job did not complete (expired,
+cancelled) are resubmitted on the next invocation.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    from .schema import RunConfig
+    from .writer import OutputWriter
+    from .runner import (
+        ProblemStore,
+        _build_outpath,
+        _chat_kwargs,
+        _commit_result,
+        _expand_targets,
+        _fill_deferred_visible_tokens,
+        _is_cascade,
+        _new_stats,
+        _new_writer,
+        _open_checkpoint,
+        _provenance_path,
+        _sample_count,
+        _write_summary,
+        get_problem_store,
+    )
+    from ..utils.provider_router import batch_limits, batch_request, batch_results, cached_chat, poll_batch, store_chat, submit_batch
+except Exception:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from experiments.schema import RunConfig
+    from experiments.writer import OutputWriter
+    from experiments.runner import (
+        ProblemStore,
+        _build_outpath,
+        _chat_kwargs,
+        _commit_result,
+        _expand_targets,
+        _fill_deferred_visible_tokens,
+        _is_cascade,
+        _new_stats,
+        _new_writer,
+        _open_checkpoint,
+        _provenance_path,
+        _sample_count,
+        _write_summary,
+        get_problem_store,
+    )
+    from utils.provider_router import batch_limits, batch_request, batch_results, cached_chat, poll_batch, store_chat, submit_batch
+
+
+def _state_path(outpath: str) -> str:
+    base, ext = os.path.splitext(outpath)
+    return (base + ".batch.json" if ext else outpath + ".batch.json")
+
+
+def _load_state(path: str, t: Dict[str, Any]) -> Dict[str, Any]:
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"provider": t.get("provider"), "model": t.get("model"), "jobs": []}
+
+
+def _save_state(path: str, state: Dict[str, Any]) -> None:
+    # Write-then-rename so a crash never leaves a truncated state file behind
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _chunks(requests: List[Dict[str, Any]], max_requests: int, max_bytes: int) -> List[List[Dict[str, Any]]]:
+    out: List[List[Dict[str, Any]]] = []
+    cur: List[Dict[str, Any]] = []
+    size = 0
+    for r in requests:
+        n = len(json.dumps(r)) + 1
+        if cur and (len(cur) >= max_requests or size + n > max_bytes):
+            out.append(cur)
+            cur, size = [], 0
+        cur.append(r)
+        size += n
+    if cur:
+        out.append(cur)
+    return out
+
+
+class _TargetBatch:
+    def __init__(self, cfg: RunConfig, t: Dict[str, Any], run_id: Optional[str]) -> None:
+        self.t = t
+        self.outpath = _build_outpath(cfg, t, t.get("model"), run_id)
+        self.responses_path = _provenance_path(self.outpath) if cfg.outputs.provenance.enabled else None
+        self.state_path = _state_path(self.outpath)
+        self.state = _load_state(self.state_path, t)
+        self.checkpoint = _open_checkpoint(cfg, self.outpath, self.responses_path)
+        self.done = self.checkpoint.ids
+        self.stats = _new_stats(t)
+
+    def label(self) -> str:
+        return f"{self.t.get('provider')}:{self.t.get('model')}"
+
+    def live_jobs(self) -> List[Dict[str, Any]]:
+        return [j for j in self.state["jobs"] if j["status"] == "running"]
+
+    def in_flight(self) -> set:
+        return {pid for j in self.live_jobs() for pid in j["ids"].values()}
+
+
+def run_batch(
+    cfg: RunConfig,
+    targets: List[Dict[str, Any]],
+    only_providers: Optional[List[str]] = None,
+    model_overrides: Optional[Dict[str, List[str]]] = None,
+    dry_run: bool = False,
+    run_id: Optional[str] = None,
+) -> None:
+    # Collecting across invocations relies on the results file: always skip ids already written
+    cfg = cfg.model_copy(update={"resume": True})
+    store = get_problem_store(cfg)
+    expanded = _expand_targets(targets, only_providers, model_overrides)
+    for t in expanded:
+        if _is_cascade(t):
+            # Escalation depends on the previous stage's answer, which a batch job only returns hours later
+            print(f"[batch] cascade target {t.get('model')} skipped: cascades run in interactive mode only")
+        elif _sample_count(t) > 1:
+            # The vote needs every sample of a prompt; batch results are collected per request
+            print(f"[batch] target {t.get('model')} with samples={_sample_count(t)} skipped: sampled targets run in interactive mode only")
+    batches = [_TargetBatch(cfg, t, run_id) for t in expanded if not _is_cascade(t) and _sample_count(t) == 1]
+    sysprompt = None
+    writer = _new_writer(cfg)
+    try:
+        _submit_and_collect(cfg, batches, store, sysprompt, writer, dry_run)
+    finally:
+        writer.close()
+    if dry_run:
+        return
+
+    # Summaries cover the rows collected by this invocation, as in interactive resume
+    for b in batches:
+        b.checkpoint.close()
+        if b.stats["total"] > 0:
+            try:
+                _write_summary(cfg, b.outpath, b.stats, run_id)
+            except Exception:
+                pass
+    _fill_deferred_visible_tokens(cfg, [(b.t, b.responses_path) for b in batches if b.stats["total"] > 0])
+
+
+def _submit_and_collect(
+    cfg: RunConfig,
+    batches: List[_TargetBatch],
+    store: ProblemStore,
+    sysprompt: Optional[str],
+    writer: OutputWriter,
+    dry_run: bool,
+) -> None:
+    # Submit whatever is neither in the results file nor in a job that is still running
+    for b in batches:
+        t = b.t
+        skip = b.checkpoint.snapshot() | b.in_flight()
+        todo = [idx for idx, pid in enumerate(store.pids) if pid not in skip]
+        max_requests, max_bytes = batch_limits(t.get("provider"))
+        if cfg.batch.max_requests_per_job:
+            max_requests = min(max_requests, cfg.batch.max_requests_per_job)
+        requests: List[Dict[str, Any]] = []
+        ids: Dict[str, Any] = {}
+        for n, idx in enumerate(todo):
+            # Same request parameters as the interactive call would use
+            kwargs = _chat_kwargs(cfg, t, store.prompts[idx], sysprompt, store.prefix)
+            hit = cached_chat(**kwargs)
+            if hit is not None:
+                if not dry_run:
+                    result = {"text": hit.get("text") or "", "dur_ms": None, "err": None, "meta": {k: v for k, v in hit.items() if k != "text"}}
+                    _commit_result(cfg, t, store.problems[idx], store.pids[idx], store.prompts[idx], result, b.outpath, b.responses_path, b.stats, writer, b.checkpoint, store.prompt_hashes[idx])
+                continue
+            custom_id = f"req-{n}"
+            ids[custom_id] = store.pids[idx]
+            requests.append(batch_request(custom_id=custom_id, **kwargs))
+        chunks = _chunks(requests, max_requests, max_bytes)
+        if dry_run:
+            print(f"[batch] {b.label()}: would submit {len(requests)} requests in {len(chunks)} job(s) ({len(todo) - len(requests)} cached); {len(b.live_jobs())} job(s) running")
+            continue
+        for chunk in chunks:
+            try:
+                handle = submit_batch(t.get("provider"), t.get("model"), chunk)
+            except Exception as e:
+                print(f"[batch] {b.label()}: submit failed: {e}")
+                break
+            b.state["jobs"].append({
+                "handle": handle,
+                "status": "running",
+                "provider_status": None,
+                "submitted_at": int(time.time()),
+                "ids": {_custom_id(r): ids[_custom_id(r)] for r in chunk},
+            })
+            _save_state(b.state_path, b.state)
+            print(f"[batch] {b.label()}: submitted {len(chunk)} requests as {handle}")
+
+    if dry_run:
+        return
+
+    # Poll until every job has ended (or once, without waiting)
+    while True:
+        running = 0
+        for b in batches:
+            for job in b.live_jobs():
+                try:
+                    info = poll_batch(b.t.get("provider"), job["handle"])
+                except Exception as e:
+                    # Transient: keep the job and ask again on the next round
+                    print(f"[batch] {b.label()}: polling {job['handle']} failed: {e}")
+                    running += 1
+                    continue
+                job["provider_status"] = info.get("status")
+                job["counts"] = info.get("counts")
+                if info["state"] != "ended":
+                    running += 1
+                    continue
+                _collect(cfg, b, job, info, store, writer)
+            _save_state(b.state_path, b.state)
+        if running == 0 or not cfg.batch.wait:
+            if running:
+                print(f"[batch] {running} job(s) still running; re-run with the same --run to collect them")
+            break
+        time.sleep(max(1.0, float(cfg.batch.poll_seconds)))
+
+
+def _custom_id(request: Dict[str, Any]) -> str:
+    # OpenAI and Anthropic carry custom_id at the top level; Gemini in metadata.key
+    return request.get("custom_id") or (request.get("metadata") or {}).get("key")
+
+
+def _collect(
+    cfg: RunConfig,
+    b: _TargetBatch,
+    job: Dict[str, Any],
+    info: Dict[str, Any],
+    store: ProblemStore,
+    writer: OutputWriter,
+) -> None:
+    t = b.t
+    got: Dict[int, Dict[str, Any]] = {}
+    try:
+        for custom_id, res, err in batch_results(t.get("provider"), t.get("model"), info):
+            pid = job["ids"].get(custom_id)
+            if pid is None or pid not in store.index or pid in b.done:
+                continue
+            if res is not None:
+                store_chat(res, **_chat_kwargs(cfg, t, store.prompts[store.index[pid]], None, store.prefix))
+            meta = {k: v for k, v in (res or {}).items() if k != "text"}
+            got[store.index[pid]] = {
+                "text": (res or {}).get("text", ""),
+                "dur_ms": None,
+                "err": err,
+                "meta": meta,
+                "batch_id": job["handle"],
+            }
+    except Exception as e:
+        print(f"[batch] {b.label()}: reading results of {job['handle']} failed: {e}")
+        return
+    # Fold into the results in problem order, exactly like interactive rows
+    for idx in sorted(got):
+        _commit_result(cfg, t, store.problems[idx], store.pids[idx], store.prompts[idx], got[idx], b.outpath, b.responses_path, b.stats, writer, b.checkpoint, store.prompt_hashes[idx])
+    missing = len(job["ids"]) - len(got)
+    job["status"] = "collected" if got else "failed"
+    job["collected_at"] = int(time.time())
+    print(
+        f"[batch] {b.label()}: {job['handle']} {info.get('status')}: collected {len(got)} results"
+        + (f", {missing} to resubmit" if missing else "")
+    )
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark the threads and asyncio call engines against the local mock API.
+
+Fires --requests calls with --concurrency in flight through run_chat (thread
+pool) and arun_chat (single event loop) and reports wall time, throughput,
+latency percentiles and peak OS thread count for each engine.
+
+Usage:
+    python -m experiments.bench_engine --requests 2000 --concurrency 1000 --latency-ms 2000
+    python -m experiments.bench_engine --base-url http://127.0.0.1:8765 --provider anthropic
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+try:
+    from .mock_server import MockOptions, serve_in_thread
+    from ..utils.provider_router import run_chat, arun_chat
+    from ..utils.transport import aclose_async_client
+except Exception:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from experiments.mock_server import MockOptions, serve_in_thread
+    from utils.provider_router import run_chat, arun_chat
+    from utils.transport import aclose_async_client
+
+
+DEFAULT_MODELS = {
+    "anthropic": "claude-haiku-4-5-20251001",
+    "google": "gemini-2.5-flash-lite",
+    "openai": "gpt-5-nano-2025-08-07",
+}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+class _ThreadPeak:
+    def __init__(self) -> None:
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(0.01)
+
+    def __enter__(self) -> "_ThreadPeak":
+        self._t.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._t.join()
+
+
+def bench_threads(call_kwargs: Dict[str, Any], n: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+
+    def one(_: int) -> None:
+        nonlocal errors
+        start = time.time()
+        try:
+            run_chat(**call_kwargs)
+            latencies.append(time.time() - start)
+        except Exception:
+            errors += 1
+
+    with _ThreadPeak() as tp:
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            list(ex.map(one, range(n)))
+        wall = time.time() - start
+    return {"wall_s": wall, "latencies": latencies, "errors": errors, "peak_threads": tp.peak}
+
+
+def bench_asyncio(call_kwargs: Dict[str, Any], n: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+
+    async def main() -> None:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one() -> None:
+            nonlocal errors
+            async with sem:
+                start = time.time()
+                try:
+                    await arun_chat(**call_kwargs)
+                    latencies.append(time.time() - start)
+                except Exception:
+                    errors += 1
+
+        try:
+            await asyncio.gather(*(one() for _ in range(n)))
+        finally:
+            await aclose_async_client()
+
+    with _ThreadPeak() as tp:
+        start = time.time()
+        asyncio.run(main())
+        wall = time.time() - start
+    return {"wall_s": wall, "latencies": latencies, "errors": errors, "peak_threads": tp.peak}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark threads vs asyncio engines against a local mock API")
+    ap.add_argument("--provider", default="openai", choices=sorted(DEFAULT_MODELS))
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--engine", default="both", choices=["threads", "asyncio", "both"])
+    ap.add_argument("--latency-ms", type=float, default=1000.0, help="Mock latency (ignored with --base-url)")
+    ap.add_argument("--jitter-ms", type=float, default=100.0, help="Mock jitter (ignored with --base-url)")
+    ap.add_argument("--base-url", default=None, help="Use an already running mock server instead of an in-process one")
+    args = ap.parse_args()
+
+    base_url = args.base_url
+    if not base_url:
+        base_url, _, _ = serve_in_thread(MockOptions(args.latency_ms, args.jitter_ms))
+    for var in ("OPENAI_BASE_URL", "GEMINI_BASE_URL", "ANTHROPIC_BASE_URL"):
+        os.environ[var] = base_url
+    for var in ("OPENAI_API_KEY", "GEMINI_API_KEY", "ANTHROPIC_API_KEY"):
+        os.environ.setdefault(var, "mock-key")
+
+    call_kwargs = {
+        "provider": args.provider,
+        "model": args.model or DEFAULT_MODELS[args.provider],
+        "prompt": "Statements:\np1.\nif p1 then p0.",
+        "max_tokens": 100,
+        "temperature": 0.0,
+    }
+    engines: Dict[str, Callable[..., Dict[str, Any]]] = {"threads": bench_threads, "asyncio": bench_asyncio}
+    selected = ["threads", "asyncio"] if args.engine == "both" else [args.engine]
+
+    print(f"{args.requests} requests to {args.provider} via {base_url}, concurrency {args.concurrency}")
+    print("engine\twall_s\treq/s\tp50_ms\tp99_ms\terrors\tpeak_threads")
+    for name in selected:
+        r = engines[name](call_kwargs, args.requests, args.concurrency)
+        lat = r["latencies"]
+        print(
+            f"{name}\t{r['wall_s']:.2f}\t{args.requests / r['wall_s']:.1f}\t"
+            f"{_percentile(lat, 0.5) * 1000:.0f}\t{_percentile(lat, 0.99) * 1000:.0f}\t"
+            f"{r['errors']}\t{r['peak_threads']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
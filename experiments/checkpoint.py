@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Iterable, List, Tuple
+
+
+CHECKPOINT_VERSION = 1
+
+
+def checkpoint_path(results_path: str) -> str:
+    base, ext = os.path.splitext(results_path)
+    return (base + ".ckpt.json" if ext else results_path + ".ckpt.json")
+
+
+def _int_ranges(ids: Iterable[Any]) -> Tuple[List[List[int]], List[Any]]:
+    """Integer ids as sorted [lo, hi] runs; anything else returned as-is."""
+    ints = sorted(i for i in ids if isinstance(i, int) and not isinstance(i, bool))
+    others = [i for i in ids if not (isinstance(i, int) and not isinstance(i, bool))]
+    ranges: List[List[int]] = []
+    for i in ints:
+        if ranges and i == ranges[-1][1] + 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges, others
+
+
+def truncate_torn_tail(path: str) -> int:
+    """Cut a partially written final line off a JSONL file; returns the bytes removed."""
+    if not os.path.exists(path):
+        return 0
+    size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, "rb+") as f:
+        pos = size
+        # Walk back to the last newline in 64KB steps
+        while pos > 0:
+            step = min(65536, pos)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            nl = chunk.rfind(b"\n")
+            if nl >= 0:
+                keep = pos - step + nl + 1
+                break
+            pos -= step
+        else:
+            keep = 0
+        if keep < size:
+            f.truncate(keep)
+        return size - keep
+
+
+class ResultsCheckpoint:
+    """Ids already present in a results JSONL file, kept in a small sidecar.
+
+    The sidecar (<base>.ckpt.json) stores the ids (integer ids as sorted
+    ranges) and the byte offset of the results file they cover. Opening only
+    reads rows past that offset — those written after the last checkpoint
+    save — so resume cost does not grow with the results file. A torn final
+    line (crash mid-write) is truncated before anything is appended. A
+    missing or inconsistent sidecar falls back to one full scan.
+
+    The sidecar is replaced atomically (write + rename) at most every
+    ``flush_interval_s`` seconds and on close(); rows landing in between are
+    recovered by the tail scan. add() may be called from the output writer
+    thread while the dispatcher checks membership.
+    """
+
+    def __init__(self, results_path: str, flush_interval_s: float = 1.0) -> None:
+        self.results_path = results_path
+        self.path = checkpoint_path(results_path)
+        self.flush_interval_s = flush_interval_s
+        self.ids: set = set()
+        self.offset = 0
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._load()
+
+    def __contains__(self, pid: Any) -> bool:
+        return pid in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def snapshot(self) -> set:
+        with self._lock:
+            return set(self.ids)
+
+    def _read_sidecar(self, size: int) -> bool:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except Exception:
+            return False
+        offset = data.get("offset")
+        if data.get("version") != CHECKPOINT_VERSION or not isinstance(offset, int) or offset > size:
+            return False
+        if offset > 0:
+            # The covered prefix must still end on a row boundary (file not rewritten underneath us)
+            with open(self.results_path, "rb") as f:
+                f.seek(offset - 1)
+                if f.read(1) != b"\n":
+                    return False
+        for lo, hi in data.get("ranges") or []:
+            self.ids.update(range(lo, hi + 1))
+        self.ids.update(data.get("ids") or [])
+        self.offset = offset
+        return True
+
+    def _load(self) -> None:
+        if not os.path.exists(self.results_path):
+            if os.path.exists(self.path):
+                # Results were removed; the old index no longer describes anything
+                os.remove(self.path)
+            return
+        if truncate_torn_tail(self.results_path):
+            self._dirty = True
+        size = os.path.getsize(self.results_path)
+        if not self._read_sidecar(size):
+            self.ids = set()
+            self.offset = 0
+        if self.offset < size:
+            with open(self.results_path, "rb") as f:
+                f.seek(self.offset)
+                for line in f:
+                    try:
+                        self.ids.add(json.loads(line).get("id"))
+                    except Exception:
+                        continue
+            self.offset = size
+            self._dirty = True
+        if self._dirty:
+            self.flush()
+
+    def add(self, pid: Any, offset: int) -> None:
+        """Record a row for pid whose write ended at byte offset of the results file."""
+        with self._lock:
+            self.ids.add(pid)
+            self.offset = max(self.offset, offset)
+            self._dirty = True
+            if time.monotonic() - self._last_flush >= self.flush_interval_s:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._dirty:
+            return
+        ranges, others = _int_ranges(self.ids)
+        data = {"version": CHECKPOINT_VERSION, "offset": self.offset, "count": len(self.ids), "ranges": ranges, "ids": others}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+
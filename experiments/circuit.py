@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+
+class _Circuit:
+    def __init__(self) -> None:
+        self.state = "closed"  # closed | open | half_open
+        self.failures = 0
+        self.open_s = 0.0
+        self.reopen_at = 0.0
+        self.probing = False
+        self.trips = 0
+        self.last_class: Optional[str] = None
+
+
+class CircuitBreaker:
+    """Per provider:model circuit breaker that turns outages into deferred work.
+
+    ``failures`` consecutive failed attempts with an error class in
+    ``trip_on`` open a circuit. While it is open, ``allow()`` says no and the
+    runner defers the problem to the end of the run without calling the API.
+    After ``open_s`` the circuit goes half-open and lets one probe call
+    through. A probe that succeeds (or fails for a reason outside
+    ``trip_on``) closes it. A probe that fails again reopens it, and each
+    reopening doubles the wait up to ``max_open_s``. Any other outcome resets
+    the failure count.
+
+    Thread-safe: workers report from their own threads or the event loop.
+    Disabled (the default until configure() is called), it allows every call.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._circuits: Dict[str, _Circuit] = {}
+        self.enabled = False
+        self.failures = 5
+        self.trip_on: Sequence[str] = ()
+        self.open_s = 60.0
+        self.max_open_s = 600.0
+
+    def configure(self, enabled: bool, failures: int = 5, trip_on: Iterable[str] = (), open_s: float = 60.0, max_open_s: float = 600.0) -> None:
+        """Set the policy and close every circuit (one run per configuration)."""
+        with self._lock:
+            self.enabled = bool(enabled)
+            self.failures = max(1, int(failures))
+            self.trip_on = tuple(trip_on)
+            self.open_s = max(0.0, float(open_s))
+            self.max_open_s = max(self.open_s, float(max_open_s))
+            self._circuits = {}
+
+    def _circuit(self, key: str) -> _Circuit:
+        c = self._circuits.get(key)
+        if c is None:
+            c = _Circuit()
+            self._circuits[key] = c
+        return c
+
+    def allow(self, key: str) -> bool:
+        """Whether a call to key may go out now; in half-open state only the single probe may."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            c = self._circuit(key)
+            if c.state == "closed":
+                return True
+            if c.state == "open" and time.monotonic() >= c.reopen_at:
+                c.state = "half_open"
+                c.probing = False
+            if c.state == "half_open" and not c.probing:
+                c.probing = True
+                print(f"[circuit] {key}: half-open, sending a probe")
+                return True
+            return False
+
+    def record_success(self, key: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            c = self._circuit(key)
+            c.failures = 0
+            if c.state != "closed":
+                print(f"[circuit] {key}: closed, calls resume")
+            c.state = "closed"
+            c.probing = False
+            c.open_s = 0.0
+
+    def record_failure(self, key: str, error_class: Optional[str]) -> bool:
+        """Count a failed attempt; True when the circuit is open after it (stop retrying, defer)."""
+        if not self.enabled:
+            return False
+        if error_class not in self.trip_on:
+            # The provider answered: whatever was wrong is not an outage
+            self.record_success(key)
+            return False
+        with self._lock:
+            c = self._circuit(key)
+            c.failures += 1
+            c.last_class = error_class
+            if c.state == "half_open" or (c.state == "closed" and c.failures >= self.failures):
+                why = "probe failed" if c.state == "half_open" else f"{c.failures} failures in a row"
+                c.open_s = min(self.max_open_s, c.open_s * 2) if c.open_s else self.open_s
+                c.reopen_at = time.monotonic() + c.open_s
+                c.state = "open"
+                c.probing = False
+                c.trips += 1
+                print(f"[circuit] {key}: open for {c.open_s:g}s ({why}, {error_class}); deferring its calls")
+            return c.state != "closed"
+
+    def wait_s(self, keys: Iterable[str]) -> float:
+        """Seconds until every open circuit among keys may be probed (0 when none is open)."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            waits = [c.reopen_at - now for k in keys for c in [self._circuits.get(k)] if c is not None and c.state == "open"]
+        return max([0.0] + waits)
+
+    def snapshot(self, keys: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            names = sorted(self._circuits) if keys is None else [k for k in keys if k in self._circuits]
+            return [
+                {"key": k, "state": self._circuits[k].state, "trips": self._circuits[k].trips, "last_error_class": self._circuits[k].last_class}
+                for k in names
+            ]
+
+
+_BREAKER = CircuitBreaker()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Return the process-wide breaker shared by all targets and engines."""
+    return _BREAKER
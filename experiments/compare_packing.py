@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Accuracy impact of multi-problem packing (prompt.pack_size).
+
+Pairs a packed run with an unpacked baseline of the same experiment, target
+by target and problem by problem (by id), and reports per target:
+
+- accuracy of both runs over the shared problems, with Wilson intervals;
+- the difference and McNemar's exact test on the discordant pairs
+  (b = right unpacked / wrong packed, c = wrong unpacked / right packed);
+- the unclear-rate difference (a packed answer line that went missing
+  parses as unclear);
+- packed accuracy by position within the request, which shows whether
+  later problems in a pack suffer;
+- requests and input tokens per problem for both runs, from provenance.
+
+Usage:
+    python -m experiments.compare_packing --name horn_yn_mixed --baseline 20251020 --packed 20251021_pack4
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .sampling import wilson
+except Exception:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from experiments.sampling import wilson
+
+
+def _read_jsonl(path: Path) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    if not path.exists():
+        return rows
+    with path.open("r") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except Exception:
+                continue
+    return rows
+
+
+def _results_files(run_dir: Path) -> Dict[str, Path]:
+    """{target path relative to the run directory: results file}; shard and provenance files excluded."""
+    out: Dict[str, Path] = {}
+    for path in run_dir.rglob("results.jsonl"):
+        out[str(path.parent.relative_to(run_dir))] = path
+    return out
+
+
+def _correct(row: Dict[str, Any]) -> Optional[bool]:
+    satflag = (row.get("meta") or {}).get("satflag")
+    if satflag is None or "parsed_answer" not in row:
+        return None
+    return row["parsed_answer"] == satflag
+
+
+def _cost(results: Path) -> Tuple[Optional[float], Optional[float]]:
+    """(requests per problem, input tokens per problem) from the provenance file next to a results file."""
+    rows = _read_jsonl(results.with_name(results.stem + ".provenance.jsonl"))
+    if not rows:
+        return None, None
+    # Packed rows carry usage on the first problem of each request only
+    requests = sum(1 for r in rows if (r.get("pack") or {}).get("position", 0) == 0)
+    tokens = [((r.get("usage") or {}).get("input_tokens")) for r in rows]
+    tokens = [t for t in tokens if isinstance(t, (int, float))]
+    return requests / len(rows), (sum(tokens) / len(rows)) if tokens else None
+
+
+def mcnemar_p(b: int, c: int) -> float:
+    """Two-sided exact McNemar p-value for b and c discordant pairs."""
+    n = b + c
+    if n == 0:
+        return 1.0
+    k = min(b, c)
+    tail = sum(math.comb(n, i) for i in range(k + 1)) / (2 ** n)
+    return min(1.0, 2 * tail)
+
+
+def compare(baseline: Path, packed: Path) -> Dict[str, Any]:
+    base_rows = {r.get("id"): r for r in _read_jsonl(baseline)}
+    pack_rows = {r.get("id"): r for r in _read_jsonl(packed)}
+    n = b = c = base_correct = pack_correct = base_unclear = pack_unclear = 0
+    positions: Dict[int, List[int]] = {}
+    for pid, prow in pack_rows.items():
+        brow = base_rows.get(pid)
+        if brow is None:
+            continue
+        bc, pc = _correct(brow), _correct(prow)
+        if bc is None or pc is None:
+            continue
+        n += 1
+        base_correct += int(bc)
+        pack_correct += int(pc)
+        base_unclear += int(brow.get("parsed_answer") == 2)
+        pack_unclear += int(prow.get("parsed_answer") == 2)
+        b += int(bc and not pc)
+        c += int(pc and not bc)
+        pos = prow.get("pack_position")
+        if pos is not None:
+            counts = positions.setdefault(int(pos), [0, 0])
+            counts[0] += 1
+            counts[1] += int(pc)
+    base_requests, base_tokens = _cost(baseline)
+    pack_requests, pack_tokens = _cost(packed)
+    return {
+        "n": n,
+        "baseline_accuracy": (base_correct / n) if n else None,
+        "baseline_ci": wilson(base_correct, n),
+        "packed_accuracy": (pack_correct / n) if n else None,
+        "packed_ci": wilson(pack_correct, n),
+        "delta": ((pack_correct - base_correct) / n) if n else None,
+        "b": b,
+        "c": c,
+        "p_value": mcnemar_p(b, c),
+        "unclear_delta": ((pack_unclear - base_unclear) / n) if n else None,
+        "by_position": {pos: (cnt[1] / cnt[0]) for pos, cnt in sorted(positions.items())},
+        "baseline_requests_per_problem": base_requests,
+        "packed_requests_per_problem": pack_requests,
+        "baseline_input_tokens_per_problem": base_tokens,
+        "packed_input_tokens_per_problem": pack_tokens,
+    }
+
+
+def _fmt(x: Optional[float], spec: str = ".3f") -> str:
+    return format(x, spec) if isinstance(x, (int, float)) else "-"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare a packed run (prompt.pack_size > 1) with an unpacked baseline")
+    ap.add_argument("--name", required=True, help="Experiment name (e.g., horn_yn_mixed)")
+    ap.add_argument("--baseline", required=True, help="Run id of the unpacked run")
+    ap.add_argument("--packed", required=True, help="Run id of the packed run")
+    ap.add_argument("--root", default="experiments/runs", help="Root runs directory")
+    ap.add_argument("--json", action="store_true", help="Print one JSON object per target instead of a table")
+    args = ap.parse_args()
+
+    base_dir = Path(args.root) / args.name / args.baseline
+    pack_dir = Path(args.root) / args.name / args.packed
+    base_files = _results_files(base_dir)
+    pack_files = _results_files(pack_dir)
+    shared = sorted(set(base_files) & set(pack_files))
+    if not shared:
+        print(f"No targets in both {base_dir} and {pack_dir}")
+        sys.exit(1)
+
+    if not args.json:
+        print("\t".join(["target", "n", "acc@baseline", "acc@packed", "delta", "b/c", "p", "unclear_delta", "acc_by_position", "req/problem", "in_tok/problem"]))
+    for target in shared:
+        r = compare(base_files[target], pack_files[target])
+        if args.json:
+            print(json.dumps({"target": target, **r}))
+            continue
+        blo, bhi = r["baseline_ci"]
+        plo, phi = r["packed_ci"]
+        print("\t".join([
+            target,
+            str(r["n"]),
+            f"{_fmt(r['baseline_accuracy'])} [{_fmt(blo)}, {_fmt(bhi)}]",
+            f"{_fmt(r['packed_accuracy'])} [{_fmt(plo)}, {_fmt(phi)}]",
+            _fmt(r["delta"], "+.3f"),
+            f"{r['b']}/{r['c']}",
+            _fmt(r["p_value"], ".3g"),
+            _fmt(r["unclear_delta"], "+.3f"),
+            " ".join(f"{pos}:{acc:.2f}" for pos, acc in r["by_position"].items()) or "-",
+            f"{_fmt(r['baseline_requests_per_problem'], '.2f')} -> {_fmt(r['packed_requests_per_problem'], '.2f')}",
+            f"{_fmt(r['baseline_input_tokens_per_problem'], '.0f')} -> {_fmt(r['packed_input_tokens_per_problem'], '.0f')}",
+        ]))
+
+
+if __name__ == "__main__":
+    main()
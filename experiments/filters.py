@@ -1,3 +1,4 @@
+import hashlib
 from typing import Any, Dict, Iterable, Iterator, List
 
 
@@ -30,3 +31,16 @@ def limit(rows: Iterable[List[Any]], n: int) -> Iterator[List[Any]]:
         count += 1
 
 
+
+
+def shard_of(pid: Any, count: int) -> int:
+    # sha256 of the id's text, not hash(): the same on every machine and Python process
+    return int.from_bytes(hashlib.sha256(str(pid).encode()).digest()[:8], "big") % count
+
+
+def shard(rows: Iterable[List[Any]], index: int, count: int) -> Iterator[List[Any]]:
+    for pos, r in enumerate(rows, start=1):
+        # Problems without an id fall back to their position, like the runner's ids
+        pid = r[0] if isinstance(r, list) and len(r) > 0 else pos
+        if shard_of(pid, count) == index:
+            yield r
@@ -0,0 +1,123 @@
+import glob
+import json
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional
+
+try:
+    from ..utils.hedge import Hedge
+except Exception:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.hedge import Hedge
+
+
+# How much of each provenance file's tail is read for latency history
+_HISTORY_TAIL_BYTES = 8 * 1024 * 1024
+
+
+class HedgePolicy:
+    """Per-target hedging delays from observed latencies, within one extra-call budget.
+
+    A call key's delay is the ``percentile`` of its latest ``max_samples``
+    successful call latencies (seeded from earlier runs, then updated live);
+    keys with fewer than ``min_samples`` are never hedged. Duplicates are
+    granted while they stay below ``budget`` times the number of calls made,
+    so the extra spend is bounded however slow a provider gets. Thread-safe.
+    """
+
+    def __init__(self, percentile: float = 95.0, min_samples: int = 20, budget: float = 0.05, min_delay_s: float = 0.0, max_samples: int = 2000) -> None:
+        self.percentile = min(100.0, max(0.0, float(percentile)))
+        self.min_samples = max(1, int(min_samples))
+        self.budget = max(0.0, float(budget))
+        self.min_delay_s = max(0.0, float(min_delay_s))
+        self.max_samples = max(1, int(max_samples))
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[int]] = {}
+        # Percentile per key, recomputed every few observations rather than on every call
+        self._delays: Dict[str, Optional[float]] = {}
+        self._stale: Dict[str, int] = {}
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def seed(self, key: str, samples_ms: Iterable[int]) -> None:
+        with self._lock:
+            q = self._samples.setdefault(key, deque(maxlen=self.max_samples))
+            q.extend(int(ms) for ms in samples_ms)
+            self._delays.pop(key, None)
+
+    def observe(self, key: str, ms: int) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.max_samples)).append(int(ms))
+            self._stale[key] = self._stale.get(key, 0) + 1
+            if self._stale[key] >= 16:
+                self._delays.pop(key, None)
+
+    def delay_s(self, key: str) -> Optional[float]:
+        with self._lock:
+            return self._delay(key)
+
+    def _delay(self, key: str) -> Optional[float]:
+        if key not in self._delays:
+            q = self._samples.get(key) or ()
+            if len(q) < self.min_samples:
+                self._delays[key] = None
+            else:
+                ordered = sorted(q)
+                rank = min(len(ordered) - 1, int(round(self.percentile / 100.0 * (len(ordered) - 1))))
+                self._delays[key] = max(self.min_delay_s, ordered[rank] / 1000.0)
+            self._stale[key] = 0
+        return self._delays[key]
+
+    def ticket(self, key: str) -> Optional[Hedge]:
+        """Hedge for one call of key, or None while its latency history is too short."""
+        with self._lock:
+            self.calls += 1
+            delay = self._delay(key)
+        if delay is None:
+            return None
+        return Hedge(delay, self._allow)
+
+    def _allow(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def record(self, winner: Optional[str]) -> None:
+        if winner == "hedge":
+            with self._lock:
+                self.hedge_wins += 1
+
+
+def read_latency_history(paths: Iterable[str], limit: int) -> List[int]:
+    """timing_ms of successful, non-cached calls from provenance files, newest files first, at most limit."""
+    out: List[int] = []
+    files = sorted((p for p in paths if os.path.exists(p)), key=os.path.getmtime, reverse=True)
+    for path in files:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            if size > _HISTORY_TAIL_BYTES:
+                f.seek(size - _HISTORY_TAIL_BYTES)
+                f.readline()  # skip the partial first line
+            lines = f.read().splitlines()
+        for line in reversed(lines):
+            try:
+                row = json.loads(line)
+            except Exception:
+                continue
+            ms = row.get("timing_ms")
+            if isinstance(ms, int) and not row.get("error") and not row.get("cached") and not row.get("batch_id"):
+                out.append(ms)
+                if len(out) >= limit:
+                    return out
+    return out
+
+
+def history_paths(pattern: str) -> List[str]:
+    """Provenance files of every run matching a results path pattern (``*`` in place of the run id)."""
+    base, ext = os.path.splitext(pattern)
+    return glob.glob(base + ".provenance.jsonl" if ext else pattern + ".provenance.jsonl")
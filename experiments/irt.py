@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Item response theory (Rasch model) over past runs, for adaptive testing.
+
+P(target answers problem correctly) = 1 / (1 + exp(-(theta - b))), with
+theta the target's ability and b the problem's difficulty. `calibrate`
+fits b for every problem (and theta for every results file seen) from all
+results files under the given run directories, by joint MAP estimation
+with normal priors so problems everyone solved (or nobody did) stay finite.
+The difficulty file it writes feeds `runner --mode adaptive`, which picks
+each target's next problem where it is most informative (b closest to the
+current theta) and stops once theta's standard error is small enough.
+
+Problems are keyed by id and (maxvars, maxlen, horn, satflag), so runs over
+different datasets do not mix. Difficulty depends on the prompt format as
+well: restrict calibration to comparable experiments with --experiments.
+
+Usage:
+    python -m experiments.irt calibrate experiments/runs --experiments 'horn_yn_*' --out experiments/irt/horn_yn.json
+    python -m experiments.irt show experiments/irt/horn_yn.json
+"""
+
+import argparse
+import bisect
+import fnmatch
+import json
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from .writer import write_json_atomic
+except Exception:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from experiments.writer import write_json_atomic
+
+
+def item_key(pid: Any, maxvars: Any, maxlen: Any, horn: Any, satflag: Any) -> str:
+    return f"{pid}:{maxvars}:{maxlen}:{horn}:{satflag}"
+
+
+def problem_item_key(problem: List[Any]) -> str:
+    return item_key(*(problem[i] if len(problem) > i else None for i in range(5)))
+
+
+def _sigmoid(x: float) -> float:
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    e = math.exp(x)
+    return e / (1.0 + e)
+
+
+def estimate_ability(responses: Sequence[Tuple[float, int]], prior_sd: float = 1.0, theta: float = 0.0) -> Tuple[float, float]:
+    """MAP ability and its standard error from (difficulty, correct) pairs under a N(0, prior_sd) prior."""
+    prior_prec = 1.0 / (prior_sd * prior_sd)
+    info = prior_prec
+    for _ in range(50):
+        grad = -theta * prior_prec
+        info = prior_prec
+        for b, y in responses:
+            p = _sigmoid(theta - b)
+            grad += y - p
+            info += p * (1.0 - p)
+        step = grad / info
+        theta += max(-1.0, min(1.0, step))
+        if abs(step) < 1e-6:
+            break
+    return theta, 1.0 / math.sqrt(info)
+
+
+def expected_accuracy(theta: float, difficulties: Iterable[float]) -> Optional[float]:
+    """Mean probability of a correct answer over the given problems at ability theta."""
+    bs = list(difficulties)
+    return (sum(_sigmoid(theta - d) for d in bs) / len(bs)) if bs else None
+
+
+def _read_responses(path: str) -> Dict[str, Dict[str, int]]:
+    """{respondent: {item key: correct}} from one results file; errors and rows without ground truth are skipped."""
+    out: Dict[str, Dict[str, int]] = {}
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except Exception:
+                continue
+            if row.get("error"):
+                continue
+            meta = row.get("meta") or {}
+            correct = row.get("correct")
+            if not isinstance(correct, bool):
+                if meta.get("satflag") is None or "parsed_answer" not in row:
+                    continue
+                correct = row["parsed_answer"] == meta["satflag"]
+            who = path if not row.get("model") else f"{path}#{row.get('provider')}:{row.get('model')}"
+            key = item_key(row.get("id"), meta.get("maxvars"), meta.get("maxlen"), meta.get("horn"), meta.get("satflag"))
+            out.setdefault(who, {})[key] = int(correct)
+    return out
+
+
+def find_results(roots: Iterable[str], experiments: Optional[List[str]] = None) -> List[str]:
+    """Canonical results files under roots (shard and provenance files excluded), optionally by experiment name."""
+    paths: List[str] = []
+    for root in roots:
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                if not name.endswith("results.jsonl"):
+                    continue
+                path = os.path.join(dirpath, name)
+                if experiments:
+                    rel = os.path.relpath(path, root).split(os.sep)
+                    if not any(fnmatch.fnmatch(rel[0], pat) for pat in experiments):
+                        continue
+                paths.append(path)
+    return sorted(paths)
+
+
+def calibrate(
+    paths: Iterable[str],
+    min_responses: int = 2,
+    min_items: int = 20,
+    item_sd: float = 2.0,
+    ability_sd: float = 1.0,
+    max_iter: int = 200,
+    tol: float = 1e-4,
+) -> Dict[str, Any]:
+    """Fit Rasch difficulties from results files; returns the difficulty file contents."""
+    by_respondent: Dict[str, Dict[str, int]] = {}
+    for path in paths:
+        for who, answers in _read_responses(path).items():
+            by_respondent.setdefault(who, {}).update(answers)
+    by_respondent = {w: a for w, a in by_respondent.items() if len(a) >= min_items}
+    counts: Dict[str, int] = {}
+    for answers in by_respondent.values():
+        for key in answers:
+            counts[key] = counts.get(key, 0) + 1
+    items = sorted(k for k, n in counts.items() if n >= min_responses)
+    item_idx = {k: i for i, k in enumerate(items)}
+    people = sorted(by_respondent)
+    # Responses grouped both ways: per person (item, y) and per item (person, y)
+    per_person: List[List[Tuple[int, int]]] = []
+    per_item: List[List[Tuple[int, int]]] = [[] for _ in items]
+    for pi, who in enumerate(people):
+        row = [(item_idx[k], y) for k, y in by_respondent[who].items() if k in item_idx]
+        per_person.append(row)
+        for ii, y in row:
+            per_item[ii].append((pi, y))
+
+    theta = [0.0] * len(people)
+    b = [0.0] * len(items)
+    theta_prec = 1.0 / (ability_sd * ability_sd)
+    b_prec = 1.0 / (item_sd * item_sd)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        change = 0.0
+        # Alternating Newton steps: abilities given difficulties, then difficulties given abilities
+        for pi, row in enumerate(per_person):
+            grad, info = -theta[pi] * theta_prec, theta_prec
+            for ii, y in row:
+                p = _sigmoid(theta[pi] - b[ii])
+                grad += y - p
+                info += p * (1.0 - p)
+            step = max(-1.0, min(1.0, grad / info))
+            theta[pi] += step
+            change = max(change, abs(step))
+        for ii, col in enumerate(per_item):
+            grad, info = -b[ii] * b_prec, b_prec
+            for pi, y in col:
+                p = _sigmoid(theta[pi] - b[ii])
+                grad += p - y
+                info += p * (1.0 - p)
+            step = max(-1.0, min(1.0, grad / info))
+            b[ii] += step
+            change = max(change, abs(step))
+        if change < tol:
+            break
+
+    out_items: Dict[str, Dict[str, Any]] = {}
+    for ii, key in enumerate(items):
+        info = b_prec + sum(_sigmoid(theta[pi] - b[ii]) * (1.0 - _sigmoid(theta[pi] - b[ii])) for pi, _ in per_item[ii])
+        col = per_item[ii]
+        out_items[key] = {
+            "b": round(b[ii], 4),
+            "se": round(1.0 / math.sqrt(info), 4),
+            "n": len(col),
+            "p_correct": round(sum(y for _, y in col) / len(col), 4),
+        }
+    return {
+        "model": "rasch",
+        "created": int(time.time()),
+        "iterations": iterations,
+        "priors": {"ability_sd": ability_sd, "item_sd": item_sd},
+        "respondents": {who: {"theta": round(theta[pi], 4), "n": len(per_person[pi])} for pi, who in enumerate(people)},
+        "items": out_items,
+    }
+
+
+class DifficultyIndex:
+    """Calibrated difficulties loaded once; lookups by problem row."""
+
+    def __init__(self, items: Dict[str, Dict[str, Any]]) -> None:
+        self._b: Dict[str, float] = {k: float(v["b"]) for k, v in items.items() if isinstance(v, dict) and v.get("b") is not None}
+
+    @classmethod
+    def load(cls, path: str) -> "DifficultyIndex":
+        with open(path, "r") as f:
+            return cls(json.load(f).get("items") or {})
+
+    def __len__(self) -> int:
+        return len(self._b)
+
+    def difficulty(self, problem: List[Any]) -> Optional[float]:
+        return self._b.get(problem_item_key(problem))
+
+
+class ItemPool:
+    """Problems not yet given to one target, sorted by difficulty; takes the most informative one.
+
+    Under the Rasch model a problem's information at ability theta is
+    p * (1 - p), largest where b is closest to theta, so selection is a
+    bisect into the sorted difficulties.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[float, int]]) -> None:
+        pairs = sorted(entries)
+        self._b: List[float] = [b for b, _ in pairs]
+        self._idx: List[int] = [i for _, i in pairs]
+
+    def __len__(self) -> int:
+        return len(self._b)
+
+    def take(self, theta: float) -> Optional[Tuple[int, float]]:
+        """(problem index, difficulty) of the unused problem nearest theta, removed from the pool."""
+        if not self._b:
+            return None
+        pos = bisect.bisect_left(self._b, theta)
+        if pos == len(self._b) or (pos > 0 and theta - self._b[pos - 1] <= self._b[pos] - theta):
+            pos -= 1
+        b = self._b.pop(pos)
+        return self._idx.pop(pos), b
+
+    def put(self, idx: int, b: float) -> None:
+        """Return a taken problem (its call was deferred, not answered)."""
+        pos = bisect.bisect_left(self._b, b)
+        self._b.insert(pos, b)
+        self._idx.insert(pos, idx)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Rasch calibration of problem difficulty from past runs")
+    sub = ap.add_subparsers(dest="command", required=True)
+    cp = sub.add_parser("calibrate", help="Fit problem difficulties from results files")
+    cp.add_argument("roots", nargs="*", default=["experiments/runs"], help="Run directories to scan (default experiments/runs)")
+    cp.add_argument("--experiments", type=str, default=None, help="Comma-separated experiment name globs (first directory under each root)")
+    cp.add_argument("--out", type=str, default="experiments/irt/difficulty.json", help="Difficulty file to write")
+    cp.add_argument("--min-responses", type=int, default=2, help="Drop problems answered by fewer targets")
+    cp.add_argument("--min-items", type=int, default=20, help="Drop results files with fewer answered problems")
+    cp.add_argument("--item-sd", type=float, default=2.0, help="Prior standard deviation of difficulties")
+    sp = sub.add_parser("show", help="Summarise a difficulty file")
+    sp.add_argument("path")
+    args = ap.parse_args()
+
+    if args.command == "calibrate":
+        experiments = [p.strip() for p in args.experiments.split(",") if p.strip()] if args.experiments else None
+        paths = find_results(args.roots, experiments)
+        result = calibrate(paths, min_responses=args.min_responses, min_items=args.min_items, item_sd=args.item_sd)
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        write_json_atomic(args.out, result)
+        print(f"[irt] {len(result['items'])} problems, {len(result['respondents'])} respondents from {len(paths)} files "
+              f"({result['iterations']} iterations) -> {args.out}")
+        return
+
+    with open(args.path, "r") as f:
+        data = json.load(f)
+    bs = sorted(v["b"] for v in data.get("items", {}).values())
+    if bs:
+        print(f"{len(bs)} problems: difficulty min {bs[0]:.2f}, median {bs[len(bs) // 2]:.2f}, max {bs[-1]:.2f}")
+    for who, r in sorted(data.get("respondents", {}).items(), key=lambda x: -x[1]["theta"]):
+        print(f"  {r['theta']:+.2f}  n={r['n']:<5} {who}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Live metrics for a running experiment, served over local HTTP.
+
+With `metrics.enabled` (or `runner --metrics-port N`) the interactive runner
+serves, for as long as it runs:
+
+- /metrics       Prometheus text format (scrape it, or just curl it)
+- /metrics.json  the same numbers as one JSON object
+
+Per target: rows completed, rows/s (whole run and last minute), calls in
+flight, problems queued and deferred, timing_ms quantiles (p50/p90/p99 over
+the latest `latency_samples` rows), error rows by error_class, and
+input/output/reasoning/cached tokens from the normalized usage. Per
+provider:model: retried attempts. For the run: the output writer's backlog.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+QUANTILES = (0.5, 0.9, 0.99)
+TOKEN_FIELDS = ("input_tokens", "output_tokens", "reasoning_tokens", "cached_input_tokens")
+# Window for the recent rows/s rate
+RATE_WINDOW_S = 60.0
+
+
+class _TargetMetrics:
+    def __init__(self, samples: int) -> None:
+        self.completed = 0
+        self.timing: Deque[int] = deque(maxlen=samples)
+        self.timing_sum = 0
+        self.timing_count = 0
+        self.errors: Dict[str, int] = {}
+        self.tokens: Dict[str, int] = {f: 0 for f in TOKEN_FIELDS}
+        self.recent: Deque[float] = deque()
+
+
+def _quantile(sorted_values: List[int], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # Nearest rank
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return float(sorted_values[idx])
+
+
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class RunMetrics:
+    """Counters fed by the runner as rows are committed; read by the HTTP thread.
+
+    Thread-safe. Live values that already exist elsewhere (scheduler queues,
+    writer backlog) are not copied: run_targets registers callables that
+    report them at scrape time.
+    """
+
+    def __init__(self, latency_samples: int = 2000) -> None:
+        self._lock = threading.Lock()
+        self._samples = max(1, int(latency_samples))
+        self._targets: Dict[str, _TargetMetrics] = {}
+        self._retries: Dict[str, int] = {}
+        self._started = time.monotonic()
+        self._queues: Optional[Callable[[], Dict[str, Dict[str, int]]]] = None
+        self._writer: Optional[Callable[[], Dict[str, Any]]] = None
+
+    def reset(self, latency_samples: int = 2000) -> None:
+        with self._lock:
+            self._samples = max(1, int(latency_samples))
+            self._targets = {}
+            self._retries = {}
+            self._started = time.monotonic()
+            self._queues = None
+            self._writer = None
+
+    def set_sources(self, queues: Optional[Callable[[], Dict[str, Dict[str, int]]]] = None, writer: Optional[Callable[[], Dict[str, Any]]] = None) -> None:
+        """queues() -> {target: {in_flight, queued, deferred}}; writer() -> OutputWriter.backlog()."""
+        with self._lock:
+            self._queues = queues
+            self._writer = writer
+
+    def _target(self, key: str) -> _TargetMetrics:
+        m = self._targets.get(key)
+        if m is None:
+            m = _TargetMetrics(self._samples)
+            self._targets[key] = m
+        return m
+
+    def add_target(self, key: str) -> None:
+        with self._lock:
+            self._target(key)
+
+    def observe_row(self, key: str, timing_ms: Optional[int], error_class: Optional[str], usage: Optional[Dict[str, Any]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            m = self._target(key)
+            m.completed += 1
+            m.recent.append(now)
+            while m.recent and now - m.recent[0] > RATE_WINDOW_S:
+                m.recent.popleft()
+            if isinstance(timing_ms, int):
+                m.timing.append(timing_ms)
+                m.timing_sum += timing_ms
+                m.timing_count += 1
+            if error_class:
+                m.errors[error_class] = m.errors.get(error_class, 0) + 1
+            for f in TOKEN_FIELDS:
+                v = (usage or {}).get(f)
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    m.tokens[f] += int(v)
+
+    def retry(self, model_key: str) -> None:
+        with self._lock:
+            self._retries[model_key] = self._retries.get(model_key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            uptime = now - self._started
+            queues_fn, writer_fn = self._queues, self._writer
+            targets: Dict[str, Any] = {}
+            for key, m in self._targets.items():
+                while m.recent and now - m.recent[0] > RATE_WINDOW_S:
+                    m.recent.popleft()
+                timing = sorted(m.timing)
+                targets[key] = {
+                    "completed": m.completed,
+                    "rows_per_s": (m.completed / uptime) if uptime > 0 else None,
+                    "rows_per_s_60s": len(m.recent) / min(RATE_WINDOW_S, uptime) if uptime > 0 else None,
+                    "timing_ms": {
+                        **{f"p{int(q * 100)}": _quantile(timing, q) for q in QUANTILES},
+                        "mean": (m.timing_sum / m.timing_count) if m.timing_count else None,
+                        "count": m.timing_count,
+                        "sum": m.timing_sum,
+                    },
+                    "errors": dict(sorted(m.errors.items())),
+                    "tokens": dict(m.tokens),
+                }
+            retries = dict(sorted(self._retries.items()))
+        # Outside the lock: these read the scheduler / writer, which have their own state
+        try:
+            queues = queues_fn() if queues_fn else {}
+        except Exception:
+            queues = {}
+        for key, depth in queues.items():
+            targets.setdefault(key, {}).update(depth)
+        try:
+            writer = writer_fn() if writer_fn else None
+        except Exception:
+            writer = None
+        return {"uptime_s": uptime, "targets": targets, "retries": retries, "writer": writer}
+
+    def prometheus(self) -> str:
+        snap = self.snapshot()
+        lines: List[str] = []
+
+        def sample(name: str, labels: Dict[str, Any], value: Any) -> None:
+            if value is None:
+                return
+            suffix = ""
+            if labels:
+                suffix = "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels.items()) + "}"
+            lines.append(f"{name}{suffix} {value}")
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[Dict[str, Any], Any]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                sample(name, labels, value)
+
+        targets = snap["targets"]
+
+        def per_target(field: str) -> List[Tuple[Dict[str, Any], Any]]:
+            return [({"target": k}, t.get(field)) for k, t in sorted(targets.items())]
+
+        metric("llmlog_uptime_seconds", "gauge", "Seconds since the run started", [({}, round(snap["uptime_s"], 3))])
+        metric("llmlog_rows_total", "counter", "Rows written (answers and errors)", per_target("completed"))
+        metric("llmlog_rows_per_second", "gauge", "Rows per second over the whole run", per_target("rows_per_s"))
+        metric("llmlog_rows_per_second_60s", "gauge", "Rows per second over the last minute", per_target("rows_per_s_60s"))
+        metric("llmlog_in_flight", "gauge", "Calls in flight", per_target("in_flight"))
+        metric("llmlog_queued", "gauge", "Problems not yet dispatched", per_target("queued"))
+        metric("llmlog_deferred", "gauge", "Problems deferred by an open circuit", per_target("deferred"))
+        timing: List[Tuple[Dict[str, Any], Any]] = []
+        for k, t in sorted(targets.items()):
+            tm = t.get("timing_ms") or {}
+            timing += [({"target": k, "quantile": q}, tm.get(f"p{int(q * 100)}")) for q in QUANTILES]
+        metric("llmlog_timing_ms", "summary", "Row latency (timing_ms); quantiles over the latest rows", timing)
+        for k, t in sorted(targets.items()):
+            tm = t.get("timing_ms") or {}
+            sample("llmlog_timing_ms_sum", {"target": k}, tm.get("sum"))
+            sample("llmlog_timing_ms_count", {"target": k}, tm.get("count"))
+        metric("llmlog_errors_total", "counter", "Error rows by error_class", [
+            ({"target": k, "error_class": cls}, n) for k, t in sorted(targets.items()) for cls, n in (t.get("errors") or {}).items()
+        ])
+        metric("llmlog_tokens_total", "counter", "Tokens from normalized usage", [
+            ({"target": k, "kind": f.replace("_tokens", "")}, n) for k, t in sorted(targets.items()) for f, n in (t.get("tokens") or {}).items()
+        ])
+        metric("llmlog_retries_total", "counter", "Retried call attempts per provider:model", [({"model": k}, n) for k, n in snap["retries"].items()])
+        writer = snap.get("writer") or {}
+        metric("llmlog_writer_queued_rows", "gauge", "Rows queued for the writer thread", [({}, writer.get("queued_rows"))])
+        metric("llmlog_writer_pending_rows", "gauge", "Rows taken by the writer but not yet flushed", [({}, writer.get("pending_rows"))])
+        metric("llmlog_writer_lag_seconds", "gauge", "Age of the oldest unflushed row", [({}, writer.get("lag_s"))])
+        metric("llmlog_writer_rows_written_total", "counter", "Rows written to disk (results and provenance)", [({}, writer.get("rows_written"))])
+        return "\n".join(lines) + "\n"
+
+
+_METRICS = RunMetrics()
+
+
+def get_run_metrics() -> RunMetrics:
+    """Return the process-wide metrics fed by every target and engine."""
+    return _METRICS
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+
+    def __init__(self, metrics: RunMetrics, host: str = "127.0.0.1", port: int = 9464) -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802 (http.server API)
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body, ctype = metrics.prometheus().encode(), "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body, ctype = json.dumps(metrics.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404, "try /metrics or /metrics.json")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # Scrapes every few seconds would drown the run's own output
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI, Gemini and Anthropic HTTP APIs.
+
+Answers every request with a fixed (or random) yes/no after a configurable
+latency, so the runner and its engines can be exercised and benchmarked
+without network access or API spend. Runs on a single asyncio loop with
+HTTP/1.1 keep-alive, so thousands of concurrent slow requests are cheap.
+
+Usage:
+    python -m experiments.mock_server --port 8765 --latency-ms 2000 --jitter-ms 500
+    python -m experiments.mock_server --port 8765 --max-concurrent 20 --rpm 600   # throttle with 429s
+    python -m experiments.mock_server --port 8765 --batch-delay-s 5   # batch jobs finish after 5s
+    python -m experiments.mock_server --port 8765 --stall-rate 0.05   # 5% of calls hang (exercise timeouts)
+    python -m experiments.mock_server --port 8765 --fail-rate 0.1 --fail-status 400   # 10% of calls are rejected
+    curl http://127.0.0.1:8765/mock/stats
+    export OPENAI_BASE_URL=http://127.0.0.1:8765 GEMINI_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_BASE_URL=http://127.0.0.1:8765
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+_PACKED = re.compile(rb"independent problems, numbered 1 to (\d+)")
+
+
+class MockOptions:
+    def __init__(self, latency_ms: float = 200.0, jitter_ms: float = 0.0, answer: str = "random", max_concurrent: int = 0, rpm: int = 0, batch_delay_s: float = 2.0, stall_rate: float = 0.0, stall_s: float = 3600.0, fail_rate: float = 0.0, fail_status: int = 500) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.answer = answer
+        # Throttling (0 = off): 429 with Retry-After beyond this many concurrent requests / requests per minute
+        self.max_concurrent = max_concurrent
+        self.rpm = rpm
+        # Batch jobs (OpenAI Batch, Anthropic Message Batches, Gemini batches) end this long after submission
+        self.batch_delay_s = batch_delay_s
+        # This fraction of model calls goes silent for stall_s: before the response (non-streamed)
+        # or after the first event (streamed)
+        self.stall_rate = stall_rate
+        self.stall_s = stall_s
+        # This fraction of model calls fails at once with fail_status (retry policy by error class)
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+
+    def delay_s(self) -> float:
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+
+    def stall(self) -> float:
+        return self.stall_s if (self.stall_rate and random.random() < self.stall_rate) else 0.0
+
+    def pick_answer(self, raw: bytes = b"") -> str:
+        # Packed prompts (prompt.pack_size) get one numbered answer line per problem
+        m = _PACKED.search(raw)
+        if m:
+            return "\n".join(f"{i}: {self.pick_answer()}" for i in range(1, int(m.group(1)) + 1))
+        if self.answer == "random":
+            return random.choice(["yes", "no"])
+        return self.answer
+
+
+def _prompt_tokens(body: Dict[str, Any]) -> int:
+    # Rough stand-in for tokenization: ~4 characters per token
+    return max(1, len(json.dumps(body)) // 4)
+
+
+def _openai_responses(body: Dict[str, Any], answer: str) -> Dict[str, Any]:
+    reasoning = 0 if (body.get("reasoning") or {}).get("effort") in (None, "minimal") else 64
+    return {
+        "id": f"resp_{random.getrandbits(48):x}",
+        "object": "response",
+        "status": "completed",
+        "model": body.get("model"),
+        "output": [{"type": "message", "role": "assistant", "content": [{"type": "output_text", "text": answer}]}],
+        "output_text": answer,
+        "usage": {
+            "input_tokens": _prompt_tokens(body),
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": 1 + reasoning,
+            "output_tokens_details": {"reasoning_tokens": reasoning},
+        },
+    }
+
+
+def _openai_chat(body: Dict[str, Any], answer: str, more: Sequence[str] = ()) -> Dict[str, Any]:
+    answers = [answer, *more]
+    return {
+        "id": f"chatcmpl-{random.getrandbits(48):x}",
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{"index": i, "message": {"role": "assistant", "content": a}, "finish_reason": "stop"} for i, a in enumerate(answers)],
+        "usage": {"prompt_tokens": _prompt_tokens(body), "completion_tokens": len(answers), "total_tokens": _prompt_tokens(body) + len(answers)},
+    }
+
+
+def _gemini(body: Dict[str, Any], answer: str, more: Sequence[str] = ()) -> Dict[str, Any]:
+    budget = ((body.get("generationConfig") or {}).get("thinkingConfig") or {}).get("thinkingBudget") or 0
+    answers = [answer, *more]
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": a}]}, "finishReason": "STOP", "index": i} for i, a in enumerate(answers)],
+        "usageMetadata": {
+            "promptTokenCount": _prompt_tokens(body),
+            "candidatesTokenCount": len(answers),
+            "thoughtsTokenCount": (64 if budget else 0),
+        },
+    }
+
+
+# Prompt prefixes marked with cache_control so far: the first request writes the cache, later ones read it
+_ANTHROPIC_CACHE: set = set()
+
+
+def _anthropic_usage(body: Dict[str, Any]) -> Dict[str, int]:
+    total = _prompt_tokens(body)
+    cached = 0
+    write = 0
+    for message in body.get("messages") or []:
+        for block in message.get("content") if isinstance(message.get("content"), list) else []:
+            if isinstance(block, dict) and block.get("cache_control"):
+                tokens = max(1, len(block.get("text") or "") // 4)
+                if block.get("text") in _ANTHROPIC_CACHE:
+                    cached += tokens
+                else:
+                    _ANTHROPIC_CACHE.add(block.get("text"))
+                    write += tokens
+    return {"input_tokens": max(1, total - cached - write), "cache_read_input_tokens": cached, "cache_creation_input_tokens": write}
+
+
+def _anthropic_message(body: Dict[str, Any], answer: str) -> Dict[str, Any]:
+    content: List[Dict[str, Any]] = []
+    if (body.get("thinking") or {}).get("type") == "enabled":
+        content.append({"type": "thinking", "thinking": "Checking the clauses.", "signature": "mock"})
+    content.append({"type": "text", "text": answer})
+    return {
+        "id": f"msg_{random.getrandbits(48):x}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model"),
+        "content": content,
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": dict(_anthropic_usage(body), output_tokens=1 + (16 if len(content) > 1 else 0)),
+    }
+
+
+def _anthropic_events(message: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=1))
+    events: List[Tuple[str, Dict[str, Any]]] = [("message_start", {"type": "message_start", "message": start})]
+    for i, block in enumerate(message["content"]):
+        if block["type"] == "thinking":
+            events.append(("content_block_start", {"type": "content_block_start", "index": i, "content_block": {"type": "thinking", "thinking": "", "signature": ""}}))
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": i, "delta": {"type": "thinking_delta", "thinking": block["thinking"]}}))
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": i, "delta": {"type": "signature_delta", "signature": block["signature"]}}))
+        else:
+            events.append(("content_block_start", {"type": "content_block_start", "index": i, "content_block": {"type": "text", "text": ""}}))
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": i, "delta": {"type": "text_delta", "text": block["text"]}}))
+        events.append(("content_block_stop", {"type": "content_block_stop", "index": i}))
+    events.append(("message_delta", {"type": "message_delta", "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None}, "usage": {"output_tokens": message["usage"]["output_tokens"]}}))
+    events.append(("message_stop", {"type": "message_stop"}))
+    return events
+
+
+def _openai_responses_events(response: Dict[str, Any]) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    # output_text is an SDK convenience; the wire format only carries output[]
+    final = {k: v for k, v in response.items() if k != "output_text"}
+    created = dict(final, status="in_progress", output=[], usage=None)
+    return [
+        ("response.created", {"type": "response.created", "response": created}),
+        ("response.output_text.delta", {"type": "response.output_text.delta", "output_index": 0, "content_index": 0, "delta": response["output_text"]}),
+        ("response.output_text.done", {"type": "response.output_text.done", "output_index": 0, "content_index": 0, "text": response["output_text"]}),
+        ("response.completed", {"type": "response.completed", "response": final}),
+    ]
+
+
+def _openai_chat_chunks(completion: Dict[str, Any]) -> List[Tuple[Optional[str], Any]]:
+    base = {"id": completion["id"], "object": "chat.completion.chunk", "model": completion["model"]}
+    choice = completion["choices"][0]
+    return [
+        (None, dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])),
+        (None, dict(base, choices=[{"index": 0, "delta": {"content": choice["message"]["content"]}, "finish_reason": None}])),
+        (None, dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}])),
+        (None, dict(base, choices=[], usage=completion["usage"])),
+        (None, "[DONE]"),
+    ]
+
+
+def _gemini_chunks(response: Dict[str, Any]) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    cand = response["candidates"][0]
+    usage = response["usageMetadata"]
+    first = {"candidates": [{"content": {"role": "model", "parts": [{"text": cand["content"]["parts"][0]["text"]}]}, "index": 0}],
+             "usageMetadata": {"promptTokenCount": usage["promptTokenCount"]}}
+    last = {"candidates": [{"content": {"role": "model", "parts": [{"text": ""}]}, "finishReason": cand["finishReason"], "index": 0}],
+            "usageMetadata": usage}
+    return [(None, first), (None, last)]
+
+
+def _multipart_file(raw: bytes) -> bytes:
+    # Content of the part carrying a filename in a multipart/form-data body
+    boundary = raw.split(b"\r\n", 1)[0]
+    for part in raw.split(boundary):
+        head, _, content = part.partition(b"\r\n\r\n")
+        if b"filename=" in head:
+            return content[:-2] if content.endswith(b"\r\n") else content
+    return b""
+
+
+def _jsonl(items: List[Dict[str, Any]]) -> bytes:
+    return "".join(json.dumps(i) + "\n" for i in items).encode()
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error", 503: "Service Unavailable", 529: "Overloaded"}
+_ERROR_TYPES = {400: "invalid_request_error", 401: "authentication_error", 403: "permission_error", 404: "not_found_error", 503: "overloaded_error", 529: "overloaded_error"}
+
+
+def _failure_error(status: int) -> Dict[str, Any]:
+    return {"type": "error", "error": {"type": _ERROR_TYPES.get(status, "api_error"), "code": status, "message": f"Injected failure {status} (mock)"}}
+
+
+def _throttle_error() -> Dict[str, Any]:
+    # One body understood by all three clients; Gemini reads the delay from RetryInfo
+    return {
+        "type": "error",
+        "error": {
+            "type": "rate_limit_error",
+            "code": 429,
+            "message": "Rate limit reached (mock)",
+            "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1s"}],
+        },
+    }
+
+
+class MockServer:
+    def __init__(self, options: MockOptions) -> None:
+        self.options = options
+        self.requests = 0
+        self.throttled = 0
+        self.failed = 0
+        self.connections = 0
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._recent: deque = deque()
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = lines[0].split(" ", 2)
+                headers = {}
+                for ln in lines[1:]:
+                    if ":" in ln:
+                        k, v = ln.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                length = int(headers.get("content-length") or 0)
+                raw = await reader.readexactly(length) if length else b""
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self.respond(method, target.split("?", 1)[0], raw, writer)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def respond(self, method: str, path: str, raw: bytes, writer: asyncio.StreamWriter) -> None:
+        self.requests += 1
+        self._concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self._concurrent)
+        try:
+            try:
+                body = json.loads(raw) if raw else {}
+            except Exception:
+                body = {}
+            answer = self.options.pick_answer(raw)
+            limit_headers = self.rate_limit_headers()
+            if path == "/mock/stats":
+                await self.send_json(writer, 200, {"requests": self.requests - 1, "throttled": self.throttled, "failed": self.failed, "connections": self.connections, "peak_concurrency": self.max_concurrent})
+            elif self.throttle(path):
+                self.throttled += 1
+                await self.send_json(writer, 429, _throttle_error(), dict(limit_headers, **{"Retry-After": "1"}))
+            elif self.options.fail_rate and not path.startswith("/mock/") and not path.endswith("/count_tokens") and random.random() < self.options.fail_rate:
+                self.failed += 1
+                await self.send_json(writer, self.options.fail_status, _failure_error(self.options.fail_status), limit_headers)
+            elif "/batches" in path or path.startswith("/v1/files") or path.endswith(":batchGenerateContent"):
+                await self.batch_route(method, path, body, raw, writer)
+            elif path.endswith("/messages/count_tokens"):
+                await self.send_json(writer, 200, {"input_tokens": _prompt_tokens(body)})
+            elif path.endswith("/messages"):
+                message = _anthropic_message(body, answer)
+                if body.get("stream"):
+                    await self.send_sse(writer, _anthropic_events(message), limit_headers)
+                else:
+                    await asyncio.sleep(self.options.delay_s() + self.options.stall())
+                    await self.send_json(writer, 200, message, limit_headers)
+            elif path.endswith("/responses"):
+                if body.get("stream"):
+                    await self.send_sse(writer, _openai_responses_events(_openai_responses(body, answer)), limit_headers)
+                else:
+                    await asyncio.sleep(self.options.delay_s() + self.options.stall())
+                    await self.send_json(writer, 200, _openai_responses(body, answer), limit_headers)
+            elif path.endswith("/chat/completions"):
+                if body.get("stream"):
+                    await self.send_sse(writer, _openai_chat_chunks(_openai_chat(body, answer)), limit_headers)
+                else:
+                    await asyncio.sleep(self.options.delay_s() + self.options.stall())
+                    more = [self.options.pick_answer(raw) for _ in range(int(body.get("n") or 1) - 1)]
+                    await self.send_json(writer, 200, _openai_chat(body, answer, more), limit_headers)
+            elif path.endswith(":streamGenerateContent"):
+                await self.send_sse(writer, _gemini_chunks(_gemini(body, answer)), limit_headers)
+            elif path.endswith(":generateContent"):
+                await asyncio.sleep(self.options.delay_s() + self.options.stall())
+                count = int((body.get("generationConfig") or {}).get("candidateCount") or 1)
+                await self.send_json(writer, 200, _gemini(body, answer, [self.options.pick_answer(raw) for _ in range(count - 1)]), limit_headers)
+            else:
+                await self.send_json(writer, 404, {"error": {"message": f"mock: no route for {method} {path}"}})
+        finally:
+            self._concurrent -= 1
+
+    def new_batch(self, kind: str, requests: List[Dict[str, Any]], **extra: Any) -> Dict[str, Any]:
+        batch_id = f"{random.getrandbits(48):x}"
+        self.batches[batch_id] = dict(extra, kind=kind, id=batch_id, created=time.time(), requests=requests)
+        return self.batches[batch_id]
+
+    def batch_ended(self, batch: Dict[str, Any]) -> bool:
+        return time.time() - batch["created"] >= self.options.batch_delay_s
+
+    def anthropic_batch(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        ended = self.batch_ended(batch)
+        n = len(batch["requests"])
+        return {
+            "id": f"msgbatch_{batch['id']}",
+            "type": "message_batch",
+            "processing_status": ("ended" if ended else "in_progress"),
+            "request_counts": {"processing": (0 if ended else n), "succeeded": (n if ended else 0), "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": ("2025-01-01T00:01:00Z" if ended else None),
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": (f"/v1/messages/batches/msgbatch_{batch['id']}/results" if ended else None),
+        }
+
+    def openai_batch(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        ended = self.batch_ended(batch)
+        n = len(batch["requests"])
+        if ended and batch["id"] not in self.files:
+            lines = []
+            for r in batch["requests"]:
+                body = r.get("body") or {}
+                answer = self.options.pick_answer()
+                out = _openai_responses(body, answer) if r.get("url") == "/v1/responses" else _openai_chat(body, answer)
+                lines.append({"id": f"batch_req_{random.getrandbits(32):x}", "custom_id": r.get("custom_id"), "response": {"status_code": 200, "request_id": "mock", "body": out}, "error": None})
+            self.files[f"file-out-{batch['id']}"] = _jsonl(lines)
+        return {
+            "id": f"batch_{batch['id']}",
+            "object": "batch",
+            "endpoint": batch["endpoint"],
+            "input_file_id": batch["input_file_id"],
+            "completion_window": "24h",
+            "status": ("completed" if ended else "in_progress"),
+            "output_file_id": (f"file-out-{batch['id']}" if ended else None),
+            "error_file_id": None,
+            "request_counts": {"total": n, "completed": (n if ended else 0), "failed": 0},
+        }
+
+    def gemini_batch(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        name = f"batches/{batch['id']}"
+        if not self.batch_ended(batch):
+            return {"name": name, "metadata": {"name": name, "state": "BATCH_STATE_RUNNING"}}
+        inlined = [
+            {"response": _gemini(r.get("request") or {}, self.options.pick_answer()), "metadata": r.get("metadata")}
+            for r in batch["requests"]
+        ]
+        return {
+            "name": name,
+            "metadata": {"name": name, "state": "BATCH_STATE_SUCCEEDED"},
+            "done": True,
+            "response": {"inlinedResponses": {"inlinedResponses": inlined}},
+        }
+
+    async def batch_route(self, method: str, path: str, body: Dict[str, Any], raw: bytes, writer: asyncio.StreamWriter) -> None:
+        parts = path.strip("/").split("/")
+        batch_id = parts[-1].split("_", 1)[-1]
+        if path.startswith("/v1/messages/batches"):
+            if method == "POST":
+                await self.send_json(writer, 200, self.anthropic_batch(self.new_batch("anthropic", body.get("requests") or [])))
+                return
+            if path.endswith("/results"):
+                batch = self.batches.get(parts[-2].split("_", 1)[-1])
+                if batch and self.batch_ended(batch):
+                    lines = [
+                        {"custom_id": r.get("custom_id"), "result": {"type": "succeeded", "message": _anthropic_message(r.get("params") or {}, self.options.pick_answer())}}
+                        for r in batch["requests"]
+                    ]
+                    await self.send_bytes(writer, 200, _jsonl(lines), "application/binary")
+                    return
+            elif batch_id in self.batches:
+                await self.send_json(writer, 200, self.anthropic_batch(self.batches[batch_id]))
+                return
+        elif path == "/v1/files" and method == "POST":
+            file_id = f"file-{random.getrandbits(48):x}"
+            self.files[file_id] = _multipart_file(raw)
+            await self.send_json(writer, 200, {"id": file_id, "object": "file", "purpose": "batch", "bytes": len(self.files[file_id])})
+            return
+        elif path.startswith("/v1/files/") and path.endswith("/content") and parts[-2] in self.files:
+            await self.send_bytes(writer, 200, self.files[parts[-2]], "application/jsonl")
+            return
+        elif path == "/v1/batches" and method == "POST":
+            content = self.files.get(body.get("input_file_id"), b"")
+            requests = [json.loads(ln) for ln in content.decode().splitlines() if ln.strip()]
+            batch = self.new_batch("openai", requests, endpoint=body.get("endpoint"), input_file_id=body.get("input_file_id"))
+            await self.send_json(writer, 200, self.openai_batch(batch))
+            return
+        elif path.startswith("/v1/batches/") and batch_id in self.batches:
+            await self.send_json(writer, 200, self.openai_batch(self.batches[batch_id]))
+            return
+        elif path.endswith(":batchGenerateContent"):
+            requests = ((((body.get("batch") or {}).get("input_config") or {}).get("requests") or {}).get("requests")) or []
+            await self.send_json(writer, 200, self.gemini_batch(self.new_batch("google", requests)))
+            return
+        elif path.startswith("/v1beta/batches/") and batch_id in self.batches:
+            await self.send_json(writer, 200, self.gemini_batch(self.batches[batch_id]))
+            return
+        await self.send_json(writer, 404, {"error": {"message": f"mock: no route for {method} {path}"}})
+
+    def throttle(self, path: str) -> bool:
+        if path.endswith("/count_tokens") or path.startswith("/mock/") or "/batches" in path or path.startswith("/v1/files") or path.endswith(":batchGenerateContent"):
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60.0:
+            self._recent.popleft()
+        if self.options.max_concurrent and self._concurrent > self.options.max_concurrent:
+            return True
+        if self.options.rpm and len(self._recent) >= self.options.rpm:
+            return True
+        self._recent.append(now)
+        return False
+
+    def rate_limit_headers(self) -> Dict[str, str]:
+        if not self.options.rpm:
+            return {}
+        remaining = max(0, self.options.rpm - len(self._recent) - 1)
+        return {
+            "x-ratelimit-limit-requests": str(self.options.rpm),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": "1s",
+        }
+
+    async def send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any], extra_headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload).encode()
+        head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+        for k, v in (extra_headers or {}).items():
+            head += f"{k}: {v}\r\n"
+        writer.write(head.encode() + b"\r\n" + data)
+        await writer.drain()
+
+    async def send_bytes(self, writer: asyncio.StreamWriter, status: int, data: bytes, content_type: str) -> None:
+        head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+        writer.write(head.encode() + b"\r\n" + data)
+        await writer.drain()
+
+    async def send_sse(self, writer: asyncio.StreamWriter, events: List[Tuple[Optional[str], Any]], extra_headers: Optional[Dict[str, str]] = None) -> None:
+        head = "HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n"
+        for k, v in (extra_headers or {}).items():
+            head += f"{k}: {v}\r\n"
+        writer.write(head.encode() + b"\r\n")
+        delay = self.options.delay_s()
+        stall = self.options.stall()
+        # Half the latency before the first event (time to first token), the rest spread over the stream
+        await asyncio.sleep(delay / 2)
+        for i, (name, payload) in enumerate(events):
+            if i == 1 and stall:
+                await asyncio.sleep(stall)
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            # Anthropic and the Responses API name their events; Chat Completions and Gemini send data only
+            chunk = ((f"event: {name}\n" if name else "") + f"data: {data}\n\n").encode()
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+            await asyncio.sleep(delay / 2 / max(1, len(events)))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def serve_in_thread(options: MockOptions, host: str = "127.0.0.1", port: int = 0) -> Tuple[str, MockServer, threading.Event]:
+    """Start a mock server on a daemon thread; returns (base_url, server, stop_event)."""
+    server = MockServer(options)
+    ready = threading.Event()
+    stop = threading.Event()
+    box: Dict[str, Any] = {}
+
+    def run() -> None:
+        async def main() -> None:
+            srv = await asyncio.start_server(server.handle, host, port, backlog=4096)
+            box["port"] = srv.sockets[0].getsockname()[1]
+            ready.set()
+            while not stop.is_set():
+                await asyncio.sleep(0.1)
+            srv.close()
+
+        asyncio.run(main())
+
+    threading.Thread(target=run, name="mock-server", daemon=True).start()
+    ready.wait()
+    return f"http://{host}:{box['port']}", server, stop
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Serve a local stand-in for the OpenAI/Gemini/Anthropic APIs")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=200.0, help="Mean response latency")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter added to the latency")
+    ap.add_argument("--answer", default="random", help="yes | no | random")
+    ap.add_argument("--max-concurrent", type=int, default=0, help="Answer 429 beyond this many concurrent requests (0 = off)")
+    ap.add_argument("--rpm", type=int, default=0, help="Answer 429 beyond this many requests per minute (0 = off)")
+    ap.add_argument("--batch-delay-s", type=float, default=2.0, help="Seconds until a submitted batch job ends")
+    ap.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of model calls that go silent for --stall-s")
+    ap.add_argument("--stall-s", type=float, default=3600.0, help="How long a stalled call stays silent")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of model calls answered with --fail-status")
+    ap.add_argument("--fail-status", type=int, default=500, help="HTTP status of injected failures (e.g. 400, 500, 503, 529)")
+    args = ap.parse_args()
+
+    server = MockServer(MockOptions(args.latency_ms, args.jitter_ms, args.answer, args.max_concurrent, args.rpm, args.batch_delay_s, args.stall_rate, args.stall_s, args.fail_rate, args.fail_status))
+
+    async def serve() -> None:
+        srv = await asyncio.start_server(server.handle, args.host, args.port, backlog=4096)
+        print(f"Mock provider API on http://{args.host}:{args.port} (latency {args.latency_ms}ms ± {args.jitter_ms}ms)")
+        async with srv:
+            await srv.serve_forever()
+
+    started = time.time()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(f"\nServed {server.requests} requests in {time.time() - started:.0f}s (peak concurrency {server.max_concurrent}, throttled {server.throttled})")
+
+
+if __name__ == "__main__":
+    main()
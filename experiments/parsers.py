@@ -1,4 +1,5 @@
-from typing import List
+import re
+from typing import List, Optional
 
 
 def parse_yes_no(text: str, yes_tokens: List[str] = None, no_tokens: List[str] = None) -> int:
@@ -75,4 +76,26 @@ def parse_both(text: str, yes_tokens: List[str] = None, no_tokens: List[str] = N
     return 2
 
 
+_PACKED_LINE = re.compile(r"^\s*(?:problem|question|q)?\s*#?\s*(\d+)\s*[:.)\-]\s*(.*?)\s*$", re.IGNORECASE)
 
+
+def parse_packed(text: str, k: int) -> List[Optional[str]]:
+    """Per-problem answer text of a packed response, for problems 1..k.
+
+    Answers are expected as lines like "1: yes" (also "Problem 1: yes",
+    "1. no", "**2)** contradiction"); the last such line for each number
+    wins, so numbered reasoning earlier in the text is overridden by the
+    final answer block. Missing answers are None. Each entry is then parsed
+    with the configured single-answer parser.
+    """
+    answers: List[Optional[str]] = [None] * k
+    if not text:
+        return answers
+    for line in text.splitlines():
+        m = _PACKED_LINE.match(line.replace("*", "").replace("`", "").replace("_", " "))
+        if not m:
+            continue
+        n = int(m.group(1))
+        if 1 <= n <= k and m.group(2):
+            answers[n - 1] = m.group(2)
+    return answers
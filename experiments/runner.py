@@ -1,29 +1,62 @@
 #!/usr/bin/env python3
 
 import argparse
+import asyncio
+import hashlib
 import json
 import os
+import random
 import sys
+import threading
 import time
-from typing import Any, Dict, Iterable, Iterator, List, Optional
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import yaml
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # Support running both as a module (python -m experiments.runner)
 # and as a script (python experiments/runner.py)
 try:
     from .schema import RunConfig, ResultRow, ProblemMeta
-    from .filters import horn_only as filter_horn_only, skip as filter_skip, limit as filter_limit
-    from .parsers import parse_yes_no, parse_contradiction, parse_both
-    from ..utils.provider_router import run_chat
+    from .scheduler import LockstepScheduler, Plan
+    from .checkpoint import ResultsCheckpoint, truncate_torn_tail
+    from .writer import OutputWriter, write_json_atomic
+    from .adaptive import AdaptiveConcurrency
+    from .hedging import HedgePolicy, history_paths, read_latency_history
+    from .circuit import get_circuit_breaker
+    from .metrics import MetricsServer, get_run_metrics
+    from .filters import horn_only as filter_horn_only, skip as filter_skip, limit as filter_limit, shard as filter_shard
+    from .shards import parse_shard, shard_path
+    from .sampling import SamplingTracker, stratified_order, stratum_of
+    from .parsers import parse_yes_no, parse_contradiction, parse_both, parse_packed
+    from ..utils.provider_router import run_chat, arun_chat, cached_chat, supports_candidates
+    from ..utils.transport import Deadline, aclose_async_client, configure_pools
+    from ..utils.response_cache import configure_cache
+    from ..utils.anthropic_client import configure_visible_tokens
+    from ..utils.rate_limiter import get_rate_limiter, rate_limit_key, billed_tokens
+    from ..utils.errors import error_class, is_retriable
 except Exception:
     # Fallback for script execution
     sys.path.append(os.path.dirname(os.path.dirname(__file__)))
     from experiments.schema import RunConfig, ResultRow, ProblemMeta
-    from experiments.filters import horn_only as filter_horn_only, skip as filter_skip, limit as filter_limit
-    from experiments.parsers import parse_yes_no, parse_contradiction, parse_both
-    from utils.provider_router import run_chat
+    from experiments.scheduler import LockstepScheduler, Plan
+    from experiments.checkpoint import ResultsCheckpoint, truncate_torn_tail
+    from experiments.writer import OutputWriter, write_json_atomic
+    from experiments.adaptive import AdaptiveConcurrency
+    from experiments.hedging import HedgePolicy, history_paths, read_latency_history
+    from experiments.circuit import get_circuit_breaker
+    from experiments.metrics import MetricsServer, get_run_metrics
+    from experiments.filters import horn_only as filter_horn_only, skip as filter_skip, limit as filter_limit, shard as filter_shard
+    from experiments.shards import parse_shard, shard_path
+    from experiments.sampling import SamplingTracker, stratified_order, stratum_of
+    from experiments.parsers import parse_yes_no, parse_contradiction, parse_both, parse_packed
+    from utils.provider_router import run_chat, arun_chat, cached_chat, supports_candidates
+    from utils.transport import Deadline, aclose_async_client, configure_pools
+    from utils.response_cache import configure_cache
+    from utils.anthropic_client import configure_visible_tokens
+    from utils.rate_limiter import get_rate_limiter, rate_limit_key, billed_tokens
+    from utils.errors import error_class, is_retriable
 
 
 def read_jsonl_rows(path: str) -> Iterator[List[Any]]:
@@ -51,12 +84,19 @@ def apply_filters(rows: Iterable[List[Any]], cfg: RunConfig) -> Iterator[List[An
         r = filter_skip(r, cfg.filters.skip_rows)
     if cfg.filters.horn_only:
         r = filter_horn_only(r)
+    if cfg.sampling.order == "stratified":
+        # Before limit_rows, so a limited run is a stratified sample rather than the head of the file
+        r = iter(stratified_order(r, cfg.sampling.seed))
     if cfg.filters.limit_rows is not None:
         r = filter_limit(r, cfg.filters.limit_rows)
+    if cfg.filters.shard:
+        # After the other filters, so the N shards together cover exactly the unsharded run
+        r = filter_shard(r, *parse_shard(cfg.filters.shard))
     return r
 
 
-def render_prompt(problem: List[Any], template_text: str, style: Optional[str]) -> str:
+def render_clauses(problem: List[Any], style: Optional[str]) -> str:
+    """The statements block of one problem in the given style."""
     clauses = problem[5]
     if style in (None, "horn_if_then"):
         lines: List[str] = []
@@ -83,8 +123,7 @@ def render_prompt(problem: List[Any], template_text: str, style: Optional[str])
                 for var in clause:
                     parts.append(f"p{var}" if var > 0 else f"not(p{0 - var})")
                 lines.append(" or ".join(parts) + ".")
-        body = "\n".join(lines)
-        return template_text.replace("{{ clauses }}", body)
+        return "\n".join(lines)
     elif style == "cnf_v1":
         # v1: "pN is true/false" with ORs
         lines: List[str] = []
@@ -96,8 +135,7 @@ def render_prompt(problem: List[Any], template_text: str, style: Optional[str])
                 else:
                     parts.append(f"p{0 - var} is false")
             lines.append(" or ".join(parts) + ".")
-        body = "\n".join(lines)
-        return template_text.replace("{{ clauses }}", body)
+        return "\n".join(lines)
     elif style == "cnf_v2":
         # v2: compact "pN" and "not(pN)" with ORs
         lines: List[str] = []
@@ -106,12 +144,39 @@ def render_prompt(problem: List[Any], template_text: str, style: Optional[str])
             for var in clause:
                 parts.append(f"p{var}" if var > 0 else f"not(p{0 - var})")
             lines.append(" or ".join(parts) + ".")
-        body = "\n".join(lines)
-        return template_text.replace("{{ clauses }}", body)
+        return "\n".join(lines)
     else:
         raise RuntimeError(f"Unknown prompt style: {style}")
 
 
+def render_prompt(problem: List[Any], template_text: str, style: Optional[str]) -> str:
+    return template_text.replace("{{ clauses }}", render_clauses(problem, style))
+
+
+def prompt_prefix(template_text: str) -> str:
+    """Static head of a template: everything before {{ clauses }}, identical in every prompt rendered from it."""
+    return template_text.split("{{ clauses }}", 1)[0]
+
+
+def pack_template(template_text: str, k: int) -> str:
+    """Template for k numbered problems per prompt (prompt.pack_size): adds the rule asking for "n: word" answer lines."""
+    rule = (
+        f"\nMultiple problems\n- The statements below form {k} independent problems, numbered 1 to {k}. Solve each one on its own; "
+        f"statements of one problem say nothing about another.\n- Finish with exactly {k} lines, one per problem in order, "
+        f"each written as \"<number>: <word>\" with the single final word the answer format below asks for (e.g. \"1: yes\").\n"
+    )
+    if "\n\nConventions" in template_text:
+        return template_text.replace("\n\nConventions", rule + "\nConventions", 1)
+    return rule.lstrip("\n") + "\n" + template_text
+
+
+def render_pack_prompt(problems: List[List[Any]], template_text: str, style: Optional[str]) -> str:
+    """One copy of the instructions over several numbered problems; answers come back as "n: word" lines."""
+    template_text = pack_template(template_text, len(problems))
+    blocks = "\n\n".join(f"Problem {i}:\n{render_clauses(problem, style)}" for i, problem in enumerate(problems, start=1))
+    return template_text.replace("{{ clauses }}", blocks)
+
+
 """
 Note: Non-Horn clauses are rendered in CNF-compact form when style is horn_if_then,
 allowing prompts to be generated for mixed datasets without errors.
@@ -195,6 +260,12 @@ def _validate_target_config(provider: str, model: Optional[str], temperature: Op
                 raise RuntimeError("OpenAI: thinking.enabled=true requires thinking.effort in {low, medium, high}")
 
 def _build_outpath(cfg: RunConfig, target: Dict[str, Any], model: str, run_id: Optional[str]) -> str:
+    outpath = _outpath_for(cfg, target, model, run_id)
+    ensure_dir(outpath)
+    return outpath
+
+
+def _outpath_for(cfg: RunConfig, target: Dict[str, Any], model: str, run_id: Optional[str]) -> str:
     if cfg.output_pattern:
         outpath = cfg.output_pattern
         
@@ -231,25 +302,938 @@ def _build_outpath(cfg: RunConfig, target: Dict[str, Any], model: str, run_id: O
         if "${run}" in outpath:
             rid = run_id or time.strftime("%Y%m%d-%H%M%S")
             outpath = outpath.replace("${run}", rid)
-    ensure_dir(outpath)
+    if cfg.filters.shard:
+        outpath = shard_path(outpath, *parse_shard(cfg.filters.shard))
     return outpath
 
 
-def run_targets_lockstep(
+def _target_key(t: Dict[str, Any]) -> str:
+    # Include thinking config to distinguish same model with different settings
+    thinking_cfg = t.get("thinking", {})
+    thinking_enabled = thinking_cfg.get("enabled", False) if thinking_cfg else False
+    thinking_budget = thinking_cfg.get("budget_tokens", 0) if thinking_cfg else 0
+    thinking_effort = thinking_cfg.get("effort", "") if thinking_cfg else ""
+    return f"{t.get('provider')}::{t.get('model')}::think={thinking_enabled}::budget={thinking_budget}::effort={thinking_effort}"
+
+
+def _answer_template(cfg: RunConfig, base_tmpl: str) -> str:
+    # Inject unified instruction only for parse.type == both
+    if getattr(cfg.parse, "type", None) == "both":
+        inject = "\nUnified answer rule (mixed cases)\n- Regardless of how the statements are rendered, output only a final single word: \"yes\" if p0 is derivable OR the set is a contradiction; otherwise \"no\". Do not output any other words.\n"
+        return base_tmpl.replace("\n\nConventions", inject + "\nConventions")
+    elif getattr(cfg.parse, "type", None) == "yes_no" and cfg.prompt.style in (None, "horn_if_then"):
+        inject = "\nHorn answer rule\n- Output ONLY a single final word: \"yes\" if p0 is derivable, otherwise \"no\". Do not output any other words.\n"
+        return base_tmpl.replace("\n\nConventions", inject + "\nConventions")
+    return base_tmpl
+
+
+class ProblemStore:
+    """Filtered problems of one dataset with their prompts rendered once.
+
+    Built per (input_file, filters, template, style, parse.type) and shared
+    read-only by every target of the process: position i of ``problems``,
+    ``pids``, ``prompts`` and ``prompt_hashes`` describes the same problem.
+    Callers must not mutate the rows.
+    """
+
+    def __init__(self, problems: List[List[Any]], tmpl: str, style: Optional[str]) -> None:
+        self.problems: Tuple[List[Any], ...] = tuple(problems)
+        self.template = tmpl
+        self.style = style
+        self.pids: Tuple[Any, ...] = tuple(
+            (problem[0] if isinstance(problem, list) and len(problem) > 0 else idx)
+            for idx, problem in enumerate(self.problems, start=1)
+        )
+        self.prompts: Tuple[str, ...] = tuple(render_prompt(problem, tmpl, style) for problem in self.problems)
+        # Shared head of every prompt above; sent as a cacheable prefix (prompt.cache_prefix)
+        self.prefix = prompt_prefix(tmpl)
+        # sha256 of the rendered prompt: identifies the exact text sent, across configs and runs
+        self.prompt_hashes: Tuple[str, ...] = tuple(hashlib.sha256(p.encode()).hexdigest() for p in self.prompts)
+        self.index = MappingProxyType({pid: idx for idx, pid in enumerate(self.pids)})
+
+    def __len__(self) -> int:
+        return len(self.problems)
+
+    def pack_prompt(self, indices: Iterable[int]) -> str:
+        return render_pack_prompt([self.problems[i] for i in indices], self.template, self.style)
+
+    def pack_prefix(self, k: int) -> str:
+        return prompt_prefix(pack_template(self.template, k))
+
+
+_PROBLEM_STORES: Dict[Tuple[Any, ...], ProblemStore] = {}
+_PROBLEM_STORES_LOCK = threading.Lock()
+
+
+def _problem_store_key(cfg: RunConfig) -> Tuple[Any, ...]:
+    def stamp(path: str) -> Tuple[str, Optional[int]]:
+        # Edited files get a fresh store even within one process
+        try:
+            return os.path.abspath(path), os.stat(path).st_mtime_ns
+        except OSError:
+            return os.path.abspath(path), None
+
+    return (
+        stamp(cfg.input_file),
+        cfg.filters.model_dump_json(),
+        (cfg.sampling.order, cfg.sampling.seed),
+        stamp(cfg.prompt.template),
+        cfg.prompt.style,
+        getattr(cfg.parse, "type", None),
+    )
+
+
+def get_problem_store(cfg: RunConfig) -> ProblemStore:
+    """Load, filter and render the dataset for cfg once per process; later calls share the result."""
+    key = _problem_store_key(cfg)
+    # Held while building so concurrent targets wait for one load instead of each reading the file
+    with _PROBLEM_STORES_LOCK:
+        store = _PROBLEM_STORES.get(key)
+        if store is None:
+            problems = list(apply_filters(read_jsonl_rows(cfg.input_file), cfg))
+            tmpl = _answer_template(cfg, read_text(cfg.prompt.template))
+            store = ProblemStore(problems, tmpl, cfg.prompt.style)
+            _PROBLEM_STORES[key] = store
+        return store
+
+
+def _problem_meta(problem: List[Any]) -> ProblemMeta:
+    return ProblemMeta(
+        maxvars=problem[1] if len(problem) > 1 else None,
+        maxlen=problem[2] if len(problem) > 2 else None,
+        horn=problem[3] if len(problem) > 3 else None,
+        satflag=problem[4] if len(problem) > 4 else None,
+        proof=problem[6] if len(problem) > 6 else None,
+    )
+
+
+def _classify_error(msg: Optional[str]) -> Optional[str]:
+    # Map a compact error_class from a message; calls record the class of the exception itself (errors.error_class)
+    if not msg:
+        return None
+    m = msg.lower()
+    if "429" in m or "too many requests" in m or "rate limit" in m:
+        return "rate_limit"
+    if "overloaded" in m or "529" in m:
+        return "overloaded"
+    if "usage limits" in m or "quota" in m:
+        return "quota"
+    if "timeout" in m:
+        return "timeout"
+    return "error"
+
+
+def _extract_raw_text(rr: Any) -> str:
+    # Try common provider shapes when the client returned no text
+    extracted = ""
+    if isinstance(rr, dict):
+        if isinstance(rr.get("text"), str):
+            extracted = rr.get("text")
+        else:
+            out = rr.get("output")
+            if isinstance(out, list):
+                for item in out:
+                    if isinstance(item, dict) and item.get("type") == "message":
+                        content = item.get("content")
+                        if isinstance(content, list):
+                            for c in content:
+                                if isinstance(c, dict) and isinstance(c.get("text"), str) and c.get("text").strip():
+                                    extracted = c.get("text").strip()
+                                    break
+                    if extracted:
+                        break
+        if not extracted:
+            # Fallback: any string value in raw_response
+            for v in rr.values():
+                if isinstance(v, str) and v.strip():
+                    extracted = v.strip(); break
+    elif isinstance(rr, str):
+        extracted = rr
+    return extracted
+
+
+def _chat_kwargs(cfg: RunConfig, t: Dict[str, Any], prompt: str, sysprompt: Optional[str], prefix: Optional[str] = None, n: int = 1) -> Dict[str, Any]:
+    # Prefer per-target thinking, fallback to global
+    thinking_cfg = None
+    try:
+        if t.get("thinking") is not None:
+            thinking_cfg = t.get("thinking")
+        elif cfg.thinking is not None:
+            thinking_cfg = cfg.thinking.model_dump(exclude_none=True)
+    except Exception:
+        thinking_cfg = None
+    kwargs = dict(
+        provider=t.get("provider"),
+        model=t.get("model"),
+        prompt=prompt,
+        sysprompt=sysprompt,
+        max_tokens=(t.get("max_tokens") or cfg.max_tokens),
+        temperature=(t.get("temperature") if t.get("temperature") is not None else (cfg.temperature or 0.0)),
+        seed=(t.get("seed") if t.get("seed") is not None else cfg.seed),
+        thinking=thinking_cfg,
+        # Static head of the prompt, marked for provider prompt caching; None sends the prompt as one block
+        cache_prefix=(prefix if cfg.prompt.cache_prefix else None),
+    )
+    if n > 1:
+        # Several samples from one request (see _plan_samples)
+        kwargs["n"] = n
+    return kwargs
+
+
+def _stream_enabled(cfg: RunConfig, t: Dict[str, Any]) -> bool:
+    return bool(t.get("stream") if t.get("stream") is not None else cfg.stream)
+
+
+def _deadline(cfg: RunConfig, t: Dict[str, Any]) -> Deadline:
+    """Connect/read/total limits for one call attempt: concurrency.timeouts, overridden by the target's `timeouts`."""
+    limits = cfg.concurrency.timeouts.model_dump()
+    limits.update({k: v for k, v in (t.get("timeouts") or {}).items() if k in limits})
+    return Deadline(limits["connect_s"], limits["read_s"], limits["total_s"])
+
+
+def _retry_wait(cfg: RunConfig, attempts: int, e: BaseException) -> Optional[float]:
+    """Seconds to sleep before the next attempt, or None when the error is final.
+
+    Only retriable errors (errors.is_retriable) are retried; a rejected request
+    (bad parameter, auth, spent quota) fails on the first attempt. The wait
+    doubles per attempt from backoff_base_s up to backoff_max_s (or follows
+    backoff_seconds when set), with half of it random so calls that failed
+    together do not retry together. A provider's Retry-After is enforced on
+    top by the rate limiter (_observe_failure).
+    """
+    retry = cfg.concurrency.retry
+    if attempts >= retry.max_attempts or not is_retriable(e):
+        return None
+    if retry.backoff_seconds:
+        cap = float(retry.backoff_seconds[min(attempts - 1, len(retry.backoff_seconds) - 1)])
+    else:
+        cap = min(retry.backoff_max_s, retry.backoff_base_s * 2 ** (attempts - 1))
+    return cap / 2 + random.uniform(0, cap / 2)
+
+
+def _configure_rate_limits(cfg: RunConfig, targets: Iterable[Dict[str, Any]]) -> None:
+    """Register RPM/TPM limits for each target's provider:model on the shared limiter."""
+    conc = cfg.concurrency
+    limiter = get_rate_limiter()
+    for t in _leaf_targets(targets):
+        rpm = t.get("rate_limit_per_min") if t.get("rate_limit_per_min") is not None else (conc.rate_limit_per_min if conc else None)
+        tpm = t.get("tokens_per_min") if t.get("tokens_per_min") is not None else (conc.tokens_per_min if conc else None)
+        limiter.configure(rate_limit_key(t.get("provider"), t.get("model")), rpm, tpm)
+
+
+def _rate_limit_reservation(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    key = rate_limit_key(kwargs.get("provider"), kwargs.get("model"))
+    chars = len(kwargs.get("prompt") or "") + len(kwargs.get("sysprompt") or "")
+    max_tokens = kwargs.get("max_tokens")
+    if max_tokens and kwargs.get("n"):
+        # Every candidate of an n-sample request can use the full output budget
+        max_tokens *= kwargs["n"]
+    return {"key": key, "chars": chars, "tokens": get_rate_limiter().estimate_tokens(key, chars, max_tokens)}
+
+
+def _rate_limit_observe(kwargs: Dict[str, Any], reservation: Dict[str, Any], usage: Any) -> None:
+    inp, out = billed_tokens(kwargs.get("provider"), usage)
+    get_rate_limiter().observe(reservation["key"], reservation["tokens"], reservation["chars"], inp, out)
+
+
+def _provider_group(provider: Optional[str]) -> str:
+    p = (provider or "").lower()
+    return "google" if p == "gemini" else p
+
+
+def _scheduler_buckets(unit: Dict[str, Any]) -> Tuple[str, ...]:
+    """In-flight cap buckets a call to a leaf target draws from: its provider and its provider:model."""
+    group = _provider_group(unit.get("provider"))
+    return (f"provider:{group}", f"model:{group}:{unit.get('model')}")
+
+
+def _bucket_limits(cfg: RunConfig, adaptive: Optional[AdaptiveConcurrency]) -> Callable[[str], Optional[int]]:
+    provider_caps = {_provider_group(p): int(n) for p, n in (cfg.concurrency.provider_limits or {}).items()}
+    model_caps: Dict[str, int] = {}
+    for name, n in (cfg.concurrency.model_limits or {}).items():
+        prov, _, model = str(name).partition(":")
+        model_caps[f"{_provider_group(prov)}:{model}"] = int(n)
+
+    def limit(bucket: str) -> Optional[int]:
+        kind, _, name = bucket.partition(":")
+        if kind == "model":
+            return model_caps.get(name)
+        caps = [c for c in (provider_caps.get(name), adaptive.limit(name) if adaptive is not None else None) if c is not None]
+        return min(caps) if caps else None
+
+    return limit
+
+
+def _target_weight(t: Dict[str, Any]) -> float:
+    weight = float(t.get("weight") if t.get("weight") is not None else 1.0)
+    if weight <= 0:
+        raise ValueError(f"weight must be > 0 for {t.get('provider')}:{t.get('model')}, got {weight}")
+    return weight
+
+
+def _observe_success(t: Dict[str, Any], reservation: Dict[str, Any], started: float, latency_s: float, res: Dict[str, Any], adaptive: Optional[AdaptiveConcurrency]) -> None:
+    rate_info = res.get("rate_limit")
+    if isinstance(rate_info, dict):
+        # Quota window spent: hold further calls to this model until it resets
+        resets = [rate_info.get(f"reset_{kind}_s") for kind in ("requests", "tokens") if rate_info.get(f"remaining_{kind}") == 0]
+        resets = [r for r in resets if r]
+        if resets:
+            get_rate_limiter().block(reservation["key"], max(resets))
+    if adaptive is not None:
+        adaptive.on_success(_provider_group(t.get("provider")), _target_key(t), started, latency_s, rate_info)
+
+
+def _observe_failure(t: Dict[str, Any], reservation: Dict[str, Any], started: float, e: Exception, adaptive: Optional[AdaptiveConcurrency]) -> None:
+    # Clients raise ProviderError carrying Retry-After (header or Gemini RetryInfo) when the API sent one
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after:
+        get_rate_limiter().block(reservation["key"], retry_after)
+    if adaptive is not None:
+        adaptive.on_error(_provider_group(t.get("provider")), started, error_class(e))
+
+
+def _cached_result(res: Dict[str, Any]) -> Dict[str, Any]:
+    # No call was made: no timing, so cache hits don't skew latency stats
+    return {"text": res.get("text") or "", "dur_ms": None, "err": None, "meta": {k: v for k, v in res.items() if k not in ("text", "latency", "hedge")}}
+
+
+def _configure_circuit(cfg: RunConfig) -> None:
+    c = cfg.concurrency.circuit
+    get_circuit_breaker().configure(c.enabled, c.failures, c.trip_on, c.open_s, c.max_open_s)
+
+
+def _deferred_result(key: str) -> Dict[str, Any]:
+    # Not an answer: run_targets queues the problem again instead of writing a row
+    return {"text": "", "dur_ms": None, "err": f"circuit open for {key}", "meta": {"error_class": "circuit_open", "deferred": True}}
+
+
+def _is_deferred(result: Dict[str, Any]) -> bool:
+    return bool((result.get("meta") or {}).get("deferred"))
+
+
+def _hedge_enabled(cfg: RunConfig, t: Dict[str, Any]) -> bool:
+    return bool(t.get("hedge") if t.get("hedge") is not None else cfg.concurrency.hedge.enabled)
+
+
+def _hedge_policy(cfg: RunConfig, targets: Iterable[Dict[str, Any]]) -> Optional[HedgePolicy]:
+    """Shared hedging policy for the hedged targets, seeded with their latencies from earlier runs (None if none hedge)."""
+    hedged = [t for t in _leaf_targets(targets) if _hedge_enabled(cfg, t)]
+    if not hedged:
+        return None
+    h = cfg.concurrency.hedge
+    policy = HedgePolicy(h.percentile, h.min_samples, h.budget, h.min_delay_ms / 1000.0, h.history)
+    for t in hedged:
+        # Every run of this target (the current one included, on resume) shares the path pattern apart from ${run}
+        pattern = _outpath_for(cfg, t, t.get("model"), "*")
+        try:
+            samples = read_latency_history(history_paths(pattern), h.history)
+        except Exception:
+            samples = []
+        # Oldest first so the newest survive the history cap
+        policy.seed(_target_key(t), reversed(samples))
+        delay = policy.delay_s(_target_key(t))
+        print(f"[hedge] {_target_key(t)}: {len(samples)} earlier latencies, " + (f"hedging after {delay * 1000:.0f} ms" if delay is not None else "waiting for more samples"))
+    return policy
+
+
+def _hedge_ticket(t: Dict[str, Any], hedge: Optional[HedgePolicy]) -> Any:
+    return hedge.ticket(_target_key(t)) if hedge is not None else None
+
+
+def _observe_hedge(t: Dict[str, Any], hedge: Optional[HedgePolicy], dur_ms: int, res: Dict[str, Any]) -> None:
+    if hedge is not None:
+        hedge.observe(_target_key(t), dur_ms)
+        hedge.record(res.get("hedge"))
+
+
+def _call_once(cfg: RunConfig, t: Dict[str, Any], prompt: str, sysprompt: Optional[str], adaptive: Optional[AdaptiveConcurrency], hedge: Optional[HedgePolicy], prefix: Optional[str], n: int = 1) -> Dict[str, Any]:
+    """One API request (n samples when n > 1), through the cache, rate limiter and retries."""
+    attempts = 0
+    kwargs = _chat_kwargs(cfg, t, prompt, sysprompt, prefix, n)
+    # Cache hits skip the rate limiter entirely
+    hit = cached_chat(**kwargs)
+    if hit is not None:
+        return _cached_result(hit)
+    limiter = get_rate_limiter()
+    breaker = get_circuit_breaker()
+    while True:
+        reservation = _rate_limit_reservation(kwargs)
+        if not breaker.allow(reservation["key"]):
+            return _deferred_result(reservation["key"])
+        limiter.acquire(reservation["key"], reservation["tokens"])
+        started = time.monotonic()
+        try:
+            start = time.time()
+            res = run_chat(**kwargs, stream=_stream_enabled(cfg, t), hedge=_hedge_ticket(t, hedge), deadline=_deadline(cfg, t))
+            breaker.record_success(reservation["key"])
+            if res.get("cached"):
+                # Answered by an identical request already in flight
+                limiter.refund(reservation["key"], reservation["tokens"])
+                return _cached_result(res)
+            dur_ms = int((time.time() - start) * 1000)
+            _rate_limit_observe(kwargs, reservation, res.get("usage"))
+            _observe_success(t, reservation, started, dur_ms / 1000.0, res, adaptive)
+            _observe_hedge(t, hedge, dur_ms, res)
+            return {"text": res.get("text") or "", "dur_ms": dur_ms, "err": None, "meta": {k: v for k, v in res.items() if k != "text"}}
+        except Exception as e:
+            _observe_failure(t, reservation, started, e, adaptive)
+            attempts += 1
+            if breaker.record_failure(reservation["key"], error_class(e)):
+                # The model is down: no point in the rest of the retry ladder
+                return _deferred_result(reservation["key"])
+            wait_s = _retry_wait(cfg, attempts, e)
+            if wait_s is None:
+                return {"text": "", "dur_ms": None, "err": str(e), "meta": {"error_class": error_class(e), "attempts": attempts}}
+            get_run_metrics().retry(reservation["key"])
+            time.sleep(wait_s)
+
+
+async def _acall_once(cfg: RunConfig, t: Dict[str, Any], prompt: str, sysprompt: Optional[str], adaptive: Optional[AdaptiveConcurrency], hedge: Optional[HedgePolicy], prefix: Optional[str], n: int = 1) -> Dict[str, Any]:
+    """Asyncio counterpart of _call_once; limiter and backoff waits yield to the event loop."""
+    attempts = 0
+    kwargs = _chat_kwargs(cfg, t, prompt, sysprompt, prefix, n)
+    hit = cached_chat(**kwargs)
+    if hit is not None:
+        return _cached_result(hit)
+    limiter = get_rate_limiter()
+    breaker = get_circuit_breaker()
+    while True:
+        reservation = _rate_limit_reservation(kwargs)
+        if not breaker.allow(reservation["key"]):
+            return _deferred_result(reservation["key"])
+        await limiter.aacquire(reservation["key"], reservation["tokens"])
+        started = time.monotonic()
+        try:
+            start = time.time()
+            res = await arun_chat(**kwargs, stream=_stream_enabled(cfg, t), hedge=_hedge_ticket(t, hedge), deadline=_deadline(cfg, t))
+            breaker.record_success(reservation["key"])
+            if res.get("cached"):
+                limiter.refund(reservation["key"], reservation["tokens"])
+                return _cached_result(res)
+            dur_ms = int((time.time() - start) * 1000)
+            _rate_limit_observe(kwargs, reservation, res.get("usage"))
+            _observe_success(t, reservation, started, dur_ms / 1000.0, res, adaptive)
+            _observe_hedge(t, hedge, dur_ms, res)
+            return {"text": res.get("text") or "", "dur_ms": dur_ms, "err": None, "meta": {k: v for k, v in res.items() if k != "text"}}
+        except Exception as e:
+            _observe_failure(t, reservation, started, e, adaptive)
+            attempts += 1
+            if breaker.record_failure(reservation["key"], error_class(e)):
+                # The model is down: no point in the rest of the retry ladder
+                return _deferred_result(reservation["key"])
+            wait_s = _retry_wait(cfg, attempts, e)
+            if wait_s is None:
+                return {"text": "", "dur_ms": None, "err": str(e), "meta": {"error_class": error_class(e), "attempts": attempts}}
+            get_run_metrics().retry(reservation["key"])
+            await asyncio.sleep(wait_s)
+
+
+def _sample_target(t: Dict[str, Any], j: int) -> Dict[str, Any]:
+    """Target for the j-th of several samples of one prompt: a distinct seed keeps the response cache from merging them."""
+    if j == 0:
+        return t
+    return dict(t, seed=(t.get("seed") or 0) + j)
+
+
+def _sample_count(t: Dict[str, Any]) -> int:
+    n = int(t.get("samples") or 1)
+    if n < 1:
+        raise ValueError(f"target {t.get('provider')}:{t.get('model')} has samples={n}; it must be at least 1")
+    return n
+
+
+def _candidate_results(res: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One call result per sample of an n-sample request; the request's meta stays on the first."""
+    if res.get("err"):
+        return [res]
+    meta = dict(res.get("meta") or {})
+    texts = meta.pop("candidates", None) or [res.get("text") or ""]
+    return [{"text": text or "", "dur_ms": res.get("dur_ms"), "err": None, "meta": (meta if i == 0 else {})} for i, text in enumerate(texts)]
+
+
+def _sum_usage(usages: Iterable[Any]) -> Optional[Dict[str, Any]]:
+    total: Dict[str, Any] = {}
+    for u in usages:
+        for k, v in (u or {}).items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                total[k] = (total.get(k) or 0) + v
+            else:
+                total.setdefault(k, v)
+    return total or None
+
+
+def _vote_result(cfg: RunConfig, results: List[Dict[str, Any]], mode: str) -> Dict[str, Any]:
+    """Majority vote over samples of one prompt; an answer without a strict majority votes unclear (2).
+
+    The majority is over the answered samples, unclear ones included, so one
+    yes among four unclear answers is unclear. meta.vote holds the answer,
+    votes per parsed answer [yes, no, unclear], the margin (the answer's lead
+    over the runner-up, over the answered samples; 0 without a majority) and
+    every sample.
+    """
+    answers = [_answer_of(cfg, r) for r in results]
+    answered = [a for r, a in zip(results, answers) if not r.get("err")]
+    votes = [answered.count(0), answered.count(1), answered.count(2)]
+    top = max(range(3), key=lambda a: votes[a])
+    answer = top if votes[top] * 2 > len(answered) else 2
+    runner_up = max(v for a, v in enumerate(votes) if a != answer)
+    margin = (max(0, votes[answer] - runner_up) / len(answered)) if answered else None
+    chosen = next((r for r, a in zip(results, answers) if a == answer and not r.get("err")), results[0])
+    meta = dict(chosen.get("meta") or {})
+    if mode == "candidates":
+        # One request: its usage and raw response are on the first sample
+        meta = dict(results[0].get("meta") or {})
+    else:
+        meta["usage"] = _sum_usage((r.get("meta") or {}).get("usage") for r in results)
+    durations = [r.get("dur_ms") for r in results if isinstance(r.get("dur_ms"), int)]
+    meta["vote"] = {
+        "answer": answer,
+        "votes": votes,
+        "margin": margin,
+        "mode": mode,
+        "samples": [
+            {
+                "text": r.get("text") or "",
+                "answer": a,
+                "error": r.get("err"),
+                **({"usage": (r.get("meta") or {}).get("usage")} if mode == "requests" else {}),
+            }
+            for r, a in zip(results, answers)
+        ],
+    }
+    return {
+        "text": (chosen.get("text") or "") if answered else "",
+        # Samples run side by side: the row waits for the slowest
+        "dur_ms": (max(durations) if durations else None),
+        "err": (None if answered else results[0].get("err")),
+        "meta": meta,
+    }
+
+
+def _answer_of(cfg: RunConfig, result: Dict[str, Any]) -> int:
+    """parse_output of a call result as _commit_result will parse it (2 for errors)."""
+    if result.get("err"):
+        return 2
+    text = result.get("text") or ""
+    parsed = parse_output(text, cfg.parse)
+    raw = (result.get("meta") or {}).get("raw_response")
+    if parsed == 2 and not text and isinstance(raw, (dict, str)):
+        extracted = _extract_raw_text(raw)
+        if extracted:
+            parsed = parse_output(extracted, cfg.parse)
+    return parsed
+
+
+def _escalation_reason(cfg: RunConfig, results: List[Dict[str, Any]]) -> Optional[str]:
+    """Why a cascade stage's answer is not accepted, or None to accept it."""
+    if any(r.get("err") for r in results):
+        return "error"
+    answers = [_answer_of(cfg, r) for r in results]
+    if 2 in answers:
+        return "unclear"
+    if len(set(answers)) > 1:
+        return "disagree"
+    return None
+
+
+def _cascade_result(cfg: RunConfig, stages: List[Tuple[Dict[str, Any], List[Dict[str, Any]], Optional[str]]]) -> Dict[str, Any]:
+    """Fold the calls of every stage tried into one result answered by the last of them."""
+    stage_t, results, _ = stages[-1]
+    final = results[0]
+    # Stages run one after another and a stage's samples side by side: the row waits for each stage's slowest
+    durations = [max((d for d in (r.get("dur_ms") for r in rs) if isinstance(d, int)), default=None) for _, rs, _ in stages]
+    escalations = [
+        {
+            "stage": i,
+            "provider": st.get("provider"),
+            "model": st.get("model"),
+            "reason": reason,
+            "answers": [_answer_of(cfg, r) for r in rs],
+            "usage": [(r.get("meta") or {}).get("usage") for r in rs],
+        }
+        for i, (st, rs, reason) in enumerate(stages[:-1])
+    ]
+    meta = dict(final.get("meta") or {})
+    meta["cascade"] = {
+        "stage": len(stages) - 1,
+        "provider": stage_t.get("provider"),
+        "model": stage_t.get("model"),
+        "escalations": escalations,
+    }
+    return {
+        "text": final.get("text") or "",
+        "dur_ms": (sum(d for d in durations if isinstance(d, int)) if any(isinstance(d, int) for d in durations) else None),
+        "err": final.get("err"),
+        "meta": meta,
+    }
+
+
+def _plan_target(cfg: RunConfig, t: Dict[str, Any]) -> Plan:
+    """The scheduler plan of one problem for ``t``: its calls, step by step, then the row's result."""
+    if _is_cascade(t):
+        return _plan_cascade(cfg, t)
+    return _plan_samples(cfg, t)
+
+
+def _plan_samples(cfg: RunConfig, t: Dict[str, Any]) -> Plan:
+    """Calls of a leaf target as (target, n) units; with `samples` > 1, self-consistency.
+
+    Samples come from one request with n candidates where the API offers it
+    (supports_candidates), otherwise from n requests with seeds seed, seed+1,
+    ... (as cascade consistency samples), each one a scheduled call through
+    the rate limiter and retries. The answers are majority-voted.
+    """
+    n = _sample_count(t)
+    buckets = _scheduler_buckets(t)
+    if n == 1:
+        results = yield [((t, 1), buckets)]
+        return results[0]
+    if supports_candidates(t.get("provider"), t.get("model")):
+        results = yield [((t, n), buckets)]
+        res = results[0]
+        return res if _is_deferred(res) else _vote_result(cfg, _candidate_results(res), "candidates")
+    results = yield [((_sample_target(t, j), 1), buckets) for j in range(n)]
+    # A deferred sample defers the whole prompt: the vote needs all of them
+    return next((r for r in results if _is_deferred(r)), None) or _vote_result(cfg, results, "requests")
+
+
+def _plan_all(plans: List[Plan]) -> Plan:
+    """Run several plans side by side: each step yields the calls of every plan still running."""
+    results: List[Any] = [None] * len(plans)
+    steps = {i: next(p) for i, p in enumerate(plans)}
+    while steps:
+        order = list(steps.items())
+        got = yield [c for _, calls in order for c in calls]
+        pos = 0
+        for i, calls in order:
+            try:
+                steps[i] = plans[i].send(got[pos:pos + len(calls)])
+            except StopIteration as done:
+                del steps[i]
+                results[i] = done.value
+            pos += len(calls)
+    return results
+
+
+def _plan_cascade(cfg: RunConfig, t: Dict[str, Any]) -> Plan:
+    """Ask each stage in turn until one answers clearly (and consistently); the last stage always answers.
+
+    A stage's consistency samples run side by side as one step, so a problem
+    only ever holds the slots of the stage it is asking.
+    """
+    tried: List[Tuple[Dict[str, Any], List[Dict[str, Any]], Optional[str]]] = []
+    for stage in t["stages"]:
+        n = max(1, int(stage.get("consistency") or 1))
+        results = yield from _plan_all([_plan_target(cfg, _sample_target(stage, j)) for j in range(n)])
+        deferred = next((r for r in results if _is_deferred(r)), None)
+        if deferred:
+            # A stage whose model is down defers the prompt rather than escalating past it
+            return deferred
+        reason = _escalation_reason(cfg, results)
+        tried.append((stage, results, reason))
+        if reason is None:
+            break
+    return _cascade_result(cfg, tried)
+
+
+def _drive_threads(scheduler: LockstepScheduler, call: Callable[[str, int, Any], Dict[str, Any]], commit: Callable[[str, int, Dict[str, Any]], None]) -> None:
+    """Run scheduler calls on a long-lived thread pool sized to the in-flight cap."""
+    with ThreadPoolExecutor(max_workers=scheduler.max_in_flight) as executor:
+        future_to_task: Dict[Any, Any] = {}
+        while not scheduler.finished():
+            for k, idx, call_id, unit in scheduler.next_tasks():
+                future_to_task[executor.submit(call, k, idx, unit)] = (k, idx, call_id)
+            if not future_to_task:
+                break
+            done, _ = wait(list(future_to_task), return_when=FIRST_COMPLETED)
+            for fut in done:
+                k, idx, call_id = future_to_task.pop(fut)
+                for ready_idx, result in scheduler.complete(k, idx, call_id, fut.result()):
+                    commit(k, ready_idx, result)
+
+
+async def _drive_asyncio(scheduler: LockstepScheduler, acall: Callable[[str, int, Any], Awaitable[Dict[str, Any]]], commit: Callable[[str, int, Dict[str, Any]], None]) -> None:
+    """Run scheduler calls as coroutines on one event loop; in-flight calls hold no OS thread."""
+    task_to_key: Dict[Any, Any] = {}
+    try:
+        while not scheduler.finished():
+            for k, idx, call_id, unit in scheduler.next_tasks():
+                task_to_key[asyncio.ensure_future(acall(k, idx, unit))] = (k, idx, call_id)
+            if not task_to_key:
+                break
+            done, _ = await asyncio.wait(list(task_to_key), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                k, idx, call_id = task_to_key.pop(task)
+                for ready_idx, result in scheduler.complete(k, idx, call_id, task.result()):
+                    commit(k, ready_idx, result)
+    finally:
+        for task in task_to_key:
+            task.cancel()
+        await aclose_async_client()
+
+
+def _in_flight_caps(cfg: RunConfig, targets: Iterable[Dict[str, Any]]) -> Tuple[int, Optional[AdaptiveConcurrency]]:
+    """The run's in-flight cap (`workers`, default one per target) and the per-provider AIMD limits, if enabled."""
+    targets = list(targets)
+    max_workers = cfg.concurrency.workers if (cfg.concurrency and cfg.concurrency.workers) else len(targets)
+    if not cfg.concurrency.adaptive.enabled:
+        return max_workers, None
+    # Per-provider AIMD caps replace the fixed global `workers` cap
+    a = cfg.concurrency.adaptive
+    adaptive = AdaptiveConcurrency(
+        initial=(a.initial_workers or max_workers),
+        min_limit=a.min_workers,
+        max_limit=a.max_workers,
+        increase=a.increase,
+        decrease=a.decrease,
+        latency_factor=a.latency_factor,
+    )
+    n_providers = len({_provider_group(t.get("provider")) for t in targets})
+    return adaptive.max_limit * n_providers, adaptive
+
+
+def _new_scheduler(
     cfg: RunConfig,
+    key_to_target: Dict[str, Dict[str, Any]],
+    pending: Dict[str, List[int]],
+    window: int,
+    max_workers: int,
+    adaptive: Optional[AdaptiveConcurrency],
+    feed: Optional[Callable[[str], Optional[int]]] = None,
+) -> LockstepScheduler:
+    return LockstepScheduler(
+        pending,
+        window=window,
+        max_in_flight=max_workers,
+        bucket_limit=_bucket_limits(cfg, adaptive),
+        weights={k: _target_weight(t) for k, t in key_to_target.items()},
+        # Each call of a problem (cascade stage, consistency sample) is scheduled on its own
+        plan=lambda k, idx: _plan_target(cfg, key_to_target[k]),
+        feed=feed,
+    )
+
+
+def _run_engine(
+    cfg: RunConfig,
+    scheduler: LockstepScheduler,
+    prompt_for: Callable[[str, int], str],
+    prefix_for: Callable[[str, int], Optional[str]],
+    sysprompt: Optional[str],
+    adaptive: Optional[AdaptiveConcurrency],
+    hedge: Optional[HedgePolicy],
+    commit: Callable[[str, int, Dict[str, Any]], None],
+) -> None:
+    """Make every call the scheduler hands out on the configured engine (concurrency.engine)."""
+    if cfg.concurrency.engine == "asyncio":
+        async def acall(k: str, idx: int, unit: Tuple[Dict[str, Any], int]) -> Dict[str, Any]:
+            return await _acall_once(cfg, unit[0], prompt_for(k, idx), sysprompt, adaptive, hedge, prefix_for(k, idx), unit[1])
+
+        asyncio.run(_drive_asyncio(scheduler, acall, commit))
+    else:
+        _drive_threads(scheduler, lambda k, idx, unit: _call_once(cfg, unit[0], prompt_for(k, idx), sysprompt, adaptive, hedge, prefix_for(k, idx), unit[1]), commit)
+
+
+def _new_stats(t: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "total": 0,
+        "correct": 0,
+        "unclear": 0,
+        "sat_total": 0,
+        "sat_correct": 0,
+        "unsat_total": 0,
+        "unsat_correct": 0,
+        "timing_sum": 0,
+        "timing_count": 0,
+        # Streamed calls only (see result["latency"])
+        "ttft_sum": 0,
+        "ttft_count": 0,
+        "ttlt_sum": 0,
+        "ttlt_count": 0,
+        "tps_sum": 0.0,
+        "tps_count": 0,
+        "hedged": 0,
+        "hedge_wins": 0,
+        "provider": t.get("provider"),
+        "model": t.get("model"),
+    }
+
+
+def _update_stats(s: Dict[str, Any], problem: List[Any], row: ResultRow, latency: Optional[Dict[str, Any]] = None, hedge: Optional[str] = None) -> None:
+    s["total"] += 1
+    if row.correct:
+        s["correct"] += 1
+    if row.parsed_answer == 2:
+        s["unclear"] += 1
+    if row.error:
+        errors = s.setdefault("errors", {})
+        errors[row.error_class or "error"] = errors.get(row.error_class or "error", 0) + 1
+    try:
+        sf = int(problem[4])
+        if sf == 1:
+            s["sat_total"] += 1
+            if row.correct:
+                s["sat_correct"] += 1
+        elif sf == 0:
+            s["unsat_total"] += 1
+            if row.correct:
+                s["unsat_correct"] += 1
+    except Exception:
+        pass
+    if isinstance(row.timing_ms, int):
+        s["timing_sum"] += row.timing_ms
+        s["timing_count"] += 1
+    for field, prefix in (("ttft_ms", "ttft"), ("ttlt_ms", "ttlt"), ("output_tokens_per_s", "tps")):
+        v = (latency or {}).get(field)
+        if isinstance(v, (int, float)):
+            s[prefix + "_sum"] += v
+            s[prefix + "_count"] += 1
+    if hedge:
+        s["hedged"] += 1
+        if hedge == "hedge":
+            s["hedge_wins"] += 1
+    if row.pack_position == 0:
+        s["pack_requests"] = s.get("pack_requests", 0) + 1
+    if row.votes is not None:
+        s["voted"] = s.get("voted", 0) + 1
+        s["samples"] = max(s.get("samples", 0), sum(row.votes))
+        if row.vote_margin is not None:
+            s["vote_margin_sum"] = s.get("vote_margin_sum", 0.0) + row.vote_margin
+            s["unanimous"] = s.get("unanimous", 0) + int(row.vote_margin == 1)
+    if row.cascade_stage is not None:
+        stages = s.setdefault("cascade_stages", {})
+        stages[str(row.cascade_stage)] = stages.get(str(row.cascade_stage), 0) + 1
+
+
+def _sampling_enabled(cfg: RunConfig) -> bool:
+    return cfg.sampling.order == "stratified" or cfg.sampling.stop_ci_width is not None
+
+
+def _new_sampling(cfg: RunConfig, outpath: str) -> SamplingTracker:
+    tracker = SamplingTracker(cfg.sampling.confidence, cfg.sampling.stop_ci_width, cfg.sampling.min_samples)
+    if cfg.resume:
+        tracker.seed_from_results(outpath)
+    return tracker
+
+
+def _log_sampling_stop(k: str, tracker: SamplingTracker, dropped: int) -> None:
+    lo, hi = tracker.ci()
+    print(f"[sampling] {k}: stopping after {tracker.n} problems, accuracy {tracker.correct / tracker.n:.3f} "
+          f"[{lo:.3f}, {hi:.3f}] at {tracker.confidence:.0%}; {dropped} problems skipped")
+
+
+def _write_summary(
+    cfg: RunConfig,
+    outpath: str,
+    s: Dict[str, Any],
+    run_id: Optional[str],
+    sampling: Optional[SamplingTracker] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> None:
+    base, ext = os.path.splitext(outpath)
+    summary_path = base + ".summary.json" if ext else outpath + ".summary.json"
+    ensure_dir(summary_path)
+    avg_timing = (s["timing_sum"] / s["timing_count"]) if s["timing_count"] > 0 else None
+    summary = {
+        "name": cfg.name,
+        "provider": s["provider"],
+        "model": s["model"],
+        "run": run_id,
+        "total": s["total"],
+        "correct": s["correct"],
+        "accuracy": (s["correct"] / s["total"]) if s["total"] > 0 else None,
+        "unclear": s["unclear"],
+        "sat_total": s["sat_total"],
+        "sat_correct": s["sat_correct"],
+        "sat_accuracy": (s["sat_correct"] / s["sat_total"]) if s["sat_total"] > 0 else None,
+        "unsat_total": s["unsat_total"],
+        "unsat_correct": s["unsat_correct"],
+        "unsat_accuracy": (s["unsat_correct"] / s["unsat_total"]) if s["unsat_total"] > 0 else None,
+        "avg_timing_ms": avg_timing,
+        "avg_ttft_ms": (s["ttft_sum"] / s["ttft_count"]) if s["ttft_count"] > 0 else None,
+        "avg_ttlt_ms": (s["ttlt_sum"] / s["ttlt_count"]) if s["ttlt_count"] > 0 else None,
+        "avg_output_tokens_per_s": (s["tps_sum"] / s["tps_count"]) if s["tps_count"] > 0 else None,
+        "hedged": s["hedged"],
+        "hedge_wins": s["hedge_wins"],
+        "timestamp": int(time.time()),
+    }
+    if s.get("pack_requests"):
+        summary["pack_size"] = cfg.prompt.pack_size
+        summary["pack_requests"] = s["pack_requests"]
+    if s.get("deferred"):
+        # Calls short-circuited by an open circuit; unresolved problems have no row yet (--resume)
+        summary["deferred"] = s["deferred"]
+        summary["deferred_unresolved"] = s.get("deferred_unresolved", 0)
+    if s.get("errors"):
+        # Failed rows by error_class (after retries)
+        summary["errors"] = dict(sorted(s["errors"].items()))
+    if s.get("voted"):
+        summary["samples"] = s["samples"]
+        summary["avg_vote_margin"] = s.get("vote_margin_sum", 0.0) / s["voted"]
+        summary["unanimous"] = s.get("unanimous", 0)
+    if s.get("cascade_stages"):
+        # Rows answered per cascade stage (0 = first); the rest escalated
+        summary["cascade_stages"] = s["cascade_stages"]
+    if cfg.filters.shard:
+        summary["shard"] = cfg.filters.shard
+    if sampling is not None:
+        # Over every row in the results file, including those from before a resume
+        summary["sampling"] = sampling.snapshot()
+    if extra:
+        summary.update(extra)
+    write_json_atomic(summary_path, summary, fsync=(cfg.outputs.writer.fsync != "never"))
+
+
+def _fill_deferred_visible_tokens(cfg: RunConfig, targets_and_paths: Iterable[Any]) -> None:
+    """visible_tokens: deferred — count Anthropic visible tokens in the provenance files once the run is done."""
+    if cfg.visible_tokens != "deferred":
+        return
+    paths = [p for t, p in targets_and_paths if p and (t.get("provider") or "").lower() == "anthropic"]
+    if not paths:
+        return
+    try:
+        from .visible_tokens import fill_visible_tokens
+    except Exception:
+        from experiments.visible_tokens import fill_visible_tokens
+    try:
+        n = fill_visible_tokens(paths)
+        print(f"[visible_tokens] counted visible tokens for {n} rows")
+    except Exception as e:
+        print(f"[visible_tokens] deferred counting failed ({e}); re-run: python -m experiments.visible_tokens <provenance files>")
+
+
+def _start_metrics(cfg: RunConfig, keys: Iterable[str]) -> Optional[MetricsServer]:
+    """Reset the run metrics and, with metrics.enabled, serve them over HTTP until close()."""
+    m = cfg.metrics
+    metrics = get_run_metrics()
+    metrics.reset(m.latency_samples)
+    for k in keys:
+        metrics.add_target(k)
+    if not m.enabled:
+        return None
+    try:
+        server = MetricsServer(metrics, m.host, m.port)
+    except OSError as e:
+        raise RuntimeError(f"metrics: cannot listen on {m.host}:{m.port} ({e})") from e
+    print(f"[metrics] serving {server.url}/metrics and {server.url}/metrics.json")
+    return server
+
+
+def _new_writer(cfg: RunConfig) -> OutputWriter:
+    w = cfg.outputs.writer
+    return OutputWriter(
+        queue_size=w.queue_size,
+        flush_rows=w.flush_rows,
+        flush_bytes=w.flush_bytes,
+        flush_interval_s=w.flush_interval_seconds,
+        fsync=w.fsync,
+    )
+
+
+def _expand_targets(
     targets: List[Dict[str, Any]],
     only_providers: Optional[List[str]] = None,
     model_overrides: Optional[Dict[str, List[str]]] = None,
-    dry_run: bool = False,
-    run_id: Optional[str] = None,
-) -> None:
-    # Read and filter problems once
-    rows_iter = read_jsonl_rows(cfg.input_file)
-    rows_iter = apply_filters(rows_iter, cfg)
-    problems = list(rows_iter)
-
-    base_tmpl = read_text(cfg.prompt.template)
-
+) -> List[Dict[str, Any]]:
     # Expand targets x models taking overrides into account and apply provider filter
     expanded: List[Dict[str, Any]]
     expanded = []
@@ -268,679 +1252,431 @@ def run_targets_lockstep(
         for m in models:
             nt = dict(t)
             nt["model"] = m
-            # Include thinking config in dedup key to allow same model with/without thinking
-            thinking_cfg = nt.get("thinking", {})
-            thinking_enabled = thinking_cfg.get("enabled", False) if thinking_cfg else False
-            thinking_budget = thinking_cfg.get("budget_tokens", 0) if thinking_cfg else 0
-            thinking_effort = thinking_cfg.get("effort", "") if thinking_cfg else ""
-            k = f"{nt.get('provider')}::{m}::think={thinking_enabled}::budget={thinking_budget}::effort={thinking_effort}"
+            k = _target_key(nt)
             if k in seen_provider_model:
                 continue
             seen_provider_model.add(k)
+            if _is_cascade(nt):
+                nt["stages"] = _cascade_stages(nt)
             # Validate per-target config before expanding
-            _validate_target_config(
-                provider=nt.get("provider"),
-                model=nt.get("model"),
-                temperature=nt.get("temperature"),
-                max_tokens=nt.get("max_tokens"),
-                thinking=nt.get("thinking"),
-            )
+            for unit in _leaf_targets([nt]):
+                _sample_count(unit)
+                _validate_target_config(
+                    provider=unit.get("provider"),
+                    model=unit.get("model"),
+                    temperature=unit.get("temperature"),
+                    max_tokens=unit.get("max_tokens"),
+                    thinking=unit.get("thinking"),
+                )
             expanded.append(nt)
+    return expanded
+
+
+def _is_cascade(t: Dict[str, Any]) -> bool:
+    return (t.get("provider") or "").lower() == "cascade"
+
+
+def _cascade_stages(t: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Stage targets of a cascade; unset call settings are inherited from the cascade entry."""
+    stages = t.get("stages") or []
+    if not stages:
+        raise RuntimeError(f"cascade target {t.get('model')!r} needs a non-empty stages: list")
+    out: List[Dict[str, Any]] = []
+    for stage in stages:
+        s = dict(stage)
+        if _is_cascade(s):
+            raise RuntimeError("cascade stages cannot be cascades themselves")
+        for key in ("temperature", "seed", "max_tokens", "stream", "timeouts", "hedge", "rate_limit_per_min", "tokens_per_min"):
+            if s.get(key) is None and t.get(key) is not None:
+                s[key] = t[key]
+        out.append(s)
+    return out
+
+
+def _leaf_targets(targets: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Targets that make API calls: cascade entries are replaced by their stages."""
+    out: List[Dict[str, Any]] = []
+    for t in targets:
+        out.extend(t["stages"] if _is_cascade(t) else [t])
+    return out
+
+
+def _provenance_path(outpath: str) -> str:
+    base, ext = os.path.splitext(outpath)
+    return (base + ".provenance.jsonl" if ext else outpath + ".provenance.jsonl")
+
+
+def _open_checkpoint(cfg: RunConfig, outpath: str, responses_path: Optional[str] = None) -> ResultsCheckpoint:
+    """Index of ids already in outpath; also cuts torn final lines off the files we append to."""
+    if responses_path:
+        truncate_torn_tail(responses_path)
+    return ResultsCheckpoint(outpath)
+
+
+def _processed_ids(cfg: RunConfig, checkpoint: ResultsCheckpoint) -> set:
+    # resume support: ids already present in the results file
+    return set(checkpoint.ids) if cfg.resume else set()
+
+
+def _commit_result(
+    cfg: RunConfig,
+    t: Dict[str, Any],
+    problem: List[Any],
+    pid: Any,
+    prompt: str,
+    result: Dict[str, Any],
+    outpath: str,
+    responses_path: Optional[str],
+    stats: Dict[str, Any],
+    writer: OutputWriter,
+    checkpoint: Optional[ResultsCheckpoint] = None,
+    prompt_hash: Optional[str] = None,
+) -> ResultRow:
+    """Parse one call result, append its results/provenance rows and update stats."""
+    text = result["text"]
+    dur_ms = result["dur_ms"]
+    err_msg = result["err"]
+    resp_meta = result.get("meta") or {}
+    latency = resp_meta.get("latency") or {}
+
+    # Parse and derive normalized token from parsed result
+    # Retry parse if text empty: attempt to extract from raw_response
+    vote = resp_meta.get("vote") or {}
+    if not err_msg and vote:
+        # Sampled targets: the majority vote is the answer (text is one sample that gave it)
+        parsed = vote["answer"]
+    elif not err_msg:
+        parsed = parse_output(text, cfg.parse)
+        # Not for packed rows: the raw response holds every problem's answer
+        if (parsed == 2) and (not text) and not resp_meta.get("pack") and isinstance(resp_meta.get("raw_response"), (dict, str)):
+            extracted = _extract_raw_text(resp_meta.get("raw_response"))
+            if extracted:
+                text = extracted
+                parsed = parse_output(text, cfg.parse)
+    else:
+        parsed = 2
+    norm = ("yes" if parsed == 0 else ("no" if parsed == 1 else None))
+    gt = None
+    try:
+        satflag = int(problem[4])
+        gt = (parsed == satflag)
+    except Exception:
+        gt = None
+
+    row = ResultRow(
+        id=pid,
+        meta=_problem_meta(problem),
+        provider=t.get("provider"),
+        model=t.get("model"),
+        prompt=None,
+        prompt_template=None,
+        completion_text=(norm if (norm is not None) else (text if (cfg.save_response and not err_msg) else None)),
+        normalized_text=norm,
+        raw_response=resp_meta.get("raw_response"),
+        finish_reason=resp_meta.get("finish_reason"),
+        usage=resp_meta.get("usage"),
+        parsed_answer=parsed,
+        correct=gt,
+        timing_ms=dur_ms,
+        seed=(t.get("seed") if t.get("seed") is not None else cfg.seed),
+        temperature=(t.get("temperature") if t.get("temperature") is not None else cfg.temperature),
+        error=err_msg,
+        error_class=(resp_meta.get("error_class") or _classify_error(err_msg)) if err_msg else None,
+        cascade_stage=(resp_meta.get("cascade") or {}).get("stage"),
+        pack_position=(resp_meta.get("pack") or {}).get("position"),
+        votes=vote.get("votes"),
+        vote_margin=vote.get("margin"),
+    )
+    # Write minimal results row for statistical analysis
+    if cfg.outputs.results.enabled:
+        minimal = {
+            "id": row.id,
+            "meta": row.meta.model_dump(),
+            "parsed_answer": row.parsed_answer,
+        }
+        if row.cascade_stage is not None:
+            minimal["cascade_stage"] = row.cascade_stage
+        if row.pack_position is not None:
+            minimal["pack_position"] = row.pack_position
+        if row.votes is not None:
+            minimal["votes"] = row.votes
+            minimal["vote_margin"] = row.vote_margin
+        # The checkpoint learns about the row once it has reached the file
+        writer.write(outpath, json.dumps(minimal), (lambda offset: checkpoint.add(pid, offset)) if checkpoint is not None else None)
+    # Write full responses if enabled
+    if responses_path:
+        full_out = {
+            "id": pid,
+            "provider": t.get("provider"),
+            "model": t.get("model"),
+            "prompt": prompt if cfg.outputs.provenance.include_prompt else None,
+            "prompt_template": cfg.prompt.template,
+            "full_text": text,
+            "raw_response": (resp_meta.get("raw_response") if cfg.outputs.provenance.include_raw_response else None),
+            "finish_reason": resp_meta.get("finish_reason"),
+            "usage": resp_meta.get("usage"),
+            "timing_ms": dur_ms,
+            "ttft_ms": latency.get("ttft_ms"),
+            "ttlt_ms": latency.get("ttlt_ms"),
+            "output_tokens_per_s": latency.get("output_tokens_per_s"),
+            "error": err_msg,
+        }
+        if prompt_hash:
+            full_out["prompt_sha256"] = prompt_hash
+        if result.get("batch_id"):
+            full_out["batch_id"] = result["batch_id"]
+        if err_msg:
+            full_out["error_class"] = row.error_class
+            full_out["attempts"] = resp_meta.get("attempts")
+        if resp_meta.get("cached"):
+            full_out["cached"] = True
+        if resp_meta.get("hedge"):
+            full_out["hedge"] = resp_meta["hedge"]
+        if resp_meta.get("cascade"):
+            full_out["cascade"] = resp_meta["cascade"]
+        if resp_meta.get("pack"):
+            full_out["pack"] = resp_meta["pack"]
+        if vote:
+            full_out["vote"] = {k: v for k, v in vote.items() if k != "samples"}
+            full_out["samples"] = vote.get("samples")
+        writer.write(responses_path, json.dumps(full_out))
+    _update_stats(stats, problem, row, latency, resp_meta.get("hedge"))
+    return row
+
+
+def run_targets(
+    cfg: RunConfig,
+    targets: List[Dict[str, Any]],
+    only_providers: Optional[List[str]] = None,
+    model_overrides: Optional[Dict[str, List[str]]] = None,
+    dry_run: bool = False,
+    run_id: Optional[str] = None,
+) -> None:
+    # Problems and prompts come from the process-wide store: loaded and rendered once for all targets
+    store = get_problem_store(cfg)
+    problems = store.problems
+    pids = store.pids
+
+    expanded = _expand_targets(targets, only_providers, model_overrides)
 
     if not expanded:
         return
+    pack_size = cfg.prompt.pack_size
+    if pack_size < 1:
+        raise ValueError(f"prompt.pack_size must be at least 1, got {pack_size}")
+    if pack_size > 1 and any(_is_cascade(t) for t in expanded):
+        raise RuntimeError("prompt.pack_size > 1 cannot be combined with cascade targets")
+    if pack_size > 1 and any(_sample_count(t) > 1 for t in _leaf_targets(expanded)):
+        raise RuntimeError("prompt.pack_size > 1 cannot be combined with targets that set samples")
+    _configure_rate_limits(cfg, expanded)
+    _configure_circuit(cfg)
 
     # Prepare per-(provider,model) outpaths, processed ids, and stats
+    key_to_target: Dict[str, Dict[str, Any]] = {}
     key_to_outpath: Dict[str, str] = {}
+    key_to_responses: Dict[str, str] = {}
     key_to_processed: Dict[str, set] = {}
+    key_to_checkpoint: Dict[str, ResultsCheckpoint] = {}
+    key_to_sampling: Dict[str, SamplingTracker] = {}
     stats: Dict[str, Dict[str, Any]] = {}
 
-    def key_for(t: Dict[str, Any]) -> str:
-        # Include thinking config to distinguish same model with different settings
-        thinking_cfg = t.get("thinking", {})
-        thinking_enabled = thinking_cfg.get("enabled", False) if thinking_cfg else False
-        thinking_budget = thinking_cfg.get("budget_tokens", 0) if thinking_cfg else 0
-        thinking_effort = thinking_cfg.get("effort", "") if thinking_cfg else ""
-        return f"{t.get('provider')}::{t.get('model')}::think={thinking_enabled}::budget={thinking_budget}::effort={thinking_effort}"
+    # Determine outputs settings (prefer unified outputs, fallback to legacy flags)
+    provenance_enabled = cfg.outputs.provenance.enabled
 
     for t in expanded:
-        k = key_for(t)
+        k = _target_key(t)
         if k in key_to_outpath:
             continue
+        key_to_target[k] = t
         outpath = _build_outpath(cfg, t, t.get("model"), run_id)
         key_to_outpath[k] = outpath
-        # Determine outputs settings (prefer unified outputs, fallback to legacy flags)
-        write_results = cfg.outputs.results.enabled
-        provenance_enabled = cfg.outputs.provenance.enabled
-        provenance_include_prompt = cfg.outputs.provenance.include_prompt
         # Optionally prepare a parallel responses (provenance) file path
         if provenance_enabled:
-            base, ext = os.path.splitext(outpath)
-            key_to_outpath[k + "::responses"] = (base + ".provenance.jsonl" if ext else outpath + ".provenance.jsonl")
-        processed_ids = set()
-        if cfg.resume and os.path.exists(outpath):
-            try:
-                with open(outpath, "r") as rf:
-                    for line in rf:
-                        try:
-                            obj = json.loads(line)
-                            processed_ids.add(obj.get("id"))
-                        except Exception:
-                            continue
-            except Exception:
-                pass
-        key_to_processed[k] = processed_ids
-        stats[k] = {
-            "total": 0,
-            "correct": 0,
-            "unclear": 0,
-            "sat_total": 0,
-            "sat_correct": 0,
-            "unsat_total": 0,
-            "unsat_correct": 0,
-            "timing_sum": 0,
-            "timing_count": 0,
-            "provider": t.get("provider"),
-            "model": t.get("model"),
-        }
+            key_to_responses[k] = _provenance_path(outpath)
+        key_to_checkpoint[k] = _open_checkpoint(cfg, outpath, key_to_responses.get(k))
+        key_to_processed[k] = _processed_ids(cfg, key_to_checkpoint[k])
+        stats[k] = _new_stats(t)
+        if _sampling_enabled(cfg) and not dry_run:
+            key_to_sampling[k] = _new_sampling(cfg, outpath)
 
     sysprompt = None
+    metrics_server = None if dry_run else _start_metrics(cfg, key_to_target)
+    metrics = get_run_metrics()
+    # All rows go through one writer thread: per-file batching, no interleaving across workers
+    writer = _new_writer(cfg)
 
-    # Per-problem lockstep
-    for idx, problem in enumerate(problems, start=1):
-        pid = problem[0] if isinstance(problem, list) and len(problem) > 0 else idx
-        # Inject unified instruction only for parse.type == both
-        if getattr(cfg.parse, "type", None) == "both":
-            inject = "\nUnified answer rule (mixed cases)\n- Regardless of how the statements are rendered, output only a final single word: \"yes\" if p0 is derivable OR the set is a contradiction; otherwise \"no\". Do not output any other words.\n"
-            tmpl = base_tmpl.replace("\n\nConventions", inject + "\nConventions")
-        elif getattr(cfg.parse, "type", None) == "yes_no" and cfg.prompt.style in (None, "horn_if_then"):
-            inject = "\nHorn answer rule\n- Output ONLY a single final word: \"yes\" if p0 is derivable, otherwise \"no\". Do not output any other words.\n"
-            tmpl = base_tmpl.replace("\n\nConventions", inject + "\nConventions")
-        else:
-            tmpl = base_tmpl
-        prompt = render_prompt(problem, tmpl, cfg.prompt.style)
-
-        # Build task list for keys that still need this pid
-        tasks: List[Dict[str, Any]] = []
-        for t in expanded:
-            k = key_for(t)
-            if pid in key_to_processed[k]:
-                continue
-            tasks.append({"target": t, "key": k})
-
-        # If dry-run: write placeholder rows immediately (no API calls)
+    try:
+        # If dry-run: write placeholder rows per problem (no API calls)
         if dry_run:
-            for t in expanded:
-                k = key_for(t)
-                if pid in key_to_processed[k]:
-                    continue
-                parsed = 2
-                gt = None
-                try:
-                    satflag = int(problem[4])
-                    gt = (parsed == satflag)
-                except Exception:
-                    gt = None
-                meta = ProblemMeta(
-                    maxvars=problem[1] if len(problem) > 1 else None,
-                    maxlen=problem[2] if len(problem) > 2 else None,
-                    horn=problem[3] if len(problem) > 3 else None,
-                    satflag=problem[4] if len(problem) > 4 else None,
-                    proof=problem[6] if len(problem) > 6 else None,
-                )
-                row = ResultRow(
-                    id=pid,
-                    meta=meta,
-                    provider=t.get("provider"),
-                    model=t.get("model"),
-                    prompt=prompt if cfg.save_prompt else None,
-                    completion_text=None,
-                    parsed_answer=parsed,
-                    correct=gt,
-                    timing_ms=0,
-                    seed=(t.get("seed") if t.get("seed") is not None else cfg.seed),
-                    temperature=(t.get("temperature") if t.get("temperature") is not None else cfg.temperature),
-                    error=None,
-                )
-                with open(key_to_outpath[k], "a") as of:
-                    of.write(row.model_dump_json() + "\n")
-                # Update stats
-                s = stats[k]
-                s["total"] += 1
-                if row.correct:
-                    s["correct"] += 1
-                if row.parsed_answer == 2:
-                    s["unclear"] += 1
-                try:
-                    sf = int(problem[4])
-                    if sf == 1:
-                        s["sat_total"] += 1
-                        if row.correct:
-                            s["sat_correct"] += 1
-                    elif sf == 0:
-                        s["unsat_total"] += 1
-                        if row.correct:
-                            s["unsat_correct"] += 1
-                except Exception:
-                    pass
-                s["timing_sum"] += 0
-                # no timing_count increment for 0? Keep consistent with run_target using ints only
-                s["timing_count"] += 1
-            continue
-
-        # Execute in parallel for this problem
-        if tasks:
-            max_workers = cfg.concurrency.workers if (cfg.concurrency and cfg.concurrency.workers) else len(tasks)
-            max_workers = max(1, min(max_workers, len(tasks)))
-
-            def call_one(t: Dict[str, Any]) -> Dict[str, Any]:
-                attempts = 0
-                err_msg = None
-                text = ""
-                dur_ms: Optional[int] = None
-                meta: Dict[str, Any] = {}
-                while True:
-                    try:
-                        start = time.time()
-                        # Prefer per-target thinking, fallback to global
-                        thinking_cfg = None
-                        try:
-                            if t.get("thinking") is not None:
-                                thinking_cfg = t.get("thinking")
-                            elif cfg.thinking is not None:
-                                thinking_cfg = cfg.thinking.model_dump(exclude_none=True)
-                        except Exception:
-                            thinking_cfg = None
-                        res = run_chat(
-                            provider=t.get("provider"),
-                            model=t.get("model"),
-                            prompt=prompt,
-                            sysprompt=sysprompt,
-                            max_tokens=(t.get("max_tokens") or cfg.max_tokens),
-                            temperature=(t.get("temperature") if t.get("temperature") is not None else (cfg.temperature or 0.0)),
-                            seed=(t.get("seed") if t.get("seed") is not None else cfg.seed),
-                            thinking=thinking_cfg,
-                        )
-                        dur_ms = int((time.time() - start) * 1000)
-                        err_msg = None
-                        text = res.get("text") or ""
-                        meta = {k: v for k, v in res.items() if k != "text"}
-                        break
-                    except Exception as e:
-                        attempts += 1
-                        err_msg = str(e)
-                        max_attempts = (cfg.concurrency.retry.max_attempts if cfg.concurrency and cfg.concurrency.retry else 3)
-                        backoff = (cfg.concurrency.retry.backoff_seconds if cfg.concurrency and cfg.concurrency.retry else [2, 5, 10])
-                        # Fast-fail for non-retriable? Keep generic for now
-                        if attempts >= max_attempts:
-                            text = ""
-                            break
-                        wait_s = backoff[min(attempts - 1, len(backoff) - 1)]
-                        time.sleep(wait_s)
-                return {"text": text, "dur_ms": dur_ms, "err": err_msg, "meta": meta}
-
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_key = {}
-                for item in tasks:
-                    t = item["target"]
-                    k = item["key"]
-                    future = executor.submit(call_one, t)
-                    future_to_key[future] = (t, k)
-
-                for fut in as_completed(future_to_key):
-                    t, k = future_to_key[fut]
-                    result = fut.result()
-                    text = result["text"]
-                    dur_ms = result["dur_ms"]
-                    err_msg = result["err"]
-                    resp_meta = result.get("meta") or {}
-
-                    # Parse and derive normalized token from parsed result
-                    # Retry parse if text empty: attempt to extract from raw_response
-                    if not err_msg:
-                        parsed = parse_output(text, cfg.parse)
-                        if (parsed == 2) and (not text) and isinstance(resp_meta.get("raw_response"), (dict, str)):
-                            rr = resp_meta.get("raw_response")
-                            extracted = ""
-                            if isinstance(rr, dict):
-                                # Try common provider shapes
-                                if isinstance(rr.get("text"), str):
-                                    extracted = rr.get("text")
-                                else:
-                                    out = rr.get("output")
-                                    if isinstance(out, list):
-                                        for item in out:
-                                            if isinstance(item, dict) and item.get("type") == "message":
-                                                content = item.get("content")
-                                                if isinstance(content, list):
-                                                    for c in content:
-                                                        if isinstance(c, dict) and isinstance(c.get("text"), str) and c.get("text").strip():
-                                                            extracted = c.get("text").strip()
-                                                            break
-                                            if extracted:
-                                                break
-                                if not extracted:
-                                    # Fallback: any string value in raw_response
-                                    for v in rr.values():
-                                        if isinstance(v, str) and v.strip():
-                                            extracted = v.strip(); break
-                            elif isinstance(rr, str):
-                                extracted = rr
-                            if extracted:
-                                text = extracted
-                                parsed = parse_output(text, cfg.parse)
-                    else:
-                        parsed = 2
-                    norm = ("yes" if parsed == 0 else ("no" if parsed == 1 else None))
+            for problem, pid, prompt in zip(problems, pids, store.prompts):
+                for k, t in key_to_target.items():
+                    if pid in key_to_processed[k]:
+                        continue
+                    parsed = 2
                     gt = None
                     try:
                         satflag = int(problem[4])
                         gt = (parsed == satflag)
                     except Exception:
                         gt = None
-
-                    problem_meta = ProblemMeta(
-                        maxvars=problem[1] if len(problem) > 1 else None,
-                        maxlen=problem[2] if len(problem) > 2 else None,
-                        horn=problem[3] if len(problem) > 3 else None,
-                        satflag=problem[4] if len(problem) > 4 else None,
-                        proof=problem[6] if len(problem) > 6 else None,
-                    )
-                    # Map a compact error_class
-                    def classify_error(msg: Optional[str]) -> Optional[str]:
-                        if not msg:
-                            return None
-                        m = msg.lower()
-                        if "429" in m or "too many requests" in m or "rate limit" in m:
-                            return "rate_limit"
-                        if "overloaded" in m or "529" in m:
-                            return "overloaded"
-                        if "usage limits" in m or "quota" in m:
-                            return "quota"
-                        if "timeout" in m:
-                            return "timeout"
-                        return "error"
-
                     row = ResultRow(
                         id=pid,
-                        meta=problem_meta,
+                        meta=_problem_meta(problem),
                         provider=t.get("provider"),
                         model=t.get("model"),
-                        prompt=None,
-                        prompt_template=None,
-                        completion_text=(norm if (norm is not None) else (text if (cfg.save_response and not err_msg) else None)),
-                        normalized_text=norm,
-                        raw_response=resp_meta.get("raw_response"),
-                        finish_reason=resp_meta.get("finish_reason"),
-                        usage=resp_meta.get("usage"),
+                        prompt=prompt if cfg.save_prompt else None,
+                        completion_text=None,
                         parsed_answer=parsed,
                         correct=gt,
-                        timing_ms=dur_ms,
+                        timing_ms=0,
                         seed=(t.get("seed") if t.get("seed") is not None else cfg.seed),
                         temperature=(t.get("temperature") if t.get("temperature") is not None else cfg.temperature),
-                        error=err_msg,
-                        error_class=classify_error(err_msg),
+                        error=None,
                     )
-                    # Write minimal results row for statistical analysis
-                    if write_results:
-                        minimal = {
-                            "id": row.id,
-                            "meta": row.meta.model_dump(),
-                            "parsed_answer": row.parsed_answer,
-                        }
-                        with open(key_to_outpath[k], "a") as of:
-                            of.write(json.dumps(minimal) + "\n")
-                    # Write full responses if enabled
-                    if provenance_enabled:
-                        full_out = {
-                            "id": pid,
-                            "provider": t.get("provider"),
-                            "model": t.get("model"),
-                            "prompt": prompt if provenance_include_prompt else None,
-                            "prompt_template": cfg.prompt.template,
-                            "full_text": text,
-                            "raw_response": (resp_meta.get("raw_response") if cfg.outputs.provenance.include_raw_response else None),
-                            "finish_reason": resp_meta.get("finish_reason"),
-                            "usage": resp_meta.get("usage"),
-                            "timing_ms": dur_ms,
-                            "error": err_msg,
-                        }
-                        with open(key_to_outpath[k + "::responses"], "a") as rf:
-                            rf.write(json.dumps(full_out) + "\n")
-
-                    # Update stats
-                    s = stats[k]
-                    s["total"] += 1
-                    if row.correct:
-                        s["correct"] += 1
-                    if row.parsed_answer == 2:
-                        s["unclear"] += 1
-                    try:
-                        sf = int(problem[4])
-                        if sf == 1:
-                            s["sat_total"] += 1
-                            if row.correct:
-                                s["sat_correct"] += 1
-                        elif sf == 0:
-                            s["unsat_total"] += 1
-                            if row.correct:
-                                s["unsat_correct"] += 1
-                    except Exception:
-                        pass
-                    if isinstance(row.timing_ms, int):
-                        s["timing_sum"] += row.timing_ms
-                        s["timing_count"] += 1
-
+                    ckpt = key_to_checkpoint[k]
+                    writer.write(key_to_outpath[k], row.model_dump_json(), lambda offset, ckpt=ckpt, pid=pid: ckpt.add(pid, offset))
+                    _update_stats(stats[k], problem, row)
+        else:
+            # prompt.pack_size > 1: the scheduler queues the first problem of each pack; packs maps it to all members
+            packs: Dict[Tuple[str, int], List[int]] = {}
+            pack_prompts: Dict[Tuple[int, ...], Tuple[str, str]] = {}
+
+            def pack_prompt(members: Sequence[int]) -> Tuple[str, str]:
+                key = tuple(members)
+                if key not in pack_prompts:
+                    text = store.pack_prompt(key)
+                    pack_prompts[key] = (text, hashlib.sha256(text.encode()).hexdigest())
+                return pack_prompts[key]
+
+            def prompt_for(k: str, idx: int) -> str:
+                return pack_prompt(packs[(k, idx)])[0] if pack_size > 1 else store.prompts[idx]
+
+            def prefix_for(k: str, idx: int) -> str:
+                return store.pack_prefix(len(packs[(k, idx)])) if pack_size > 1 else store.prefix
+
+            def unpack(k: str, idx: int, result: Dict[str, Any]) -> List[Tuple[int, Dict[str, Any], Optional[str], Optional[str]]]:
+                """(problem index, result, prompt, prompt hash) per problem answered by one call."""
+                if pack_size <= 1:
+                    return [(idx, result, store.prompts[idx], store.prompt_hashes[idx])]
+                members = packs.pop((k, idx))
+                prompt, prompt_hash = pack_prompt(members)
+                answers = parse_packed(result["text"] or "", len(members)) if not result["err"] else [None] * len(members)
+                out = []
+                for pos, m in enumerate(members):
+                    meta = dict(result.get("meta") or {})
+                    meta["pack"] = {"size": len(members), "position": pos, "first_id": pids[idx]}
+                    if pos == 0:
+                        # The request's full completion, usage and raw response are kept once, on the first problem
+                        meta["pack"]["text"] = result["text"]
+                    else:
+                        meta.pop("usage", None)
+                        meta.pop("raw_response", None)
+                    sub = {"text": answers[pos] or "", "dur_ms": result["dur_ms"], "err": result["err"], "meta": meta}
+                    out.append((m, sub, prompt if pos == 0 else None, prompt_hash))
+                return out
+
+            # Problems whose call met an open circuit, per target; retried after the main pass
+            deferred: Dict[str, List[int]] = {}
+            ever_deferred: Dict[str, set] = {k: set() for k in key_to_target}
+            scheduler: Optional[LockstepScheduler] = None
+
+            def record(k: str, idx: int, result: Dict[str, Any]) -> None:
+                if _is_deferred(result):
+                    tracker = key_to_sampling.get(k)
+                    if tracker is None or not tracker.stopped:
+                        deferred.setdefault(k, []).append(idx)
+                        if idx not in ever_deferred[k]:
+                            ever_deferred[k].add(idx)
+                            stats[k]["deferred"] = stats[k].get("deferred", 0) + (len(packs[(k, idx)]) if pack_size > 1 else 1)
+                    return
+                for m, sub, prompt, prompt_hash in unpack(k, idx, result):
+                    row = _commit_result(
+                        cfg, key_to_target[k], problems[m], pids[m], prompt, sub,
+                        key_to_outpath[k], key_to_responses.get(k), stats[k], writer, key_to_checkpoint[k],
+                        prompt_hash,
+                    )
+                    metrics.observe_row(k, row.timing_ms, row.error_class, row.usage)
+                    tracker = key_to_sampling.get(k)
+                    if tracker is None:
+                        continue
+                    tracker.add(stratum_of(problems[m]), row.correct, row.error)
+                    if not tracker.stopped and tracker.should_stop():
+                        tracker.stopped = True
+                        dropped = scheduler.stop(k)  # type: ignore[union-attr]
+                        if pack_size > 1:
+                            dropped = [i for first in dropped for i in packs.pop((k, first))]
+                        _log_sampling_stop(k, tracker, len(dropped))
+                    if tracker.stopped or tracker.n % max(1, cfg.sampling.summary_every) == 0:
+                        # Live summary: intervals are readable while the run goes on
+                        _write_summary(cfg, key_to_outpath[k], stats[k], run_id, tracker)
+
+            def depths() -> Dict[str, Dict[str, int]]:
+                # Read from the metrics thread; the scheduler's counters are plain ints and dicts
+                out = scheduler.depths() if scheduler is not None else {}
+                for k in key_to_target:
+                    out.setdefault(k, {"in_flight": 0, "queued": 0, "buffered": 0})["deferred"] = len(deferred.get(k, ()))
+                return out
+
+            metrics.set_sources(queues=depths, writer=writer.backlog)
+
+            # One scheduler owns every call of the run: a long-lived pool bounded by `workers` in-flight
+            # calls (and provider / model caps), per-target queues served by weighted fair queuing, and
+            # at most `lockstep_window` problems of lead for any target. Without lockstep the lead is unbounded.
+            pending = {
+                k: [idx for idx, pid in enumerate(pids) if pid not in key_to_processed[k]]
+                for k in key_to_target
+            }
+            for k, tracker in key_to_sampling.items():
+                if pending[k] and tracker.should_stop():
+                    # A resumed target whose earlier rows already meet the precision target
+                    tracker.stopped = True
+                    _log_sampling_stop(k, tracker, len(pending[k]))
+                    pending[k] = []
+            if pack_size > 1:
+                for k, indices in pending.items():
+                    for i in range(0, len(indices), pack_size):
+                        packs[(k, indices[i])] = indices[i:i + pack_size]
+                    pending[k] = indices[::pack_size]
+            window = (cfg.concurrency.lockstep_window * pack_size if cfg.concurrency.lockstep else max(1, len(problems)))
+            max_workers, adaptive = _in_flight_caps(cfg, key_to_target.values())
+            hedge = _hedge_policy(cfg, key_to_target.values())
+
+            def drive(pending: Dict[str, List[int]]) -> None:
+                nonlocal scheduler
+                scheduler = _new_scheduler(cfg, key_to_target, pending, window, max_workers, adaptive)
+                _run_engine(cfg, scheduler, prompt_for, prefix_for, sysprompt, adaptive, hedge, record)
+
+            drive(pending)
+            breaker = get_circuit_breaker()
+            for _ in range(cfg.concurrency.circuit.deferred_rounds):
+                if not deferred:
+                    break
+                pending, deferred = {k: sorted(v) for k, v in deferred.items()}, {}
+                # Wait until every open circuit involved can be probed; closed ones go straight away
+                wait_s = breaker.wait_s(rate_limit_key(u.get("provider"), u.get("model")) for k in pending for u in _leaf_targets([key_to_target[k]]))
+                print(f"[circuit] retrying {sum(len(v) for v in pending.values())} deferred calls" + (f" in {wait_s:.0f}s" if wait_s else ""))
+                time.sleep(wait_s)
+                drive(pending)
+            for k, left in deferred.items():
+                n_left = sum(len(packs[(k, i)]) for i in left) if pack_size > 1 else len(left)
+                stats[k]["deferred_unresolved"] = n_left
+                print(f"[circuit] {k}: {n_left} problems still deferred (circuit open); rerun with the same --run to resume them")
+    finally:
+        # Rows already queued still land (and reach the checkpoints) if the run is interrupted
+        writer.close()
+        metrics.set_sources()
+        if metrics_server is not None:
+            metrics_server.close()
     # Write per-target summaries
     for k, outpath in key_to_outpath.items():
+        key_to_checkpoint[k].close()
         try:
-            base, ext = os.path.splitext(outpath)
-            summary_path = base + ".summary.json" if ext else outpath + ".summary.json"
-            ensure_dir(summary_path)
-            s = stats[k]
-            avg_timing = (s["timing_sum"] / s["timing_count"]) if s["timing_count"] > 0 else None
-            summary = {
-                "name": cfg.name,
-                "provider": s["provider"],
-                "model": s["model"],
-                "run": run_id,
-                "total": s["total"],
-                "correct": s["correct"],
-                "accuracy": (s["correct"] / s["total"]) if s["total"] > 0 else None,
-                "unclear": s["unclear"],
-                "sat_total": s["sat_total"],
-                "sat_correct": s["sat_correct"],
-                "sat_accuracy": (s["sat_correct"] / s["sat_total"]) if s["sat_total"] > 0 else None,
-                "unsat_total": s["unsat_total"],
-                "unsat_correct": s["unsat_correct"],
-                "unsat_accuracy": (s["unsat_correct"] / s["unsat_total"]) if s["unsat_total"] > 0 else None,
-                "avg_timing_ms": avg_timing,
-                "timestamp": int(time.time()),
-            }
-            with open(summary_path, "w") as sf:
-                json.dump(summary, sf, indent=2)
-        except Exception:
-            pass
-
-def run_target(
-    cfg: RunConfig,
-    target: Dict[str, Any],
-    only_providers: Optional[List[str]] = None,
-    model_overrides: Optional[Dict[str, List[str]]] = None,
-    dry_run: bool = False,
-    run_id: Optional[str] = None,
-) -> None:
-    if only_providers and target.get("provider", "").lower() not in [p.lower() for p in only_providers]:
-        return
-    models: List[str]
-    if model_overrides and target.get("provider") in model_overrides:
-        models = model_overrides[target.get("provider")]
-    else:
-        models = [target.get("model")]
-
-    rows_iter = read_jsonl_rows(cfg.input_file)
-    rows_iter = apply_filters(rows_iter, cfg)
-    problems = list(rows_iter)
-
-    base_tmpl = read_text(cfg.prompt.template)
-
-    for model in models:
-        # decide output path
-        if cfg.output_pattern:
-            outpath = cfg.output_pattern
-            outpath = (
-                outpath.replace("${name}", cfg.name)
-                .replace("${provider}", target.get("provider"))
-                .replace("${model}", model)
-            )
-            if "${run}" in outpath:
-                rid = run_id or time.strftime("%Y%m%d-%H%M%S")
-                outpath = outpath.replace("${run}", rid)
-        else:
-            outpath = (cfg.output_file or f"experiments/runs/{cfg.name}/results.jsonl").replace("${name}", cfg.name)
-            if "${run}" in outpath:
-                rid = run_id or time.strftime("%Y%m%d-%H%M%S")
-                outpath = outpath.replace("${run}", rid)
-        ensure_dir(outpath)
-        # Determine outputs settings (prefer unified outputs, fallback to legacy flags)
-        results_include_prompt = cfg.outputs.results.include_prompt
-        provenance_enabled = cfg.outputs.provenance.enabled
-        provenance_include_prompt = cfg.outputs.provenance.include_prompt
-
-        responses_path = None
-        if provenance_enabled:
-            base, ext = os.path.splitext(outpath)
-            responses_path = (base + ".provenance.jsonl" if ext else outpath + ".provenance.jsonl")
-            ensure_dir(responses_path)
-
-        # resume support: append mode, naive duplicate avoidance via counting lines
-        processed_ids = set()
-        if cfg.resume and os.path.exists(outpath):
-            try:
-                with open(outpath, "r") as rf:
-                    for line in rf:
-                        try:
-                            obj = json.loads(line)
-                            processed_ids.add(obj.get("id"))
-                        except Exception:
-                            continue
-            except Exception:
-                pass
-
-        # basic stats for summary
-        total_count = 0
-        correct_count = 0
-        unclear_count = 0
-        sat_total = 0
-        sat_correct = 0
-        unsat_total = 0
-        unsat_correct = 0
-        timing_sum = 0
-        timing_count = 0
-
-        with open(outpath, "a") as of:
-            idx = 0
-            for problem in problems:
-                idx += 1
-                pid = problem[0] if isinstance(problem, list) and len(problem) > 0 else idx
-                if pid in processed_ids:
-                    continue
-
-                if getattr(cfg.parse, "type", None) == "both":
-                    inject = "\nUnified answer rule (mixed cases)\n- Regardless of how the statements are rendered, output only a final single word: \"yes\" if p0 is derivable OR the set is a contradiction; otherwise \"no\". Do not output any other words.\n"
-                    tmpl = base_tmpl.replace("\n\nConventions", inject + "\nConventions")
-                elif getattr(cfg.parse, "type", None) == "yes_no" and cfg.prompt.style in (None, "horn_if_then"):
-                    inject = "\nHorn answer rule\n- Output ONLY a single final word: \"yes\" if p0 is derivable, otherwise \"no\". Do not output any other words.\n"
-                    tmpl = base_tmpl.replace("\n\nConventions", inject + "\nConventions")
-                else:
-                    tmpl = base_tmpl
-                prompt = render_prompt(problem, tmpl, cfg.prompt.style)
-                sysprompt = None
-
-                if dry_run:
-                    text = ""
-                    dur_ms = 0
-                    err_msg = None
-                    resp_meta: Dict[str, Any] = {}
-                else:
-                    attempts = 0
-                    err_msg = None
-                    text = ""
-                    resp_meta: Dict[str, Any] = {}
-                    while True:
-                        try:
-                            start = time.time()
-                            # Validate before each call as well (in case of CLI overrides)
-                            _validate_target_config(
-                                provider=target.get("provider"),
-                                model=model,
-                                temperature=target.get("temperature"),
-                                max_tokens=(target.get("max_tokens") or cfg.max_tokens),
-                                thinking=target.get("thinking"),
-                            )
-                            # Prefer per-target thinking, fallback to global
-                            thinking_cfg = None
-                            try:
-                                if target.get("thinking") is not None:
-                                    thinking_cfg = target.get("thinking")
-                                elif cfg.thinking is not None:
-                                    thinking_cfg = cfg.thinking.model_dump(exclude_none=True)
-                            except Exception:
-                                thinking_cfg = None
-                            res = run_chat(
-                                provider=target.get("provider"),
-                                model=model,
-                                prompt=prompt,
-                                sysprompt=sysprompt,
-                                max_tokens=(target.get("max_tokens") or cfg.max_tokens),
-                                temperature=(target.get("temperature") if target.get("temperature") is not None else (cfg.temperature or 0.0)),
-                                seed=(target.get("seed") if target.get("seed") is not None else cfg.seed),
-                                thinking=thinking_cfg,
-                            )
-                            dur_ms = int((time.time() - start) * 1000)
-                            err_msg = None
-                            text = res.get("text") or ""
-                            resp_meta = {k: v for k, v in res.items() if k != "text"}
-                            break
-                        except Exception as e:
-                            attempts += 1
-                            err_msg = str(e)
-                            # determine backoff
-                            max_attempts = (cfg.concurrency.retry.max_attempts if cfg.concurrency and cfg.concurrency.retry else 3)
-                            backoff = (cfg.concurrency.retry.backoff_seconds if cfg.concurrency and cfg.concurrency.retry else [2, 5, 10])
-                            if attempts >= max_attempts:
-                                dur_ms = None
-                                text = ""
-                                break
-                            wait_s = backoff[min(attempts - 1, len(backoff) - 1)]
-                            time.sleep(wait_s)
-
-                parsed = (parse_output(text, cfg.parse) if (not dry_run and not err_msg) else 2)
-                norm = ("yes" if parsed == 0 else ("no" if parsed == 1 else None))
-                gt = None
-                try:
-                    satflag = int(problem[4])
-                    gt = (parsed == satflag)
-                except Exception:
-                    gt = None
-
-                problem_meta = ProblemMeta(
-                    maxvars=problem[1] if len(problem) > 1 else None,
-                    maxlen=problem[2] if len(problem) > 2 else None,
-                    horn=problem[3] if len(problem) > 3 else None,
-                    satflag=problem[4] if len(problem) > 4 else None,
-                    proof=problem[6] if len(problem) > 6 else None,
-                )
-                def classify_error(msg: Optional[str]) -> Optional[str]:
-                    if not msg:
-                        return None
-                    m = msg.lower()
-                    if "429" in m or "too many requests" in m or "rate limit" in m:
-                        return "rate_limit"
-                    if "overloaded" in m or "529" in m:
-                        return "overloaded"
-                    if "usage limits" in m or "quota" in m:
-                        return "quota"
-                    if "timeout" in m:
-                        return "timeout"
-                    return "error"
-
-                row = ResultRow(
-                    id=pid,
-                    meta=problem_meta,
-                    provider=target.get("provider"),
-                    model=model,
-                    prompt=prompt if results_include_prompt else None,
-                    prompt_template=cfg.prompt.template if results_include_prompt else None,
-                    completion_text=(norm if (norm is not None) else (text if (cfg.save_response and not err_msg) else None)),
-                    normalized_text=norm,
-                    raw_response=resp_meta.get("raw_response"),
-                    finish_reason=resp_meta.get("finish_reason"),
-                    usage=resp_meta.get("usage"),
-                    parsed_answer=parsed,
-                    correct=gt,
-                    timing_ms=dur_ms,
-                    seed=(target.get("seed") if target.get("seed") is not None else cfg.seed),
-                    temperature=(target.get("temperature") if target.get("temperature") is not None else cfg.temperature),
-                    error=err_msg,
-                    error_class=classify_error(err_msg),
-                )
-                # Write minimal results row for statistical analysis
-                if write_results:
-                    minimal = {
-                        "id": row.id,
-                        "meta": row.meta.model_dump(),
-                        "parsed_answer": row.parsed_answer,
-                    }
-                    of.write(json.dumps(minimal) + "\n")
-                if provenance_enabled and responses_path:
-                    full_out = {
-                        "id": pid,
-                        "provider": target.get("provider"),
-                        "model": model,
-                        "prompt": prompt if provenance_include_prompt else None,
-                        "prompt_template": cfg.prompt.template,
-                        "full_text": text,
-                        "raw_response": (resp_meta.get("raw_response") if cfg.outputs.provenance.include_raw_response else None),
-                        "finish_reason": resp_meta.get("finish_reason") if not dry_run else None,
-                        "usage": resp_meta.get("usage") if not dry_run else None,
-                        "timing_ms": dur_ms,
-                        "error": err_msg,
-                    }
-                    with open(responses_path, "a") as rf:
-                        rf.write(json.dumps(full_out) + "\n")
-
-                # Update stats
-                total_count += 1
-                if row.correct:
-                    correct_count += 1
-                if row.parsed_answer == 2:
-                    unclear_count += 1
-                try:
-                    sf = int(problem[4])
-                    if sf == 1:
-                        sat_total += 1
-                        if row.correct:
-                            sat_correct += 1
-                    elif sf == 0:
-                        unsat_total += 1
-                        if row.correct:
-                            unsat_correct += 1
-                except Exception:
-                    pass
-                if isinstance(row.timing_ms, int):
-                    timing_sum += row.timing_ms
-                    timing_count += 1
-
-        # write summary file next to results
-        try:
-            base, ext = os.path.splitext(outpath)
-            summary_path = base + ".summary.json" if ext else outpath + ".summary.json"
-            ensure_dir(summary_path)
-            avg_timing = (timing_sum / timing_count) if timing_count > 0 else None
-            summary = {
-                "name": cfg.name,
-                "provider": target.get("provider"),
-                "model": model,
-                "run": run_id,
-                "total": total_count,
-                "correct": correct_count,
-                "accuracy": (correct_count / total_count) if total_count > 0 else None,
-                "unclear": unclear_count,
-                "sat_total": sat_total,
-                "sat_correct": sat_correct,
-                "sat_accuracy": (sat_correct / sat_total) if sat_total > 0 else None,
-                "unsat_total": unsat_total,
-                "unsat_correct": unsat_correct,
-                "unsat_accuracy": (unsat_correct / unsat_total) if unsat_total > 0 else None,
-                "avg_timing_ms": avg_timing,
-                "timestamp": int(time.time()),
-            }
-            with open(summary_path, "w") as sf:
-                json.dump(summary, sf, indent=2)
+            circuits = [c for c in get_circuit_breaker().snapshot(rate_limit_key(u.get("provider"), u.get("model")) for u in _leaf_targets([key_to_target[k]])) if c["trips"]]
+            _write_summary(cfg, outpath, stats[k], run_id, key_to_sampling.get(k), extra=({"circuit": circuits} if circuits else None))
         except Exception:
             pass
-
+    if not dry_run:
+        _fill_deferred_visible_tokens(cfg, [(key_to_target[k], key_to_responses.get(k)) for k in key_to_target])
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Run config-driven LLM experiments")
@@ -951,6 +1687,11 @@ def main() -> None:
     ap.add_argument("--only", type=str, default=None, help="Comma-separated providers to include")
     ap.add_argument("--models", type=str, default=None, help="Comma-separated provider:model filters, e.g. openai:gpt-4o,anthropic:claude-3")
     ap.add_argument("--run", type=str, default=None, help="Run identifier to inject into ${run} in output paths (e.g., 20250923 or git-<sha>)")
+    ap.add_argument("--mode", choices=["interactive", "batch", "adaptive"], default="interactive", help="batch: submit through provider batch APIs (cheaper, asynchronous); re-run with the same --run to collect. adaptive: pick problems per target by calibrated difficulty and stop once its ability is pinned down")
+    ap.add_argument("--no-wait", action="store_true", help="Batch mode: submit/check jobs and exit instead of polling until they finish")
+    ap.add_argument("--no-cache", action="store_true", help="Bypass the response cache for this invocation")
+    ap.add_argument("--shard", type=str, default=None, help="i/N: run only problems whose id hashes to shard i of N (0-based); merge with `python -m experiments.shards merge`")
+    ap.add_argument("--metrics-port", type=int, default=None, help="Serve live metrics on this port (/metrics, /metrics.json) while the run goes on; 0 picks a free port")
     args = ap.parse_args()
 
     with open(args.config, "r") as f:
@@ -962,6 +1703,26 @@ def main() -> None:
         cfg.filters.limit_rows = args.limit
     if args.resume:
         cfg.resume = True
+    if args.shard is not None:
+        cfg.filters.shard = args.shard
+    if args.metrics_port is not None:
+        cfg.metrics.enabled = True
+        cfg.metrics.port = args.metrics_port
+    if cfg.filters.shard:
+        try:
+            parse_shard(cfg.filters.shard)
+        except ValueError as e:
+            ap.error(str(e))
+        if "${run}" in (cfg.output_pattern or cfg.output_file or "") and not args.run:
+            ap.error("--shard needs --run so every shard writes under the same ${run} directory")
+    configure_pools(cfg.concurrency.pool.max_idle_per_host, cfg.concurrency.pool.idle_timeout_seconds)
+    configure_visible_tokens(cfg.visible_tokens)
+    if cfg.cache.enabled and not args.no_cache:
+        configure_cache(
+            cfg.cache.path,
+            max_entries=cfg.cache.max_entries,
+            max_bytes=(int(cfg.cache.max_size_mb * 1024 * 1024) if cfg.cache.max_size_mb else None),
+        )
 
     only_providers: Optional[List[str]] = None
     if args.only:
@@ -998,9 +1759,16 @@ def main() -> None:
     else:
         raise RuntimeError("Config must include targets[] with at least one item")
 
-    # Lockstep vs original per-target mode
-    if cfg.concurrency and getattr(cfg.concurrency, "lockstep", False):
-        run_targets_lockstep(
+    if cfg.prompt.pack_size > 1 and args.mode != "interactive":
+        ap.error("prompt.pack_size > 1 is only supported in interactive mode")
+    if args.mode == "batch":
+        if args.no_wait:
+            cfg.batch.wait = False
+        try:
+            from .batch import run_batch
+        except Exception:
+            from experiments.batch import run_batch
+        run_batch(
             cfg,
             targets,
             only_providers=only_providers,
@@ -1008,29 +1776,31 @@ def main() -> None:
             dry_run=args.dry_run,
             run_id=args.run,
         )
-    else:
-        # Run targets concurrently using targets_workers
-        max_workers = cfg.concurrency.targets_workers if cfg.concurrency and cfg.concurrency.targets_workers else 1
-        if max_workers <= 1 or len(targets) <= 1:
-            for t in targets:
-                run_target(cfg, t, only_providers=only_providers, model_overrides=model_overrides, dry_run=args.dry_run, run_id=args.run)
-        else:
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = [
-                    executor.submit(
-                        run_target,
-                        cfg,
-                        t,
-                        only_providers,
-                        model_overrides,
-                        args.dry_run,
-                        args.run,
-                    )
-                    for t in targets
-                ]
-                for _ in as_completed(futures):
-                    pass
+        return
+    if args.mode == "adaptive":
+        try:
+            from .adaptive_testing import run_adaptive
+        except Exception:
+            from experiments.adaptive_testing import run_adaptive
+        run_adaptive(
+            cfg,
+            targets,
+            only_providers=only_providers,
+            model_overrides=model_overrides,
+            dry_run=args.dry_run,
+            run_id=args.run,
+        )
+        return
 
+    # Every target, lockstep or not, runs on one scheduler; lockstep only bounds how far targets drift apart
+    run_targets(
+        cfg,
+        targets,
+        only_providers=only_providers,
+        model_overrides=model_overrides,
+        dry_run=args.dry_run,
+        run_id=args.run,
+    )
 
 if __name__ == "__main__":
     main()
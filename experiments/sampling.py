@@ -0,0 +1,129 @@
+import hashlib
+import json
+import math
+import os
+from statistics import NormalDist
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+Stratum = Tuple[Any, Any, Any, Any]
+
+
+def stratum_of(problem: List[Any]) -> Stratum:
+    """(maxvars, maxlen, horn, satflag) of a problem row."""
+    return tuple(problem[i] if len(problem) > i else None for i in (1, 2, 3, 4))  # type: ignore[return-value]
+
+
+def _tiebreak(problem: List[Any], seed: int) -> str:
+    pid = problem[0] if problem else None
+    return hashlib.sha256(f"{seed}:{pid}".encode()).hexdigest()
+
+
+def stratified_order(rows: Iterable[List[Any]], seed: int = 0) -> List[List[Any]]:
+    """Rows reordered so every prefix holds each stratum in proportion to its size.
+
+    Within a stratum rows are shuffled by a seeded hash of their id; the j-th
+    of a stratum's n rows is then placed at fraction (j + 0.5) / n of the run,
+    so after any k rows every stratum has had round(k * n / total) rows, give
+    or take one. Deterministic for a given seed, independent of file order.
+    """
+    strata: Dict[Stratum, List[List[Any]]] = {}
+    for row in rows:
+        strata.setdefault(stratum_of(row), []).append(row)
+    keyed: List[Tuple[float, str, List[Any]]] = []
+    for members in strata.values():
+        members.sort(key=lambda r: _tiebreak(r, seed))
+        n = len(members)
+        for j, row in enumerate(members):
+            keyed.append(((j + 0.5) / n, _tiebreak(row, seed + 1), row))
+    keyed.sort(key=lambda x: (x[0], x[1]))
+    return [row for _, _, row in keyed]
+
+
+def wilson(successes: int, n: int, confidence: float = 0.95) -> Tuple[Optional[float], Optional[float]]:
+    """Wilson score interval for a binomial proportion; (None, None) without observations."""
+    if n <= 0:
+        return None, None
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    p = successes / n
+    denom = 1.0 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+class SamplingTracker:
+    """Accuracy with Wilson intervals, overall and per stratum, for one target.
+
+    Rows with an API error are not counted (they say nothing about the
+    model); unclear answers count as wrong, as in the summary's accuracy.
+    ``should_stop()`` turns true once at least ``min_samples`` rows are in and
+    the overall interval is no wider than ``stop_ci_width``.
+    """
+
+    def __init__(self, confidence: float = 0.95, stop_ci_width: Optional[float] = None, min_samples: int = 100) -> None:
+        self.confidence = float(confidence)
+        self.stop_ci_width = stop_ci_width
+        self.min_samples = max(1, int(min_samples))
+        self.n = 0
+        self.correct = 0
+        self.strata: Dict[Stratum, List[int]] = {}
+        self.stopped = False
+
+    def add(self, stratum: Stratum, correct: Optional[bool], error: Optional[str] = None) -> None:
+        if error or correct is None:
+            return
+        counts = self.strata.setdefault(tuple(stratum), [0, 0])
+        counts[0] += 1
+        counts[1] += int(bool(correct))
+        self.n += 1
+        self.correct += int(bool(correct))
+
+    def seed_from_results(self, path: str) -> None:
+        """Count rows already in a results file (resumed runs keep their earlier evidence)."""
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except Exception:
+                    continue
+                meta = row.get("meta") or {}
+                correct = row.get("correct")
+                if correct is None and meta.get("satflag") is not None and "parsed_answer" in row:
+                    # Results files written with outputs.results.fields may omit `correct`
+                    correct = row["parsed_answer"] == meta["satflag"]
+                self.add((meta.get("maxvars"), meta.get("maxlen"), meta.get("horn"), meta.get("satflag")), correct, row.get("error"))
+
+    def ci(self) -> Tuple[Optional[float], Optional[float]]:
+        return wilson(self.correct, self.n, self.confidence)
+
+    def should_stop(self) -> bool:
+        if self.stop_ci_width is None or self.n < self.min_samples:
+            return False
+        lo, hi = self.ci()
+        return lo is not None and hi is not None and (hi - lo) <= self.stop_ci_width
+
+    def snapshot(self) -> Dict[str, Any]:
+        lo, hi = self.ci()
+        strata = []
+        for key in sorted(self.strata, key=lambda k: tuple((v is None, v) for v in k)):
+            n, correct = self.strata[key]
+            s_lo, s_hi = wilson(correct, n, self.confidence)
+            strata.append({
+                "maxvars": key[0], "maxlen": key[1], "horn": key[2], "satflag": key[3],
+                "n": n, "correct": correct, "accuracy": correct / n, "ci_low": s_lo, "ci_high": s_hi,
+            })
+        return {
+            "confidence": self.confidence,
+            "n": self.n,
+            "correct": self.correct,
+            "accuracy": (self.correct / self.n) if self.n else None,
+            "ci_low": lo,
+            "ci_high": hi,
+            "ci_width": (hi - lo) if lo is not None and hi is not None else None,
+            "stop_ci_width": self.stop_ci_width,
+            "stopped_early": self.stopped,
+            "strata": strata,
+        }
@@ -0,0 +1,249 @@
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Generator, Iterable, List, Optional, Sequence, Tuple
+
+
+# A task's plan yields the calls of each step as (call, buckets) pairs, receives their results
+# (in the same order) and finally returns the task's result
+Plan = Generator[List[Tuple[Any, Sequence[str]]], List[Any], Any]
+
+
+def single_call(buckets: Sequence[str] = ()) -> Plan:
+    """The plan of a task that is one call."""
+    results = yield [(None, buckets)]
+    return results[0]
+
+
+class _Task:
+    def __init__(self, plan: Plan) -> None:
+        self.plan = plan
+        self.results: List[Any] = []
+        self.waiting = 0
+
+
+class LockstepScheduler:
+    """Owns every (target, problem) call of a run: pipelining, caps and fair sharing.
+
+    Every target owns a queue of problem indices it still has to run. A
+    problem is started only while ``i < low_water + window``, where
+    ``low_water`` is the first problem index that some target has not yet
+    committed. With ``window=1`` this degenerates to the classic per-problem
+    barrier; larger windows let fast targets run ahead by at most ``window``
+    problems instead of idling behind the slowest call. A window as large as
+    the problem list removes the coupling between targets altogether.
+
+    A problem may take several API calls: ``plan(key, index)`` returns a
+    generator that yields the calls of one step at a time (samples of one
+    prompt, then a cascade's next stage, ...) and returns the problem's
+    result. Each call is dispatched, capped and charged on its own, so a task
+    holds exactly the slots of the calls it has in flight. Calls of problems
+    already started go before new problems of the same target. Without
+    ``plan`` every problem is a single call drawing from ``buckets[key]``.
+
+    With ``feed``, a target whose queue is empty asks ``feed(key)`` for the
+    next problem index to start (None = nothing right now). Fed problems
+    ignore the window and are committed in the order they were started;
+    the run ends once nothing is in flight and no target is fed another
+    problem. Adaptive testing uses it to pick each problem from the answers
+    so far.
+
+    Results are released per target strictly in problem order, so each
+    target's output file is written deterministically regardless of which
+    call finishes first. The scheduler is not thread-safe; drive it from a
+    single dispatcher thread.
+
+    In-flight calls are capped by ``max_in_flight`` overall and, optionally,
+    per bucket: each call lists the buckets it draws from (e.g. its provider
+    and its provider:model) and ``bucket_limit(bucket)`` gives the cap (None =
+    uncapped), re-read on every dispatch so it may change while the run
+    progresses.
+
+    Free slots go to targets by start-time fair queuing weighted by
+    ``weights`` (default 1): each call is charged its target's observed mean
+    call duration, so targets share slot-time rather than call counts and a
+    slow model cannot hold on to the slots a fast one keeps returning.
+    """
+
+    def __init__(
+        self,
+        pending: Dict[str, Iterable[int]],
+        window: int = 1,
+        max_in_flight: int = 1,
+        buckets: Optional[Dict[str, Sequence[str]]] = None,
+        bucket_limit: Optional[Callable[[str], Optional[int]]] = None,
+        weights: Optional[Dict[str, float]] = None,
+        plan: Optional[Callable[[str, int], Plan]] = None,
+        feed: Optional[Callable[[str], Optional[int]]] = None,
+    ) -> None:
+        self.window = max(1, int(window or 1))
+        self.max_in_flight = max(1, int(max_in_flight or 1))
+        self._keys: List[str] = list(pending.keys())
+        self._buckets: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in (buckets or {}).items()}
+        self._bucket_limit = bucket_limit
+        self._bucket_in_flight: Dict[str, int] = {}
+        self._plan = plan or (lambda key, idx: single_call(self._buckets.get(key, ())))
+        self._feed = feed
+        self._weights: Dict[str, float] = {k: max(1e-6, float((weights or {}).get(k) or 1.0)) for k in self._keys}
+        # Problems not yet started, per target
+        self._queues: Dict[str, Deque[int]] = {k: deque(sorted(set(v))) for k, v in pending.items()}
+        # Problems not yet committed (started or not), per target, in order
+        self._uncommitted: Dict[str, Deque[int]] = {k: deque(q) for k, q in self._queues.items()}
+        # Completed results waiting for earlier indices of the same target
+        self._buffered: Dict[str, Dict[int, Any]] = {k: {} for k in self._keys}
+        # Started problems and their calls not yet dispatched (earliest problem first), per target
+        self._tasks: Dict[Tuple[str, int], _Task] = {}
+        self._ready: Dict[str, List[Tuple[int, int, Any, Tuple[str, ...], int]]] = {k: [] for k in self._keys}
+        self._seq = itertools.count()
+        self._in_flight: Dict[str, int] = {k: 0 for k in self._keys}
+        self._total_in_flight = 0
+        # Fair queuing state: virtual clock, last finish tag and mean call seconds per target
+        self._vtime = 0.0
+        self._finish: Dict[str, float] = {k: 0.0 for k in self._keys}
+        self._cost: Dict[str, Optional[float]] = {k: None for k in self._keys}
+        # Per dispatched call id: start time, charge, buckets and position in its step
+        self._started: Dict[int, Tuple[float, float, Tuple[str, ...], int]] = {}
+
+    def low_water(self) -> Optional[int]:
+        """First problem index not yet committed by every target (None when all done)."""
+        heads = [q[0] for q in self._uncommitted.values() if q]
+        return min(heads) if heads else None
+
+    def in_flight(self) -> int:
+        return self._total_in_flight
+
+    def depths(self) -> Dict[str, Dict[str, int]]:
+        """Per target: calls in flight, problems not yet started, and results buffered behind an earlier one."""
+        return {
+            k: {"in_flight": self._in_flight[k], "queued": len(self._queues[k]), "buffered": len(self._buffered[k])}
+            for k in self._keys
+        }
+
+    def finished(self) -> bool:
+        # A fed run is over when the driver gets no call and has none in flight
+        return self._feed is None and all(not q for q in self._uncommitted.values())
+
+    def _estimate(self, key: str) -> float:
+        cost = self._cost[key]
+        if cost is not None:
+            return cost
+        known = [c for c in self._cost.values() if c is not None]
+        return (sum(known) / len(known)) if known else 1.0
+
+    def _push_calls(self, key: str, idx: int, task: _Task, calls: List[Tuple[Any, Sequence[str]]]) -> None:
+        if not calls:
+            raise ValueError(f"plan for {key} problem {idx} yielded no calls")
+        task.results = [None] * len(calls)
+        task.waiting = len(calls)
+        for pos, (call, buckets) in enumerate(calls):
+            heapq.heappush(self._ready[key], (idx, next(self._seq), call, tuple(buckets), pos))
+
+    def _next_call(self, key: str, limit: int) -> Optional[Tuple[int, int, Any, Tuple[str, ...], int]]:
+        """The call key would dispatch next: of a started problem, else the first call of its next problem."""
+        ready = self._ready[key]
+        if not ready:
+            q = self._queues[key]
+            if q:
+                if q[0] >= limit:
+                    return None
+                idx = q.popleft()
+            else:
+                fed = self._feed(key) if self._feed is not None else None
+                if fed is None:
+                    return None
+                idx = fed
+                self._uncommitted[key].append(idx)
+            task = _Task(self._plan(key, idx))
+            self._tasks[(key, idx)] = task
+            self._push_calls(key, idx, task, next(task.plan))
+        return ready[0]
+
+    def next_tasks(self) -> List[Tuple[str, int, int, Any]]:
+        """Hand out as many (key, index, call id, call) as the window and in-flight caps allow.
+
+        Among targets with a call to make the one with the smallest start tag
+        goes next, one call at a time, so no single target can monopolise the
+        in-flight budget while others are eligible.
+        """
+        tasks: List[Tuple[str, int, int, Any]] = []
+        lw = self.low_water()
+        if not self._keys or (lw is None and self._feed is None):
+            return tasks
+        limit = lw + self.window if lw is not None else 0
+        caps: Dict[str, Optional[int]] = {}
+
+        def cap(bucket: str) -> Optional[int]:
+            if bucket not in caps:
+                c = self._bucket_limit(bucket) if self._bucket_limit is not None else None
+                caps[bucket] = max(1, int(c)) if c is not None else None
+            return caps[bucket]
+
+        while self._total_in_flight < self.max_in_flight:
+            best: Optional[str] = None
+            best_start = 0.0
+            for k in self._keys:
+                nxt = self._next_call(k, limit)
+                if nxt is None:
+                    continue
+                if any(cap(b) is not None and self._bucket_in_flight.get(b, 0) >= cap(b) for b in nxt[3]):  # type: ignore[operator]
+                    continue
+                start = max(self._vtime, self._finish[k])
+                if best is None or start < best_start:
+                    best, best_start = k, start
+            if best is None:
+                break
+            idx, call_id, call, buckets, pos = heapq.heappop(self._ready[best])
+            charge = self._estimate(best) / self._weights[best]
+            self._vtime = best_start
+            self._finish[best] = best_start + charge
+            self._started[call_id] = (time.monotonic(), charge, buckets, pos)
+            self._in_flight[best] += 1
+            self._total_in_flight += 1
+            for b in buckets:
+                self._bucket_in_flight[b] = self._bucket_in_flight.get(b, 0) + 1
+            tasks.append((best, idx, call_id, call))
+        return tasks
+
+    def stop(self, key: str) -> List[int]:
+        """Drop ``key``'s problems not yet started; calls of started ones still complete. Returns the dropped indices."""
+        dropped = list(self._queues[key])
+        self._queues[key].clear()
+        if dropped:
+            gone = set(dropped)
+            self._uncommitted[key] = deque(i for i in self._uncommitted[key] if i not in gone)
+        return dropped
+
+    def complete(self, key: str, idx: int, call_id: int, result: Any) -> List[Tuple[int, Any]]:
+        """Record a finished call and return the results now committable for ``key``, in order."""
+        self._in_flight[key] -= 1
+        self._total_in_flight -= 1
+        t0, charge, buckets, pos = self._started.pop(call_id)
+        for b in buckets:
+            self._bucket_in_flight[b] -= 1
+        elapsed = time.monotonic() - t0
+        prev = self._cost[key]
+        self._cost[key] = elapsed if prev is None else (0.8 * prev + 0.2 * elapsed)
+        # Settle the estimate charged at dispatch against the time the call actually held its slot
+        self._finish[key] = max(self._vtime, self._finish[key] + elapsed / self._weights[key] - charge)
+        task = self._tasks[(key, idx)]
+        task.results[pos] = result
+        task.waiting -= 1
+        if task.waiting:
+            return []
+        try:
+            calls = task.plan.send(task.results)
+        except StopIteration as done:
+            del self._tasks[(key, idx)]
+            self._buffered[key][idx] = done.value
+        else:
+            self._push_calls(key, idx, task, calls)
+            return []
+        ready: List[Tuple[int, Any]] = []
+        uncommitted = self._uncommitted[key]
+        buffered = self._buffered[key]
+        while uncommitted and uncommitted[0] in buffered:
+            i = uncommitted.popleft()
+            ready.append((i, buffered.pop(i)))
+        return ready
+
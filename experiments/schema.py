@@ -3,16 +3,133 @@ from pydantic import BaseModel, Field
 
 
 class RetrySettings(BaseModel):
+    # Attempts per call, the first included. Only retriable errors are retried (rate limits, overload,
+    # 5xx, timeouts, dropped connections); 400/401/403/404 and spent quotas fail at once.
     max_attempts: int = 3
-    backoff_seconds: List[int] = Field(default_factory=lambda: [2, 5, 10])
+    # Wait before attempt k+1: backoff_base_s * 2**(k-1), capped at backoff_max_s, of which a random half
+    backoff_base_s: float = 2.0
+    backoff_max_s: float = 60.0
+    backoff_seconds: Optional[List[float]] = None  # explicit per-attempt schedule instead (last value repeats), same jitter
+
+
+class TimeoutSettings(BaseModel):
+    # Per call attempt, in seconds; null = no limit. Targets may override any of them under `timeouts:`.
+    # A timed-out call is abandoned (connection closed), recorded as error_class "timeout" and retried.
+    connect_s: Optional[float] = 10.0
+    read_s: Optional[float] = 600.0    # longest wait for response headers or the next chunk; without
+                                       # streaming this covers the whole generation
+    total_s: Optional[float] = None    # whole call, first byte sent to last byte read
+
+
+class AdaptiveSettings(BaseModel):
+    # AIMD per-provider in-flight limits driven by throttling errors, rate-limit headers and latency
+    enabled: bool = False
+    initial_workers: Optional[int] = None  # per provider; defaults to concurrency.workers
+    min_workers: int = 1
+    max_workers: int = 64
+    increase: float = 1.0                  # added per round of successful calls
+    decrease: float = 0.5                  # multiplier on rate_limit/overloaded/quota/timeout
+    latency_factor: Optional[float] = 3.0  # back off when latency exceeds this multiple of the best seen; null disables
+
+
+class HedgeSettings(BaseModel):
+    # Duplicate a call still unanswered after the target's latency percentile; the first answer wins
+    enabled: bool = False                  # targets may override with `hedge: true|false`
+    percentile: float = 95.0               # of successful call latencies (timing_ms) for that target
+    min_samples: int = 20                  # no hedging until this many latencies are known (earlier runs count)
+    history: int = 2000                    # latest latencies kept per target, seeded from earlier runs' provenance
+    budget: float = 0.05                   # duplicates per call, across all targets
+    min_delay_ms: int = 0                  # never hedge sooner than this
+
+
+class CircuitSettings(BaseModel):
+    # Per provider:model circuit breaker: after `failures` consecutive failed attempts of a `trip_on` class,
+    # calls to that model are not sent; their problems are deferred and retried once the run is through
+    enabled: bool = False
+    failures: int = 5
+    trip_on: List[str] = Field(default_factory=lambda: ["quota", "overloaded", "server", "timeout", "connection"])
+    open_s: float = 60.0                   # then one probe call (half-open); doubles after each failed probe
+    max_open_s: float = 600.0
+    deferred_rounds: int = 5               # passes over the deferred problems; any left are not written (--resume)
+
+
+class ConnectionPoolSettings(BaseModel):
+    # Keep-alive connections shared by every target and worker in the process, per provider host
+    max_idle_per_host: int = 64
+    idle_timeout_seconds: float = 60.0
 
 
 class ConcurrencySettings(BaseModel):
+    # In-flight calls across all targets; one scheduler serves every target (weighted by target `weight`)
     workers: int = 4
-    targets_workers: int = 1
+    # Further in-flight caps shared by all targets of a provider ({openai: 8}) or provider:model ({"google:gemini-2.5-pro": 2})
+    provider_limits: Dict[str, int] = Field(default_factory=dict)
+    model_limits: Dict[str, int] = Field(default_factory=dict)
+    targets_workers: int = 1  # ignored: targets no longer get their own pools; kept so older configs load
     lockstep: bool = False
-    rate_limit_per_min: Optional[int] = None
+    # Lockstep only: max problems any target may run ahead of the slowest target
+    lockstep_window: int = 4
+    # threads: one OS thread per in-flight call; asyncio: all calls on one event loop (workers may be large)
+    engine: Literal["threads", "asyncio"] = "threads"
+    # Shared per provider:model across all targets and threads; targets may override either limit
+    rate_limit_per_min: Optional[int] = None   # requests per minute
+    tokens_per_min: Optional[int] = None       # estimated input + output tokens per minute
     retry: RetrySettings = Field(default_factory=RetrySettings)
+    timeouts: TimeoutSettings = Field(default_factory=TimeoutSettings)
+    # Adjust in-flight calls per provider instead of a fixed `workers` (provider_limits still cap it)
+    adaptive: AdaptiveSettings = Field(default_factory=AdaptiveSettings)
+    pool: ConnectionPoolSettings = Field(default_factory=ConnectionPoolSettings)
+    hedge: HedgeSettings = Field(default_factory=HedgeSettings)
+    circuit: CircuitSettings = Field(default_factory=CircuitSettings)
+
+
+class CacheSettings(BaseModel):
+    # Content-addressed response cache shared by every run/config using the same path:
+    # key = provider, model, rendered prompt, temperature, seed, thinking, max_tokens
+    enabled: bool = False
+    path: str = "experiments/cache/responses.sqlite"
+    max_entries: Optional[int] = None
+    max_size_mb: Optional[float] = 1024.0  # compressed size; least recently used entries are evicted first
+
+
+class BatchSettings(BaseModel):
+    # Used by `runner --mode batch` (provider batch APIs: ~50% cheaper, results within 24h)
+    poll_seconds: float = 60.0
+    # Split a target's requests into jobs of at most this many (provider limits apply as well)
+    max_requests_per_job: Optional[int] = None
+    # false: submit (or check on) jobs and exit; re-run with the same --run to collect
+    wait: bool = True
+
+
+class SamplingSettings(BaseModel):
+    # stratified: interleave problems across (maxvars, maxlen, horn, satflag) so any prefix of the run
+    # (including limit_rows) is a proportional sample of every stratum; file: dataset order
+    order: Literal["file", "stratified"] = "file"
+    seed: int = 0
+    # Stop a target once the full width of its accuracy interval is at most this (0.04 = +-2%); null = run all
+    stop_ci_width: Optional[float] = None
+    confidence: float = 0.95
+    min_samples: int = 100               # never stop before this many answered problems
+    summary_every: int = 50              # rewrite .summary.json (with intervals) every N rows
+
+
+class AdaptiveTestingSettings(BaseModel):
+    # Used by `runner --mode adaptive`: problems picked per target to pin down its ability (Rasch model)
+    difficulty_file: str = "experiments/irt/difficulty.json"  # from `python -m experiments.irt calibrate`
+    target_se: float = 0.3               # stop once the ability estimate's standard error is at most this
+    min_items: int = 20
+    max_items: int = 300
+    parallel: int = 4                    # problems in flight per target, each picked from the latest estimate
+    prior_sd: float = 1.0                # N(0, prior_sd) prior on ability, as in calibration
+
+
+class MetricsSettings(BaseModel):
+    # Live metrics over local HTTP while an interactive run is going: /metrics (Prometheus text) and
+    # /metrics.json; `runner --metrics-port N` turns it on as well. Port 0 picks a free one (printed)
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9464
+    latency_samples: int = 2000          # latest timing_ms values per target behind the p50/p90/p99
 
 
 class ParseConfig(BaseModel):
@@ -25,12 +142,19 @@ class PromptConfig(BaseModel):
     template: str
     style: Optional[str] = None  # e.g., horn_if_then | cnf_v1 | cnf_v2
     variables: Dict[str, Any] = Field(default_factory=dict)
+    # >1: send this many numbered problems per request under one copy of the instructions (interactive mode)
+    pack_size: int = 1
+    # Mark the template's static head (everything before {{ clauses }}) for provider prompt caching
+    cache_prefix: bool = True
 
 
 class FiltersConfig(BaseModel):
     horn_only: bool = False
     skip_rows: int = 0
     limit_rows: Optional[int] = None
+    # "i/N" (0 <= i < N): keep only problems whose id hashes to shard i, applied after the filters above.
+    # Usually set with `runner --shard i/N`; outputs get a .shard-i-of-N suffix (see experiments/shards.py)
+    shard: Optional[str] = None
 
 
 class ThinkingOptions(BaseModel):
@@ -52,6 +176,13 @@ class RunConfig(BaseModel):
     max_tokens: Optional[int] = None     # default for targets when missing
     targets: List[Dict[str, Any]]
     thinking: Optional[ThinkingOptions] = None  # default for all targets if not set per-target
+    # Stream OpenAI / Gemini responses over SSE (Anthropic always streams) to record
+    # time to first / last token and output tokens/s; targets may set `stream` themselves
+    stream: bool = False
+    # Anthropic usage.thinking_visible_tokens / text_visible_tokens: estimate (local, no API call),
+    # deferred (count_tokens after the run, once per distinct text), inline (two count_tokens calls
+    # per message, on the hot path) or none
+    visible_tokens: Literal["estimate", "deferred", "inline", "none"] = "estimate"
 
     input_file: str
     output_file: Optional[str] = None
@@ -61,6 +192,11 @@ class RunConfig(BaseModel):
     prompt: PromptConfig
     parse: ParseConfig = Field(default_factory=ParseConfig)
     concurrency: ConcurrencySettings = Field(default_factory=ConcurrencySettings)
+    batch: BatchSettings = Field(default_factory=BatchSettings)
+    sampling: SamplingSettings = Field(default_factory=SamplingSettings)
+    adaptive_testing: AdaptiveTestingSettings = Field(default_factory=AdaptiveTestingSettings)
+    metrics: MetricsSettings = Field(default_factory=MetricsSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
     resume: bool = True
     save_prompt: bool = False
     save_response: bool = True
@@ -76,9 +212,18 @@ class RunConfig(BaseModel):
         include_prompt: bool = True
         include_raw_response: bool = True
 
+    class OutputsWriter(BaseModel):
+        # One writer thread per run appends all rows; producers block when the queue is full
+        queue_size: int = 1024
+        flush_rows: int = 256
+        flush_bytes: int = 1048576
+        flush_interval_seconds: float = 1.0
+        fsync: Literal["never", "flush", "close"] = "never"
+
     class Outputs(BaseModel):
         results: 'RunConfig.OutputsResults' = Field(default_factory=lambda: RunConfig.OutputsResults())
         provenance: 'RunConfig.OutputsProvenance' = Field(default_factory=lambda: RunConfig.OutputsProvenance())
+        writer: 'RunConfig.OutputsWriter' = Field(default_factory=lambda: RunConfig.OutputsWriter())
 
     outputs: Outputs = Field(default_factory=lambda: RunConfig.Outputs())
 
@@ -112,5 +257,9 @@ class ResultRow(BaseModel):
     temperature: Optional[float] = None
     error: Optional[str] = None
     error_class: Optional[str] = None
+    cascade_stage: Optional[int] = None  # cascade targets: index of the stage that answered
+    pack_position: Optional[int] = None  # prompt.pack_size > 1: position of the problem in its request (0-based)
+    votes: Optional[List[int]] = None  # targets with samples > 1: samples answering [yes/contradiction, no/satisfiable, unclear]
+    vote_margin: Optional[float] = None  # (winner - runner-up) / answered samples
 
 
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Sharded runs: naming of per-shard outputs and merging them back.
+
+`runner --shard i/N` keeps the problems whose id hashes to shard i of N
+(see filters.shard) and writes results.shard-i-of-N.jsonl (plus its
+.provenance.jsonl / .summary.json / checkpoint) next to where the unsharded
+run would write results.jsonl. Give every shard the same --run.
+
+Once all N shards are done (copied into one tree if they ran on different
+machines), `merge` writes the canonical results.jsonl, results.provenance.jsonl
+and results.summary.json that aggregate_results.py and the analysis scripts
+read. Rows are ordered by id; the summary is recomputed from the merged rows
+(deferred calls and circuit trips, which leave no rows, are summed over the
+shard summaries).
+
+Usage:
+    python -m experiments.runner --config cfg.yaml --run 20251020 --shard 0/4   # ... through 3/4
+    python -m experiments.shards merge experiments/runs/<name>/20251020
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from .sampling import SamplingTracker
+    from .writer import write_json_atomic
+except Exception:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from experiments.sampling import SamplingTracker
+    from experiments.writer import write_json_atomic
+
+
+_SHARD_FILE = re.compile(r"^(?P<stem>.+)\.shard-(?P<index>\d+)-of-(?P<count>\d+)\.jsonl$")
+
+# Summary fields that describe the run rather than its rows; every other field is recomputed (or summed over shards)
+_IDENTITY = ("name", "provider", "model", "run", "pack_size")
+
+# Every file the runner derives from a results path (see runner._provenance_path, _write_summary, checkpoint, batch)
+_DERIVED = (".provenance.jsonl", ".summary.json", ".ckpt.json", ".batch.json")
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """(index, count) from "i/N" with 0 <= i < N."""
+    m = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", str(spec))
+    if not m:
+        raise ValueError(f"shard must look like i/N, got {spec!r}")
+    index, count = int(m.group(1)), int(m.group(2))
+    if count < 1 or not (0 <= index < count):
+        raise ValueError(f"shard index must be within 0..N-1, got {spec!r}")
+    return index, count
+
+
+def shard_path(path: str, index: int, count: int) -> str:
+    base, ext = os.path.splitext(path)
+    return f"{base}.shard-{index}-of-{count}{ext}"
+
+
+def _derived(path: str, suffix: str) -> str:
+    base, ext = os.path.splitext(path)
+    return base + suffix if ext else path + suffix
+
+
+def _read_rows(path: str) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except Exception:
+                # A torn last line from an interrupted shard; the shard's resume would drop it too
+                continue
+    return rows
+
+
+def _id_order(pid: Any) -> Tuple[int, Any]:
+    return (0, pid) if isinstance(pid, (int, float)) else (1, str(pid))
+
+
+def _merge_rows(paths: Iterable[str]) -> List[Dict[str, Any]]:
+    # Later rows for an id win (a resumed shard may have re-run it); output ordered by id
+    by_id: Dict[Any, Dict[str, Any]] = {}
+    for path in paths:
+        for row in _read_rows(path):
+            by_id[row.get("id")] = row
+    return [by_id[k] for k in sorted(by_id, key=_id_order)]
+
+
+def _write_rows(path: str, rows: List[Dict[str, Any]]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+    os.replace(tmp, path)
+
+
+def _mean(values: Iterable[Any]) -> Optional[float]:
+    vals = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    return (sum(vals) / len(vals)) if vals else None
+
+
+def _circuits(bases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Trips add up over shards; state and last error class come from the last shard that saw the circuit
+    merged: Dict[str, Dict[str, Any]] = {}
+    for base in bases:
+        for c in base.get("circuit") or []:
+            prev = merged.get(c["key"])
+            merged[c["key"]] = dict(c, trips=(prev["trips"] if prev else 0) + (c.get("trips") or 0))
+    return [merged[k] for k in sorted(merged)]
+
+
+def _sampling(bases: List[Dict[str, Any]], results: List[Dict[str, Any]], errors: Dict[Any, Any]) -> Optional[Dict[str, Any]]:
+    snapshots = [b["sampling"] for b in bases if b.get("sampling")]
+    if not snapshots:
+        return None
+    tracker = SamplingTracker(snapshots[0].get("confidence", 0.95), snapshots[0].get("stop_ci_width"))
+    for row in results:
+        meta = row.get("meta") or {}
+        correct = row.get("correct")
+        if correct is None and meta.get("satflag") is not None and "parsed_answer" in row:
+            correct = row["parsed_answer"] == meta["satflag"]
+        tracker.add((meta.get("maxvars"), meta.get("maxlen"), meta.get("horn"), meta.get("satflag")), correct, errors.get(row.get("id")))
+    # Each shard stops on its own interval; the merged run stopped early if any of them did
+    tracker.stopped = any(snap.get("stopped_early") for snap in snapshots)
+    return tracker.snapshot()
+
+
+def _summary(bases: List[Dict[str, Any]], results: List[Dict[str, Any]], provenance: List[Dict[str, Any]], count: int) -> Dict[str, Any]:
+    """The runner's summary fields, recomputed over the merged rows (summed over the shard summaries where rows cannot tell)."""
+    s = {k: 0 for k in ("total", "correct", "unclear", "sat_total", "sat_correct", "unsat_total", "unsat_correct")}
+    stages: Dict[str, int] = {}
+    pack_requests = voted = samples = unanimous = 0
+    margin_sum = 0.0
+    for row in results:
+        parsed = row.get("parsed_answer")
+        try:
+            satflag = int((row.get("meta") or {}).get("satflag"))
+        except (TypeError, ValueError):
+            satflag = None
+        correct = satflag is not None and parsed == satflag
+        s["total"] += 1
+        s["correct"] += int(correct)
+        s["unclear"] += int(parsed == 2)
+        if satflag == 1:
+            s["sat_total"] += 1
+            s["sat_correct"] += int(correct)
+        elif satflag == 0:
+            s["unsat_total"] += 1
+            s["unsat_correct"] += int(correct)
+        if row.get("cascade_stage") is not None:
+            stages[str(row["cascade_stage"])] = stages.get(str(row["cascade_stage"]), 0) + 1
+        if row.get("pack_position") == 0:
+            pack_requests += 1
+        if row.get("votes") is not None:
+            voted += 1
+            samples = max(samples, sum(row["votes"]))
+            if row.get("vote_margin") is not None:
+                margin_sum += row["vote_margin"]
+                unanimous += int(row["vote_margin"] == 1)
+    out = {k: bases[0][k] for k in _IDENTITY if bases and k in bases[0]}
+    out.update(s)
+    out["accuracy"] = (s["correct"] / s["total"]) if s["total"] else None
+    out["sat_accuracy"] = (s["sat_correct"] / s["sat_total"]) if s["sat_total"] else None
+    out["unsat_accuracy"] = (s["unsat_correct"] / s["unsat_total"]) if s["unsat_total"] else None
+    if provenance:
+        out["avg_timing_ms"] = _mean(r.get("timing_ms") for r in provenance)
+        out["avg_ttft_ms"] = _mean(r.get("ttft_ms") for r in provenance)
+        out["avg_ttlt_ms"] = _mean(r.get("ttlt_ms") for r in provenance)
+        out["avg_output_tokens_per_s"] = _mean(r.get("output_tokens_per_s") for r in provenance)
+        out["hedged"] = sum(1 for r in provenance if r.get("hedge"))
+        out["hedge_wins"] = sum(1 for r in provenance if r.get("hedge") == "hedge")
+    if pack_requests:
+        out["pack_requests"] = pack_requests
+    else:
+        out.pop("pack_size", None)
+    # Deferred calls leave no row behind; only the shard summaries know about them
+    deferred = sum(b.get("deferred") or 0 for b in bases)
+    if deferred:
+        out["deferred"] = deferred
+        out["deferred_unresolved"] = sum(b.get("deferred_unresolved") or 0 for b in bases)
+    failed = {r.get("id"): r["error"] for r in provenance if r.get("error")}
+    if provenance:
+        errors: Dict[str, int] = {}
+        for r in provenance:
+            if r.get("error"):
+                errors[r.get("error_class") or "error"] = errors.get(r.get("error_class") or "error", 0) + 1
+    else:
+        errors = {}
+        for b in bases:
+            for cls, n in (b.get("errors") or {}).items():
+                errors[cls] = errors.get(cls, 0) + n
+    if errors:
+        out["errors"] = dict(sorted(errors.items()))
+    if voted:
+        out["samples"] = samples
+        out["avg_vote_margin"] = margin_sum / voted
+        out["unanimous"] = unanimous
+    if stages:
+        out["cascade_stages"] = stages
+    sampling = _sampling(bases, results, failed)
+    if sampling is not None:
+        out["sampling"] = sampling
+    circuits = _circuits(bases)
+    if circuits:
+        out["circuit"] = circuits
+    out["shards"] = count
+    out["timestamp"] = int(time.time())
+    return out
+
+
+def find_shards(root: str) -> Dict[Tuple[str, int], Dict[int, str]]:
+    """{(canonical results path, N): {i: shard results path}} for every shard file under root."""
+    groups: Dict[Tuple[str, int], Dict[int, str]] = {}
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            m = _SHARD_FILE.match(name)
+            if not m:
+                continue
+            canonical = os.path.join(dirpath, m.group("stem") + ".jsonl")
+            groups.setdefault((canonical, int(m.group("count"))), {})[int(m.group("index"))] = os.path.join(dirpath, name)
+    return groups
+
+
+def merge_shards(canonical: str, shards: Dict[int, str], count: int, clean: bool = False) -> Dict[str, Any]:
+    """Write canonical results/provenance/summary from the shard files; returns the merged summary."""
+    paths = [shards[i] for i in sorted(shards)]
+    results = _merge_rows(paths)
+    _write_rows(canonical, results)
+    provenance_paths = [p for p in (_derived(p, ".provenance.jsonl") for p in paths) if os.path.exists(p)]
+    provenance: List[Dict[str, Any]] = []
+    if provenance_paths:
+        provenance = _merge_rows(provenance_paths)
+        _write_rows(_derived(canonical, ".provenance.jsonl"), provenance)
+    bases: List[Dict[str, Any]] = []
+    for p in paths:
+        summary_path = _derived(p, ".summary.json")
+        if os.path.exists(summary_path):
+            with open(summary_path, "r") as f:
+                bases.append(json.load(f))
+    if not bases and provenance:
+        bases = [{"provider": provenance[0].get("provider"), "model": provenance[0].get("model")}]
+    summary = _summary(bases, results, provenance, count)
+    write_json_atomic(_derived(canonical, ".summary.json"), summary)
+    if clean:
+        for p in paths:
+            for path in [p] + [_derived(p, suffix) for suffix in _DERIVED]:
+                if os.path.exists(path):
+                    os.remove(path)
+    return summary
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Sharded runs")
+    sub = ap.add_subparsers(dest="command", required=True)
+    mp = sub.add_parser("merge", help="Merge shard outputs into canonical results/provenance/summary files")
+    mp.add_argument("roots", nargs="+", help="Run directories (or any parent) holding *.shard-i-of-N.jsonl files")
+    mp.add_argument("--partial", action="store_true", help="Merge even when some of the N shards are missing")
+    mp.add_argument("--force", action="store_true", help="Overwrite existing canonical files")
+    mp.add_argument("--clean", action="store_true", help="Delete the shard files (and their checkpoints) after merging")
+    args = ap.parse_args()
+
+    failed = False
+    for root in args.roots:
+        groups = find_shards(root)
+        if not groups:
+            print(f"[shards] no shard files under {root}")
+        for (canonical, count), shards in sorted(groups.items()):
+            missing = sorted(set(range(count)) - set(shards))
+            if missing and not args.partial:
+                print(f"[shards] {canonical}: missing shard(s) {missing} of {count}; skipped (use --partial to merge anyway)")
+                failed = True
+                continue
+            if os.path.exists(canonical) and not args.force:
+                print(f"[shards] {canonical} exists; skipped (use --force to overwrite)")
+                failed = True
+                continue
+            summary = merge_shards(canonical, shards, count, clean=args.clean)
+            print(f"[shards] {canonical}: {len(shards)}/{count} shards, {summary['total']} rows, accuracy={summary['accuracy']}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Deferred Anthropic visible-token counts (`visible_tokens: deferred`).
+
+Fills usage.thinking_visible_tokens / usage.text_visible_tokens in
+provenance files after a run instead of calling count_tokens twice per
+message on the hot path. Each distinct (model, kind, text) is counted once
+across all given files, concurrently, and files are rewritten atomically.
+Rows already counted (visible_tokens_source == "count") are left alone, so
+re-running is cheap. Thinking text is taken from raw_response, so rows
+written with include_raw_response: false only get text counts.
+
+Usage:
+    python -m experiments.visible_tokens experiments/runs/<name>/<run>/anthropic/*/*/results.provenance.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from ..utils.anthropic_client import count_visible_tokens
+except Exception:
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+    from utils.anthropic_client import count_visible_tokens
+
+
+def _thinking_text(raw: Any) -> str:
+    if not isinstance(raw, dict):
+        return ""
+    parts = [b.get("thinking") or "" for b in raw.get("content") or [] if isinstance(b, dict) and b.get("type") == "thinking"]
+    return "".join(parts)
+
+
+def _wanted(row: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """(model, kind, text) triples this row still needs counted."""
+    if (row.get("provider") or "").lower() != "anthropic" or row.get("error"):
+        return []
+    usage = row.get("usage")
+    if not isinstance(usage, dict) or usage.get("visible_tokens_source") == "count":
+        return []
+    out: List[Tuple[str, str, str]] = []
+    thinking = _thinking_text(row.get("raw_response"))
+    if thinking:
+        out.append((row.get("model"), "thinking", thinking))
+    if row.get("full_text"):
+        out.append((row.get("model"), "text", row["full_text"]))
+    return out
+
+
+def _count(item: Tuple[str, str, str], attempts: int = 4) -> Optional[int]:
+    model, kind, text = item
+    for attempt in range(attempts):
+        try:
+            return count_visible_tokens(model, kind, text)
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            if getattr(e, "status", None) not in (429, 500, 502, 503, 529) or attempt == attempts - 1:
+                return None
+            time.sleep(retry_after or 2 ** attempt)
+    return None
+
+
+def fill_visible_tokens(paths: Iterable[str], workers: int = 8) -> int:
+    """Count and fill visible tokens in the given provenance files; returns the number of rows updated."""
+    paths = [p for p in paths if p and os.path.exists(p)]
+    todo: Dict[Tuple[str, str, str], Optional[int]] = {}
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except Exception:
+                    continue
+                for item in _wanted(row):
+                    todo.setdefault(item, None)
+    if not todo:
+        return 0
+    items = list(todo)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for item, n in zip(items, executor.map(_count, items)):
+            todo[item] = n
+
+    updated = 0
+    for path in paths:
+        tmp = path + ".tmp"
+        changed = 0
+        with open(path, "r") as src, open(tmp, "w") as dst:
+            for line in src:
+                try:
+                    row = json.loads(line)
+                except Exception:
+                    dst.write(line)
+                    continue
+                wanted = _wanted(row)
+                counts = {kind: todo.get((model, kind, text)) for model, kind, text in wanted}
+                if not wanted or any(v is None for v in counts.values()):
+                    # Leave the row untouched (e.g. counting failed); a later pass retries it
+                    dst.write(line)
+                    continue
+                usage = row["usage"]
+                usage["thinking_visible_tokens"] = counts.get("thinking")
+                usage["text_visible_tokens"] = counts.get("text")
+                usage["visible_tokens_source"] = "count"
+                dst.write(json.dumps(row) + "\n")
+                changed += 1
+        if changed:
+            os.replace(tmp, path)
+            updated += changed
+        else:
+            os.remove(tmp)
+    return updated
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fill Anthropic visible-token counts in provenance files")
+    ap.add_argument("paths", nargs="+", help="*.provenance.jsonl files")
+    ap.add_argument("--workers", type=int, default=8, help="Concurrent count_tokens calls")
+    args = ap.parse_args()
+    n = fill_visible_tokens(args.paths, workers=args.workers)
+    print(f"[visible_tokens] updated {n} rows")
+
+
+if __name__ == "__main__":
+    main()
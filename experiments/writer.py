@@ -0,0 +1,181 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# fsync policies: never (leave it to the OS), flush (after every batch), close (once at the end)
+FSYNC_POLICIES = ("never", "flush", "close")
+
+_FLUSH = object()
+_CLOSE = object()
+
+
+def write_json_atomic(path: str, obj: Any, fsync: bool = False) -> None:
+    """Replace path with obj as JSON via write-to-temp + rename, so readers never see a partial file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, indent=2)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class OutputWriter:
+    """Single thread appending JSONL rows for every output file of a run.
+
+    Producers call write(); rows queue up (bounded: a full queue blocks the
+    producer, so a slow disk slows dispatching instead of growing memory) and
+    the writer thread appends them per file in batches, keeping each file
+    open for the whole run. A batch is flushed when ``flush_rows`` rows or
+    ``flush_bytes`` bytes are pending, ``flush_interval_s`` has passed since
+    the oldest pending row, or on flush()/close(). A row's ``on_written``
+    callback gets the file offset just past it once the batch has reached
+    the OS (and disk, with fsync="flush").
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 1024,
+        flush_rows: int = 256,
+        flush_bytes: int = 1 << 20,
+        flush_interval_s: float = 1.0,
+        fsync: str = "never",
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_bytes = max(1, int(flush_bytes))
+        self.flush_interval_s = float(flush_interval_s)
+        self.fsync = fsync
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._files: Dict[str, Any] = {}
+        self._pending: Dict[str, List[Tuple[bytes, Optional[Callable[[int], None]]]]] = {}
+        self._pending_rows = 0
+        self._pending_bytes = 0
+        self._oldest: Optional[float] = None
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self.rows_written = 0
+        self.flushes = 0
+        self._thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, path: str, line: str, on_written: Optional[Callable[[int], None]] = None) -> None:
+        """Queue one JSONL line (newline added) for path; blocks while the queue is full."""
+        self._check()
+        self._queue.put((path, (line + "\n").encode(), on_written))
+
+    def flush(self) -> None:
+        """Block until everything queued so far is written out."""
+        self._check()
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait()
+        self._check()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_CLOSE, None))
+        self._thread.join()
+        self._check()
+
+    def backlog(self) -> Dict[str, Any]:
+        """Rows not yet on disk: queued for the thread, and pending in its current batch (with the oldest one's age)."""
+        oldest = self._oldest
+        return {
+            "queued_rows": self._queue.qsize(),
+            "pending_rows": self._pending_rows,
+            "pending_bytes": self._pending_bytes,
+            "lag_s": (time.monotonic() - oldest) if oldest is not None else 0.0,
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+        }
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"output writer failed: {self._error}") from self._error
+
+    def _run(self) -> None:
+        while True:
+            timeout = None
+            if self._oldest is not None:
+                timeout = max(0.0, self._oldest + self.flush_interval_s - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._safe_flush()
+                continue
+            if item[0] is _FLUSH:
+                self._safe_flush()
+                item[1].set()
+                continue
+            if item[0] is _CLOSE:
+                self._safe_flush()
+                self._close_files()
+                return
+            path, data, cb = item
+            self._pending.setdefault(path, []).append((data, cb))
+            self._pending_rows += 1
+            self._pending_bytes += len(data)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._pending_rows >= self.flush_rows or self._pending_bytes >= self.flush_bytes:
+                self._safe_flush()
+
+    def _safe_flush(self) -> None:
+        try:
+            self._flush_pending()
+        except BaseException as e:
+            # Surface on the producer side; keep draining so producers never block forever
+            self._error = e
+            self._pending.clear()
+            self._pending_rows = 0
+            self._pending_bytes = 0
+            self._oldest = None
+
+    def _flush_pending(self) -> None:
+        if not self._pending:
+            return
+        callbacks: List[Tuple[Callable[[int], None], int]] = []
+        for path, rows in self._pending.items():
+            f = self._files.get(path)
+            if f is None:
+                d = os.path.dirname(path)
+                if d:
+                    os.makedirs(d, exist_ok=True)
+                f = open(path, "ab")
+                self._files[path] = f
+            offset = f.tell()
+            for data, cb in rows:
+                f.write(data)
+                offset += len(data)
+                if cb is not None:
+                    callbacks.append((cb, offset))
+            f.flush()
+            if self.fsync == "flush":
+                os.fsync(f.fileno())
+        self.rows_written += self._pending_rows
+        self.flushes += 1
+        self._pending.clear()
+        self._pending_rows = 0
+        self._pending_bytes = 0
+        self._oldest = None
+        for cb, offset in callbacks:
+            cb(offset)
+
+    def _close_files(self) -> None:
+        for f in self._files.values():
+            try:
+                if self.fsync != "never":
+                    f.flush()
+                    os.fsync(f.fileno())
+                f.close()
+            except Exception as e:
+                self._error = self._error or e
+        self._files.clear()
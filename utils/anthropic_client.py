@@ -1,20 +1,44 @@
-from typing import Optional, Tuple, Dict, Any
+import asyncio
+import threading
+import weakref
+from typing import Optional, Tuple, Dict, Any, Iterator, List
 import anthropic
+import httpx
 
 from .secrets import load_secrets, get_provider_key
+from .transport import Deadline, get_async_client, get_sync_client
+from .errors import ConnectionFailed, ProviderError, RequestTimeout, error_code, parse_rate_limit_headers, provider_error
+from .sse import StreamTimer
+from .token_estimate import estimate_tokens
 
 
-def chat_completion(prompt: str, model: str, max_tokens: Optional[int] = 1000, temperature: Optional[float] = None, thinking: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+def _credentials() -> Tuple[str, Optional[str]]:
     secrets = load_secrets()
     key = get_provider_key(secrets, "anthropic")
     if not key:
         raise RuntimeError("Missing Anthropic API key in secrets.json or ANTHROPIC_API_KEY")
-    # Use a reasonable client timeout; SDK default is 10 minutes for non-streaming
-    client = anthropic.Anthropic(api_key=key)
+    return key, get_provider_key(secrets, "anthropic", "base_url")
+
+
+def _content(prompt: str, cache_prefix: Optional[str]) -> Any:
+    """User content: the prompt as one string, or split after cache_prefix with a cache breakpoint on the prefix block.
+
+    Prompt caching: https://docs.claude.com/en/docs/build-with-claude/prompt-caching
+    Prefixes below the model's minimum cacheable length are simply not cached.
+    """
+    if not cache_prefix or not prompt.startswith(cache_prefix) or len(prompt) == len(cache_prefix):
+        return prompt
+    return [
+        {"type": "text", "text": cache_prefix, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": prompt[len(cache_prefix):]},
+    ]
+
+
+def _build_kwargs(prompt: str, model: str, max_tokens: Optional[int], temperature: Optional[float], thinking: Optional[Dict[str, Any]], cache_prefix: Optional[str] = None) -> Dict[str, Any]:
     kwargs = {
         "model": model,
         "max_tokens": max_tokens or 1000,
-        "messages": [{"role": "user", "content": prompt}],
+        "messages": [{"role": "user", "content": _content(prompt, cache_prefix)}],
     }
     # Temperature handling: when extended thinking is enabled, Anthropic requires temperature semantics of 1
     # (API errors if you set another value). We therefore ignore provided temperature when thinking is enabled.
@@ -40,22 +64,227 @@ def chat_completion(prompt: str, model: str, max_tokens: Optional[int] = 1000, t
                     kwargs["max_tokens"] = b + 512
             except Exception:
                 pass
-    # Prefer streaming for long/complex requests to avoid SDK 10-minute guard on non-streaming
-    # See: Anthropic SDK docs (long requests, streaming responses)
-    # https://github.com/anthropics/anthropic-sdk-python?tab=readme-ov-file#long-requests
-    # https://github.com/anthropics/anthropic-sdk-python?tab=readme-ov-file#streaming-responses
+    return kwargs
+
+
+def _extract_message_text(message_obj: Any) -> str:
+    parts = []
+    try:
+        for block in getattr(message_obj, "content", []) or []:
+            if getattr(block, "type", None) == "text":
+                t = getattr(block, "text", None)
+                if t:
+                    parts.append(t)
+    except Exception:
+        pass
+    return ("\n".join(parts)).strip()
+
+
+# Cache reads / writes are reported apart from input_tokens (which counts only the uncached rest)
+_USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+
+def _usage(usage_obj: Any) -> Dict[str, Any]:
+    return {k: (getattr(usage_obj, k, None) if usage_obj else None) for k in _USAGE_FIELDS}
+
+
+def _consume_event(event: Any, text_buf: List[str], thinking_buf: List[str]) -> Optional[Dict[str, Any]]:
+    """Accumulate one stream event; returns a usage snapshot for message_delta events."""
+    et = getattr(event, "type", None)
+    if et == "content_block_delta":
+        delta = getattr(event, "delta", None)
+        if not delta:
+            return None
+        dt = getattr(delta, "type", None)
+        if dt == "text_delta":
+            frag = getattr(delta, "text", None)
+            if frag:
+                text_buf.append(frag)
+        elif dt == "thinking_delta":
+            tfrag = getattr(delta, "thinking", None)
+            if tfrag:
+                thinking_buf.append(tfrag)
+        # signature_delta and others are ignored for accumulation
+    elif et == "message_delta":
+        # Capture cumulative usage snapshot if present
+        usage_obj = getattr(event, "usage", None)
+        if usage_obj:
+            return _usage(usage_obj)
+        # Try dict() fallback
+        try:
+            d = getattr(event, "dict", lambda: None)()
+            if isinstance(d, dict) and d.get("usage"):
+                u = d["usage"]
+                return {k: u.get(k) for k in _USAGE_FIELDS}
+        except Exception:
+            pass
+    # ignore other event types
+    return None
+
+
+def _finalize(final_msg: Any, text: str, last_stream_usage: Dict[str, Any], meta: Dict[str, Any]) -> str:
+    """Populate meta from the final streamed message; returns the (possibly recovered) text."""
+    if final_msg:
+        try:
+            meta["raw_response"] = getattr(final_msg, "dict", lambda: final_msg)()
+        except Exception:
+            meta["raw_response"] = None
+        meta["finish_reason"] = getattr(final_msg, "stop_reason", None)
+        meta["usage"] = _usage(getattr(final_msg, "usage", None))
+        # If final message lacked usage, fallback to the last streamed usage snapshot
+        if (meta["usage"].get("input_tokens") is None and meta["usage"].get("output_tokens") is None) and last_stream_usage:
+            meta["usage"].update(last_stream_usage)
+        if not text:
+            try:
+                text = _extract_message_text(final_msg)
+            except Exception:
+                pass
+    return text
 
-    def _extract_message_text(message_obj: Any) -> str:
-        parts = []
+
+def _count_messages(kind: str, content: str) -> List[Dict[str, Any]]:
+    # Visible content is counted as an assistant block of the given type ("thinking" or "text")
+    return [{"role": "assistant", "content": [{"type": kind, kind: content}]}]
+
+
+def _count_value(count_resp: Any) -> Optional[int]:
+    n = getattr(count_resp, "input_tokens", None)
+    if n is None and hasattr(count_resp, "dict"):
+        try:
+            n = count_resp.dict().get("input_tokens")
+        except Exception:
+            pass
+    return n
+
+
+# How usage.thinking_visible_tokens / text_visible_tokens are filled:
+# estimate: local estimator, no API call; deferred: left empty for experiments.visible_tokens to count
+# after the run; inline: two count_tokens calls per message (exact, but on the hot path); none: not filled
+VISIBLE_TOKEN_MODES = ("estimate", "deferred", "inline", "none")
+_VISIBLE_TOKENS = {"mode": "estimate"}
+
+
+def configure_visible_tokens(mode: str) -> None:
+    if mode not in VISIBLE_TOKEN_MODES:
+        raise ValueError(f"visible_tokens must be one of {VISIBLE_TOKEN_MODES}, got {mode!r}")
+    _VISIBLE_TOKENS["mode"] = mode
+
+
+def _visible_usage(meta: Dict[str, Any], thinking_text: str, text: str) -> bool:
+    """Fill visible-token fields without network calls; True when the caller should count inline."""
+    mode = _VISIBLE_TOKENS["mode"]
+    u = meta.setdefault("usage", {})
+    if mode == "inline":
+        u["visible_tokens_source"] = "count"
+        return True
+    if mode == "estimate":
+        if thinking_text:
+            u["thinking_visible_tokens"] = estimate_tokens(thinking_text)
+        if text:
+            u["text_visible_tokens"] = estimate_tokens(text)
+        u["visible_tokens_source"] = "estimate"
+    return False
+
+
+def count_visible_tokens(model: str, kind: str, content: str) -> Optional[int]:
+    """Exact token count of assistant content of the given kind ("thinking" or "text") via count_tokens."""
+    key, base_url = _credentials()
+    try:
+        return _count_value(_sync_client(key, base_url).messages.count_tokens(model=model, messages=_count_messages(kind, content)))
+    except anthropic.APIError as e:
+        raise _provider_error(e)
+
+
+def _reasoning_usage(meta: Dict[str, Any], thinking: Optional[Dict[str, Any]]) -> None:
+    # Expose billed reasoning tokens when thinking is enabled (as total output tokens billed)
+    if thinking and thinking.get("enabled"):
         try:
-            for block in getattr(message_obj, "content", []) or []:
-                if getattr(block, "type", None) == "text":
-                    t = getattr(block, "text", None)
-                    if t:
-                        parts.append(t)
+            out_total = meta.get("usage", {}).get("output_tokens")
+            u = meta.setdefault("usage", {})
+            u["reasoning_tokens_billed"] = out_total
+            # Back-compat: populate reasoning_tokens field used by runner/provenance
+            u["reasoning_tokens"] = out_total
         except Exception:
             pass
-        return ("\n".join(parts)).strip()
+    else:
+        # Ensure reasoning_tokens exists for schema compatibility
+        meta.setdefault("usage", {})["reasoning_tokens"] = None
+
+
+def _provider_error(e: Exception) -> ProviderError:
+    # Keep status and headers (Retry-After, anthropic-ratelimit-*) so the runner can back off
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    status = getattr(e, "status_code", None)
+    if isinstance(e, anthropic.APITimeoutError):
+        return RequestTimeout("read", None, provider="anthropic")
+    if isinstance(e, anthropic.APIConnectionError):
+        return ConnectionFailed(f"Anthropic connection error: {e}", provider="anthropic")
+    body = getattr(e, "body", None)
+    # {"type": "error", "error": {"type": "overloaded_error", "message": ...}}
+    code = error_code((body.get("error") if isinstance(body, dict) else None) or body)
+    if status is None:
+        return provider_error(f"Anthropic error: {e}", provider="anthropic", code=code, headers=headers)
+    return provider_error(f"Anthropic error {status}: {getattr(e, 'message', e)}", provider="anthropic", status=status, code=code, headers=headers)
+
+
+# Raised for a call that ran out of time: the SDK's own timeout, or a transport deadline surfacing through httpx
+_TIMEOUT_ERRORS = (RequestTimeout, anthropic.APITimeoutError, httpx.TimeoutException)
+
+
+def _timeout_error(e: BaseException, deadline: Optional[Deadline]) -> RequestTimeout:
+    # The transport's RequestTimeout (with its phase) sits somewhere down the SDK's exception chain
+    cause: Optional[BaseException] = e
+    while cause is not None and not isinstance(cause, RequestTimeout):
+        cause = cause.__cause__ or cause.__context__
+    phase = cause.phase if cause is not None else "read"
+    # The SDK only knows connect/read limits; report the call's total deadline when that is what ran out
+    err = deadline.error(phase) if deadline is not None else RequestTimeout(phase, getattr(cause, "limit_s", None))
+    return RequestTimeout(err.phase, err.limit_s, provider="anthropic")
+
+
+def _with_deadline(kwargs: Dict[str, Any], deadline: Optional[Deadline]) -> Dict[str, Any]:
+    return dict(kwargs, timeout=deadline.httpx_timeout()) if deadline is not None else kwargs
+
+
+def _stream_rate_limit(stream: Any) -> Optional[Dict[str, Any]]:
+    try:
+        return parse_rate_limit_headers(stream.response.headers)
+    except Exception:
+        return None
+
+
+def _create_meta(resp: Any) -> Dict[str, Any]:
+    return {
+        "raw_response": getattr(resp, "dict", lambda: resp)(),
+        "finish_reason": getattr(resp, "stop_reason", None),
+        "usage": _usage(getattr(resp, "usage", None)),
+    }
+
+
+# One Anthropic client per (key, base_url) for the process, riding on the shared keep-alive pool
+_sync_clients: Dict[Tuple[str, Optional[str]], anthropic.Anthropic] = {}
+_sync_clients_lock = threading.Lock()
+
+
+def _sync_client(key: str, base_url: Optional[str]) -> anthropic.Anthropic:
+    with _sync_clients_lock:
+        client = _sync_clients.get((key, base_url))
+        if client is None:
+            # Retries are owned by the runner so throttling is visible to its concurrency control
+            client = anthropic.Anthropic(api_key=key, base_url=base_url, http_client=get_sync_client(), max_retries=0)
+            _sync_clients[(key, base_url)] = client
+        return client
+
+
+def chat_completion(prompt: str, model: str, max_tokens: Optional[int] = 1000, temperature: Optional[float] = None, thinking: Optional[Dict[str, Any]] = None, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    key, base_url = _credentials()
+    client = _sync_client(key, base_url)
+    kwargs = _build_kwargs(prompt, model, max_tokens, temperature, thinking, cache_prefix)
+    # Prefer streaming for long/complex requests to avoid SDK 10-minute guard on non-streaming
+    # See: Anthropic SDK docs (long requests, streaming responses)
+    # https://github.com/anthropics/anthropic-sdk-python?tab=readme-ov-file#long-requests
+    # https://github.com/anthropics/anthropic-sdk-python?tab=readme-ov-file#streaming-responses
 
     # Always stream to avoid non-stream 10-minute guard
     text_buf: list[str] = []
@@ -63,142 +292,206 @@ def chat_completion(prompt: str, model: str, max_tokens: Optional[int] = 1000, t
     last_stream_usage: Dict[str, Any] = {}
     meta: Dict[str, Any] = {"raw_response": None, "finish_reason": "stream_stop", "usage": {}}
     # Prefer the SDK streaming context manager to reliably access final message (with usage)
+    timer = StreamTimer()
     try:
-        with client.messages.stream(**kwargs) as stream:
+        with client.messages.stream(**_with_deadline(kwargs, deadline)) as stream:
             # Prefer low-level iteration so we can capture text, thinking, and message_delta usage
             for event in stream:
-                et = getattr(event, "type", None)
-                if et == "content_block_delta":
-                    delta = getattr(event, "delta", None)
-                    if not delta:
-                        continue
-                    dt = getattr(delta, "type", None)
-                    if dt == "text_delta":
-                        frag = getattr(delta, "text", None)
-                        if frag:
-                            text_buf.append(frag)
-                    elif dt == "thinking_delta":
-                        tfrag = getattr(delta, "thinking", None)
-                        if tfrag:
-                            thinking_buf.append(tfrag)
-                    # signature_delta and others are ignored for accumulation
-                elif et == "message_delta":
-                    # Capture cumulative usage snapshot if present
-                    usage_obj = getattr(event, "usage", None)
-                    if usage_obj:
-                        last_stream_usage = {
-                            "input_tokens": getattr(usage_obj, "input_tokens", None),
-                            "output_tokens": getattr(usage_obj, "output_tokens", None),
-                        }
-                    else:
-                        # Try dict() fallback
-                        try:
-                            d = getattr(event, "dict", lambda: None)()
-                            if isinstance(d, dict) and d.get("usage"):
-                                u = d["usage"]
-                                last_stream_usage = {
-                                    "input_tokens": u.get("input_tokens"),
-                                    "output_tokens": u.get("output_tokens"),
-                                }
-                        except Exception:
-                            pass
-                else:
-                    # ignore other event types
-                    pass
+                if deadline is not None:
+                    # Leaving the block closes the response, so the call stops here
+                    deadline.check()
+                if getattr(event, "type", None) == "content_block_delta":
+                    timer.token()
+                snapshot = _consume_event(event, text_buf, thinking_buf)
+                if snapshot:
+                    last_stream_usage = snapshot
+            timer.done()
             # Get final message containing usage
             try:
                 final_msg = stream.get_final_message()
             except Exception:
                 final_msg = None
-        text = ("".join(text_buf)).strip()
-        if final_msg:
-            # Populate meta from final message
-            try:
-                meta["raw_response"] = getattr(final_msg, "dict", lambda: final_msg)()
-            except Exception:
-                meta["raw_response"] = None
-            meta["finish_reason"] = getattr(final_msg, "stop_reason", None)
-            usage_obj = getattr(final_msg, "usage", None)
-            meta["usage"] = {
-                "input_tokens": getattr(usage_obj, "input_tokens", None) if usage_obj else None,
-                "output_tokens": getattr(usage_obj, "output_tokens", None) if usage_obj else None,
-            }
-            # If final message lacked usage, fallback to the last streamed usage snapshot
-            if (meta["usage"].get("input_tokens") is None and meta["usage"].get("output_tokens") is None) and last_stream_usage:
-                meta["usage"].update(last_stream_usage)
-            if not text:
-                try:
-                    text = _extract_message_text(final_msg)
-                except Exception:
-                    pass
+            meta["rate_limit"] = _stream_rate_limit(stream)
+        text = _finalize(final_msg, ("".join(text_buf)).strip(), last_stream_usage, meta)
+        meta["latency"] = timer.as_meta()
         # Optionally compute visible token counts for thinking/text; expose billed reasoning via usage
-        if thinking_buf:
-            thinking_text = "".join(thinking_buf)
+        inline = _visible_usage(meta, "".join(thinking_buf), text)
+        if inline and thinking_buf:
             try:
                 # Count tokens for the thinking content; API returns an object with input_tokens
                 # We pass the thinking block as assistant content of type "thinking"
-                count_resp = client.messages.count_tokens(
-                    model=kwargs["model"],
-                    messages=[{"role": "assistant", "content": [{"type": "thinking", "thinking": thinking_text}]}],
-                )
-                t_thinking = getattr(count_resp, "input_tokens", None)
-                if t_thinking is None and hasattr(count_resp, "dict"):
-                    try:
-                        t_thinking = count_resp.dict().get("input_tokens")
-                    except Exception:
-                        pass
-                meta.setdefault("usage", {})["thinking_visible_tokens"] = t_thinking
+                count_resp = client.messages.count_tokens(model=kwargs["model"], messages=_count_messages("thinking", "".join(thinking_buf)))
+                meta.setdefault("usage", {})["thinking_visible_tokens"] = _count_value(count_resp)
             except Exception:
                 # If count endpoint not available or thinking blocks not countable, leave as None
                 meta.setdefault("usage", {})["thinking_visible_tokens"] = None
         # Count visible final text tokens as well
         try:
-            if text:
-                c_text = client.messages.count_tokens(
-                    model=kwargs["model"],
-                    messages=[{"role": "assistant", "content": [{"type": "text", "text": text}]}],
-                )
-                t_text = getattr(c_text, "input_tokens", None)
-                if t_text is None and hasattr(c_text, "dict"):
-                    try:
-                        t_text = c_text.dict().get("input_tokens")
-                    except Exception:
-                        pass
-                meta.setdefault("usage", {})["text_visible_tokens"] = t_text
+            if inline and text:
+                c_text = client.messages.count_tokens(model=kwargs["model"], messages=_count_messages("text", text))
+                meta.setdefault("usage", {})["text_visible_tokens"] = _count_value(c_text)
         except Exception:
             meta.setdefault("usage", {})["text_visible_tokens"] = None
-        # Expose billed reasoning tokens when thinking is enabled (as total output tokens billed)
-        if thinking and thinking.get("enabled"):
-            try:
-                out_total = meta.get("usage", {}).get("output_tokens")
-                u = meta.setdefault("usage", {})
-                u["reasoning_tokens_billed"] = out_total
-                # Back-compat: populate reasoning_tokens field used by runner/provenance
-                u["reasoning_tokens"] = out_total
-            except Exception:
-                pass
-        else:
-            # Ensure reasoning_tokens exists for schema compatibility
-            meta.setdefault("usage", {})["reasoning_tokens"] = None
+        _reasoning_usage(meta, thinking)
         return text, meta
+    except _TIMEOUT_ERRORS as e:
+        # Out of time: a non-stream retry would only run past the deadline again
+        raise _timeout_error(e, deadline)
+    except anthropic.APIStatusError as e:
+        # The API refused the request; a non-stream retry would be refused too
+        raise _provider_error(e)
     except Exception:
         # As a last resort, try non-stream to ensure we at least get a response and usage
         try:
-            resp = client.messages.create(**kwargs)
+            resp = client.messages.create(**_with_deadline(kwargs, deadline))
             text = _extract_message_text(resp)
             if not text:
                 text = str(resp)
-            meta = {
-                "raw_response": getattr(resp, "dict", lambda: resp)(),
-                "finish_reason": getattr(resp, "stop_reason", None),
-                "usage": {
-                    "input_tokens": getattr(getattr(resp, "usage", None), "input_tokens", None),
-                    "output_tokens": getattr(getattr(resp, "usage", None), "output_tokens", None),
-                },
-            }
-            return text, meta
+            return text, _create_meta(resp)
+        except _TIMEOUT_ERRORS as e:
+            raise _timeout_error(e, deadline)
+        except anthropic.APIError as e:
+            raise _provider_error(e)
         except Exception:
             # Give up; return empty usage
             return "", meta
 
 
+# One AsyncAnthropic per (event loop, key, base_url), riding on the loop's shared HTTP client
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _async_client(key: str, base_url: Optional[str]) -> anthropic.AsyncAnthropic:
+    per_loop = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = per_loop.get((key, base_url))
+    if client is None:
+        client = anthropic.AsyncAnthropic(api_key=key, base_url=base_url, http_client=get_async_client(), max_retries=0)
+        per_loop[(key, base_url)] = client
+    return client
+
+
+async def achat_completion(prompt: str, model: str, max_tokens: Optional[int] = 1000, temperature: Optional[float] = None, thinking: Optional[Dict[str, Any]] = None, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Asyncio variant of chat_completion; same streaming and metadata semantics."""
+    key, base_url = _credentials()
+    client = _async_client(key, base_url)
+    kwargs = _build_kwargs(prompt, model, max_tokens, temperature, thinking, cache_prefix)
+    text_buf: list[str] = []
+    thinking_buf: list[str] = []
+    last_stream_usage: Dict[str, Any] = {}
+    meta: Dict[str, Any] = {"raw_response": None, "finish_reason": "stream_stop", "usage": {}}
+    timer = StreamTimer()
+    try:
+        async with client.messages.stream(**_with_deadline(kwargs, deadline)) as stream:
+            async for event in stream:
+                if deadline is not None:
+                    deadline.check()
+                if getattr(event, "type", None) == "content_block_delta":
+                    timer.token()
+                snapshot = _consume_event(event, text_buf, thinking_buf)
+                if snapshot:
+                    last_stream_usage = snapshot
+            timer.done()
+            try:
+                final_msg = await stream.get_final_message()
+            except Exception:
+                final_msg = None
+            meta["rate_limit"] = _stream_rate_limit(stream)
+        text = _finalize(final_msg, ("".join(text_buf)).strip(), last_stream_usage, meta)
+        meta["latency"] = timer.as_meta()
+        inline = _visible_usage(meta, "".join(thinking_buf), text)
+        if inline and thinking_buf:
+            try:
+                count_resp = await client.messages.count_tokens(model=kwargs["model"], messages=_count_messages("thinking", "".join(thinking_buf)))
+                meta.setdefault("usage", {})["thinking_visible_tokens"] = _count_value(count_resp)
+            except Exception:
+                meta.setdefault("usage", {})["thinking_visible_tokens"] = None
+        try:
+            if inline and text:
+                c_text = await client.messages.count_tokens(model=kwargs["model"], messages=_count_messages("text", text))
+                meta.setdefault("usage", {})["text_visible_tokens"] = _count_value(c_text)
+        except Exception:
+            meta.setdefault("usage", {})["text_visible_tokens"] = None
+        _reasoning_usage(meta, thinking)
+        return text, meta
+    except _TIMEOUT_ERRORS as e:
+        raise _timeout_error(e, deadline)
+    except anthropic.APIStatusError as e:
+        raise _provider_error(e)
+    except Exception:
+        try:
+            resp = await client.messages.create(**_with_deadline(kwargs, deadline))
+            text = _extract_message_text(resp)
+            if not text:
+                text = str(resp)
+            return text, _create_meta(resp)
+        except _TIMEOUT_ERRORS as e:
+            raise _timeout_error(e, deadline)
+        except anthropic.APIError as e:
+            raise _provider_error(e)
+        except Exception:
+            return "", meta
+
+
+# Message Batches API: https://docs.claude.com/en/docs/build-with-claude/batch-processing
+BATCH_MAX_REQUESTS = 100000
+BATCH_MAX_BYTES = 200 * 1024 * 1024
+
+
+def batch_request(custom_id: str, prompt: str, model: str, max_tokens: Optional[int] = 1000, temperature: Optional[float] = None, thinking: Optional[Dict[str, Any]] = None, cache_prefix: Optional[str] = None) -> Dict[str, Any]:
+    """One Message Batches request; params are the same kwargs chat_completion streams with."""
+    return {"custom_id": custom_id, "params": _build_kwargs(prompt, model, max_tokens, temperature, thinking, cache_prefix)}
+
+
+def create_batch(model: str, requests: List[Dict[str, Any]]) -> str:
+    """Submit a message batch; returns its id."""
+    key, base_url = _credentials()
+    try:
+        return _sync_client(key, base_url).messages.batches.create(requests=requests).id
+    except anthropic.APIError as e:
+        raise _provider_error(e)
+
+
+def get_batch(batch_id: str) -> Dict[str, Any]:
+    """Batch status as {state: running|ended, status, counts, raw}."""
+    key, base_url = _credentials()
+    try:
+        batch = _sync_client(key, base_url).messages.batches.retrieve(batch_id)
+    except anthropic.APIError as e:
+        raise _provider_error(e)
+    counts = getattr(batch, "request_counts", None)
+    return {
+        "state": ("ended" if batch.processing_status == "ended" else "running"),
+        "status": batch.processing_status,
+        "counts": (counts.model_dump() if counts is not None else None),
+        "raw": batch.model_dump(mode="json"),
+    }
+
+
+def batch_results(batch: Dict[str, Any]) -> Iterator[Tuple[str, Optional[str], Optional[Dict[str, Any]], Optional[str]]]:
+    """Yield (custom_id, text, meta, error) for every request the ended batch reported on."""
+    key, base_url = _credentials()
+    raw_batch = batch.get("raw") or {}
+    try:
+        results = _sync_client(key, base_url).messages.batches.results(raw_batch.get("id"))
+    except anthropic.APIError as e:
+        raise _provider_error(e)
+    for item in results:
+        result = item.result
+        if result.type in ("canceled", "expired"):
+            # Never ran: leave it out so the caller resubmits it
+            continue
+        if result.type != "succeeded":
+            detail = getattr(getattr(getattr(result, "error", None), "error", None), "message", None)
+            yield item.custom_id, None, None, f"Anthropic batch request {result.type}" + (f": {detail}" if detail else "")
+            continue
+        message = result.message
+        text = _extract_message_text(message)
+        meta = _create_meta(message)
+        meta["raw_response"] = message.model_dump(mode="json")
+        has_thinking = any(getattr(b, "type", None) in ("thinking", "redacted_thinking") for b in (message.content or []))
+        _reasoning_usage(meta, {"enabled": True} if has_thinking else None)
+        if _VISIBLE_TOKENS["mode"] == "estimate":
+            # Batch results are never counted inline; deferred mode fills them after collection
+            thinking_text = "".join(getattr(b, "thinking", "") or "" for b in (message.content or []) if getattr(b, "type", None) == "thinking")
+            _visible_usage(meta, thinking_text, text)
+        yield item.custom_id, text, meta, None
@@ -0,0 +1,248 @@
+import asyncio
+import http.client
+import json
+import re
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple, Union
+
+
+HeadersLike = Union[Mapping[str, str], Iterable[Tuple[str, str]], None]
+
+
+class ProviderError(RuntimeError):
+    """Non-success response from a provider API, keeping what the runner needs to react to it.
+
+    status is the HTTP status, code the provider's own error code (OpenAI
+    error.code / type, Gemini error.status, Anthropic error.type). Subclasses
+    fix error_class (results rows, adaptive concurrency) and whether a retry
+    can succeed; build them with provider_error().
+    """
+
+    error_class = "error"
+    retriable = True  # unknown failures get the benefit of the doubt
+
+    def __init__(self, message: str, provider: Optional[str] = None, status: Optional[int] = None, headers: HeadersLike = None, retry_after: Optional[float] = None, code: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.code = code
+        self.headers = lower_headers(headers)
+        self.retry_after = retry_after if retry_after is not None else parse_retry_after(self.headers)
+
+
+class RateLimitError(ProviderError):
+    """429: requests or tokens per minute exceeded."""
+
+    error_class = "rate_limit"
+
+
+class QuotaExceeded(ProviderError):
+    """Billing quota or account usage limit spent; retrying within the run cannot help."""
+
+    error_class = "quota"
+    retriable = False
+
+
+class Overloaded(ProviderError):
+    """503 / 529: the provider is shedding load."""
+
+    error_class = "overloaded"
+
+
+class ServerError(ProviderError):
+    """Other 5xx (and 408 / 409): a transient failure on the provider's side."""
+
+    error_class = "server"
+
+
+class AuthError(ProviderError):
+    """401 / 403: bad key or no access to the model."""
+
+    error_class = "auth"
+    retriable = False
+
+
+class InvalidRequest(ProviderError):
+    """Other 4xx: the request itself is wrong (bad parameter, unknown model, prompt too long)."""
+
+    error_class = "invalid_request"
+    retriable = False
+
+
+class ConnectionFailed(ProviderError):
+    """No HTTP response at all (connection refused or reset)."""
+
+    error_class = "connection"
+
+
+class RequestTimeout(ProviderError):
+    """A call ran past one of its deadlines; phase is "connect", "read" or "total"."""
+
+    error_class = "timeout"
+
+    def __init__(self, phase: str, limit_s: Optional[float], provider: Optional[str] = None) -> None:
+        limit = f" after {limit_s:g}s" if limit_s is not None else ""
+        super().__init__(f"{provider or 'request'} {phase} timeout{limit}", provider=provider)
+        self.phase = phase
+        self.limit_s = limit_s
+
+
+_QUOTA_CODES = {"insufficient_quota", "billing_hard_limit_reached", "billing_not_active"}
+_OVERLOADED_CODES = {"overloaded_error", "UNAVAILABLE", "server_is_overloaded"}
+_RATE_LIMIT_CODES = {"rate_limit_exceeded", "rate_limit_error", "RESOURCE_EXHAUSTED"}
+_AUTH_CODES = {"invalid_api_key", "authentication_error", "permission_error", "UNAUTHENTICATED", "PERMISSION_DENIED"}
+_SERVER_CODES = {"server_error", "api_error", "INTERNAL", "DEADLINE_EXCEEDED"}
+
+
+def _error_type(status: Optional[int], code: Optional[str], message: str) -> type:
+    c = str(code or "")
+    # Anthropic reports spent usage limits as a 400 invalid_request_error
+    if c in _QUOTA_CODES or "usage limits" in message.lower():
+        return QuotaExceeded
+    if c in _OVERLOADED_CODES or status in (503, 529):
+        return Overloaded
+    if c in _RATE_LIMIT_CODES or status == 429:
+        return RateLimitError
+    if c in _AUTH_CODES or status in (401, 403):
+        return AuthError
+    if c in _SERVER_CODES or (status is not None and (status >= 500 or status in (408, 409))):
+        return ServerError
+    if status is not None and 400 <= status < 500:
+        return InvalidRequest
+    return ProviderError
+
+
+def provider_error(message: str, provider: Optional[str] = None, status: Optional[int] = None, code: Optional[str] = None, headers: HeadersLike = None, retry_after: Optional[float] = None) -> ProviderError:
+    """The ProviderError subclass for an HTTP status and provider error code."""
+    cls = _error_type(status, code, message)
+    return cls(message, provider=provider, status=status, headers=headers, retry_after=retry_after, code=(str(code) if code is not None else None))
+
+
+# Broken HTTP exchanges that did not surface as ConnectionFailed (truncated body, garbled status line)
+_WIRE_ERRORS = (OSError, http.client.HTTPException, asyncio.IncompleteReadError)
+
+
+def error_class(e: BaseException) -> str:
+    """Compact class of any exception a call can raise (see ProviderError subclasses)."""
+    if isinstance(e, ProviderError):
+        return e.error_class
+    if isinstance(e, TimeoutError):
+        return "timeout"
+    if isinstance(e, _WIRE_ERRORS):
+        return "connection"
+    return "error"
+
+
+def is_retriable(e: BaseException) -> bool:
+    """Whether another attempt can succeed: throttling, overload, server errors, timeouts and dropped connections.
+
+    Exceptions from outside the HTTP exchange (a bad config value, a parsing
+    bug) are not; they would fail the same way every time.
+    """
+    if isinstance(e, ProviderError):
+        return e.retriable
+    return isinstance(e, _WIRE_ERRORS)
+
+
+def lower_headers(headers: HeadersLike) -> Dict[str, str]:
+    if not headers:
+        return {}
+    items = headers.items() if hasattr(headers, "items") else headers
+    return {str(k).lower(): str(v) for k, v in items}
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds from '20', '1.5s', '6m0s', '250ms' or an RFC 3339 / HTTP date; None if unparseable."""
+    if value is None:
+        return None
+    v = str(value).strip()
+    if not v:
+        return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(v)
+    if parts and "".join(n + u for n, u in parts) == v:
+        scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+        return sum(float(n) * scale[u] for n, u in parts)
+    # Absolute timestamps (Anthropic reset headers, HTTP-date Retry-After)
+    try:
+        ts = datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        try:
+            ts = parsedate_to_datetime(v).timestamp()
+        except Exception:
+            return None
+    return max(0.0, ts - time.time())
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    if not headers:
+        return None
+    if headers.get("retry-after-ms") is not None:
+        ms = parse_duration(headers.get("retry-after-ms"))
+        if ms is not None:
+            return ms / 1000.0
+    return parse_duration(headers.get("retry-after"))
+
+
+def parse_rate_limit_headers(headers: HeadersLike) -> Optional[Dict[str, Any]]:
+    """Normalize OpenAI x-ratelimit-* and Anthropic anthropic-ratelimit-* headers.
+
+    Returns {limit_requests, remaining_requests, reset_requests_s, limit_tokens,
+    remaining_tokens, reset_tokens_s, retry_after_s} with None for missing
+    fields, or None when the response carried no rate-limit headers at all.
+    """
+    h = lower_headers(headers)
+    out: Dict[str, Any] = {}
+    for kind in ("requests", "tokens"):
+        limit = h.get(f"x-ratelimit-limit-{kind}") or h.get(f"anthropic-ratelimit-{kind}-limit")
+        remaining = h.get(f"x-ratelimit-remaining-{kind}") or h.get(f"anthropic-ratelimit-{kind}-remaining")
+        reset = h.get(f"x-ratelimit-reset-{kind}") or h.get(f"anthropic-ratelimit-{kind}-reset")
+        out[f"limit_{kind}"] = _to_int(limit)
+        out[f"remaining_{kind}"] = _to_int(remaining)
+        out[f"reset_{kind}_s"] = parse_duration(reset)
+    out["retry_after_s"] = parse_retry_after(h)
+    if all(v is None for v in out.values()):
+        return None
+    return out
+
+
+def _to_int(v: Optional[str]) -> Optional[int]:
+    try:
+        return int(float(v)) if v is not None else None
+    except ValueError:
+        return None
+
+
+def error_code(err: Any) -> Optional[str]:
+    """Provider error code from an error object: OpenAI code / type, Gemini status, Anthropic type."""
+    if not isinstance(err, dict):
+        return None
+    code = err.get("code")
+    if isinstance(code, int) or not code:
+        # Gemini's code repeats the HTTP status; its status string is the specific one
+        code = err.get("status") or err.get("type")
+    return str(code) if code else None
+
+
+def error_message(raw: bytes) -> Tuple[str, Optional[str], Optional[float]]:
+    """(message, provider error code, retry delay) from a JSON error body; Gemini puts the delay in RetryInfo details."""
+    try:
+        data = json.loads(raw)
+    except Exception:
+        return raw.decode("utf-8", errors="ignore"), None, None
+    err = data.get("error") if isinstance(data, dict) else None
+    if not isinstance(err, dict):
+        return str(data), None, None
+    retry = None
+    for d in err.get("details") or []:
+        if isinstance(d, dict) and str(d.get("@type", "")).endswith("RetryInfo"):
+            retry = parse_duration(d.get("retryDelay"))
+    return err.get("message", ""), error_code(err), retry
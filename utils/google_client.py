@@ -1,16 +1,21 @@
 import json
-import http.client
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 
 from .secrets import load_secrets, get_provider_key
+from .transport import Deadline, get_async_pool, get_pool
+from .errors import error_code, error_message, parse_rate_limit_headers, provider_error
+from .sse import StreamTimer, aiter_sse, iter_sse, sse_json
 
 
-def _extract_text(data: Dict[str, Any]) -> str:
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+
+def _extract_text(data: Dict[str, Any], index: int = 0) -> str:
     try:
         candidates = data.get("candidates") or []
-        if not candidates:
+        if len(candidates) <= index:
             return ""
-        parts = (((candidates[0] or {}).get("content") or {}).get("parts")) or []
+        parts = (((candidates[index] or {}).get("content") or {}).get("parts")) or []
         texts = []
         for p in parts:
             t = p.get("text")
@@ -21,17 +26,17 @@ def _extract_text(data: Dict[str, Any]) -> str:
         return ""
 
 
-def chat_completion(prompt: str, model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, thinking: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+def _credentials() -> Tuple[str, str]:
     secrets = load_secrets()
     # support both keys
     key = get_provider_key(secrets, "google") or get_provider_key(secrets, "gemini")
     if not key:
         raise RuntimeError("Missing Google/Gemini API key in secrets.json or GOOGLE_API_KEY/GEMINI_API_KEY")
+    base_url = get_provider_key(secrets, "google", "base_url") or get_provider_key(secrets, "gemini", "base_url") or DEFAULT_BASE_URL
+    return key, base_url
 
-    host = "generativelanguage.googleapis.com"
-    # Include key in query param (in addition to header) for broader compatibility
-    path = f"/v1beta/models/{model}:generateContent?key={key}"
 
+def _build_body(prompt: str, model: str, max_tokens: Optional[int], temperature: float, thinking: Optional[Dict[str, Any]], n: int = 1) -> Dict[str, Any]:
     body: Dict[str, Any] = {
         "contents": [
             {
@@ -100,40 +105,222 @@ def chat_completion(prompt: str, model: str, max_tokens: Optional[int] = None, t
         pass
     if max_tokens is not None:
         body["generationConfig"]["maxOutputTokens"] = int(max_tokens)
+    if n > 1:
+        # Several samples from one request (self-consistency); usage covers all of them
+        body["generationConfig"]["candidateCount"] = int(n)
+    return body
 
-    conn = http.client.HTTPSConnection(host)
-    conn.request(
-        "POST",
-        path,
-        json.dumps(body),
-        headers={
-            "Content-Type": "application/json",
-            "x-goog-api-key": key,
-        },
-    )
-    resp = conn.getresponse()
-    raw = resp.read()
-    if resp.status != 200:
-        try:
-            data = json.loads(raw)
-            message = data.get("error", {}).get("message", "")
-        except Exception:
-            message = raw.decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Gemini error {resp.status} {resp.reason}: {message}")
+
+def _decode(status: int, reason: str, raw: bytes, headers: Any = None) -> Dict[str, Any]:
+    if status != 200:
+        # 429 bodies carry google.rpc.RetryInfo with the suggested delay
+        message, code, retry_after = error_message(raw)
+        raise provider_error(f"Gemini error {status} {reason}: {message}", provider="google", status=status, code=code, headers=headers, retry_after=retry_after)
     try:
-        data = json.loads(raw)
+        return json.loads(raw)
     except Exception:
         raise RuntimeError(f"Gemini response is not JSON: {raw}")
-    finally:
-        conn.close()
+
+
+def _parse_response(data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
     text = _extract_text(data)
     meta: Dict[str, Any] = {
         "raw_response": data,
         "finish_reason": None,
         "usage": (data.get("usageMetadata") or {}),
     }
+    candidates = data.get("candidates") or []
+    if len(candidates) > 1:
+        meta["candidates"] = [_extract_text(data, i) for i in range(len(candidates))]
     return text, meta
 
 
+class _StreamState:
+    """Accumulates streamGenerateContent chunks into one generateContent-shaped response."""
+
+    def __init__(self, timer: StreamTimer) -> None:
+        self.timer = timer
+        self.parts: List[Dict[str, Any]] = []
+        self.last: Dict[str, Any] = {}
+        self.finish_reason: Optional[str] = None
+        self.usage: Dict[str, Any] = {}
+
+    def consume(self, event: Optional[str], data: str) -> None:
+        obj = sse_json(event, data)
+        if obj is None:
+            return
+        if obj.get("error"):
+            err = obj["error"]
+            raise provider_error(f"Gemini stream error {err.get('code')}: {err.get('message')}", provider="google", status=err.get("code"), code=error_code(err))
+        self.last = obj
+        for cand in (obj.get("candidates") or [])[:1]:
+            for part in ((cand or {}).get("content") or {}).get("parts") or []:
+                if part.get("text"):
+                    self.timer.token()
+                    # Adjacent fragments of the same kind (answer vs. thought summary) are joined
+                    if self.parts and bool(self.parts[-1].get("thought")) == bool(part.get("thought")):
+                        self.parts[-1]["text"] += part["text"]
+                    else:
+                        self.parts.append(dict(part))
+            if cand.get("finishReason"):
+                self.finish_reason = cand["finishReason"]
+        if obj.get("usageMetadata"):
+            # Cumulative; the final chunk carries the totals
+            self.usage = obj["usageMetadata"]
+
+    def result(self) -> Tuple[str, Dict[str, Any]]:
+        self.timer.done()
+        if not self.last:
+            raise RuntimeError("Gemini stream ended without any chunks")
+        data = dict(self.last)
+        data["candidates"] = [{"content": {"role": "model", "parts": self.parts}, "finishReason": self.finish_reason, "index": 0}]
+        data["usageMetadata"] = self.usage
+        text, meta = _parse_response(data)
+        meta["latency"] = self.timer.as_meta()
+        return text, meta
+
+
+def _request_args(prompt: str, model: str, max_tokens: Optional[int], temperature: float, thinking: Optional[Dict[str, Any]], stream: bool, n: int = 1) -> Tuple[str, bytes, Dict[str, str]]:
+    key, base_url = _credentials()
+    # Include key in query param (in addition to header) for broader compatibility
+    if stream:
+        path = f"/v1beta/models/{model}:streamGenerateContent?alt=sse&key={key}"
+    else:
+        path = f"/v1beta/models/{model}:generateContent?key={key}"
+    body = _build_body(prompt, model, max_tokens, temperature, thinking, n)
+    headers = {
+        "Content-Type": "application/json",
+        "x-goog-api-key": key,
+    }
+    return base_url.rstrip("/") + path, json.dumps(body).encode(), headers
+
+
+def chat_completion(prompt: str, model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, deadline: Optional[Deadline] = None, n: int = 1) -> Tuple[str, Dict[str, Any]]:
+    url, body, headers = _request_args(prompt, model, max_tokens, temperature, thinking, stream, n)
+    if not stream:
+        resp, raw = get_pool().request("POST", url, body, headers, deadline)
+        text, meta = _parse_response(_decode(resp.status, resp.reason, raw, resp.headers))
+        meta["rate_limit"] = parse_rate_limit_headers(resp.headers)
+        return text, meta
+    # SSE: text accumulates as it is generated; adds time-to-first/last-token to meta["latency"]
+    state = _StreamState(StreamTimer())
+    resp = get_pool().open("POST", url, body, headers, deadline)
+    try:
+        if resp.status != 200:
+            _decode(resp.status, resp.reason, resp.read(), resp.headers)
+        for event, data in iter_sse(resp.iter_chunks()):
+            state.consume(event, data)
+    finally:
+        resp.close()
+    text, meta = state.result()
+    meta["rate_limit"] = parse_rate_limit_headers(resp.headers)
+    return text, meta
+
+
+async def achat_completion(prompt: str, model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, deadline: Optional[Deadline] = None, n: int = 1) -> Tuple[str, Dict[str, Any]]:
+    """Asyncio variant of chat_completion sharing the event loop's HTTP client."""
+    url, body, headers = _request_args(prompt, model, max_tokens, temperature, thinking, stream, n)
+    state = _StreamState(StreamTimer())
+    resp = await get_async_pool().request("POST", url, body, headers, deadline)
+    if not stream:
+        raw = await resp.read()
+        text, meta = _parse_response(_decode(resp.status, resp.reason, raw, resp.headers))
+        meta["rate_limit"] = parse_rate_limit_headers(resp.headers)
+        return text, meta
+    try:
+        if resp.status != 200:
+            _decode(resp.status, resp.reason, await resp.read(), resp.headers)
+        async for event, data in aiter_sse(resp.iter_chunks()):
+            state.consume(event, data)
+    finally:
+        await resp.aclose()
+    text, meta = state.result()
+    meta["rate_limit"] = parse_rate_limit_headers(resp.headers)
+    return text, meta
+
+
+# Batch mode: https://ai.google.dev/gemini-api/docs/batch-mode (inline requests are capped at 20MB)
+BATCH_MAX_REQUESTS = 10000
+BATCH_MAX_BYTES = 18 * 1024 * 1024
+
+
+def _batch_headers(key: str) -> Dict[str, str]:
+    return {"Content-Type": "application/json", "x-goog-api-key": key}
+
+
+def batch_request(custom_id: str, prompt: str, model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, thinking: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """One inlined batch request; same body as chat_completion, keyed by custom_id."""
+    return {
+        "request": _build_body(prompt, model, max_tokens, temperature, thinking),
+        "metadata": {"key": custom_id},
+    }
+
+
+def create_batch(model: str, requests: List[Dict[str, Any]]) -> str:
+    """Start a batch of inlined requests; returns the batch name ("batches/...")."""
+    key, base_url = _credentials()
+    body = {
+        "batch": {
+            "display_name": f"llmlog-{model}-{len(requests)}",
+            "input_config": {"requests": {"requests": requests}},
+        }
+    }
+    resp, raw = get_pool().request(
+        "POST",
+        base_url.rstrip("/") + f"/v1beta/models/{model}:batchGenerateContent",
+        json.dumps(body).encode(),
+        _batch_headers(key),
+    )
+    return _decode(resp.status, resp.reason, raw, resp.headers)["name"]
+
+
+def get_batch(name: str) -> Dict[str, Any]:
+    """Batch status as {state: running|ended, status, counts, raw}."""
+    key, base_url = _credentials()
+    resp, raw = get_pool().request("GET", base_url.rstrip("/") + f"/v1beta/{name}", b"", _batch_headers(key))
+    data = _decode(resp.status, resp.reason, raw, resp.headers)
+    md = data.get("metadata") or {}
+    # BATCH_STATE_* (older docs: JOB_STATE_*)
+    status = str(md.get("state") or data.get("state") or "").split("_STATE_")[-1].lower()
+    ended = bool(data.get("done")) or status in ("succeeded", "failed", "cancelled", "expired")
+    return {
+        "state": ("ended" if ended else "running"),
+        "status": status,
+        "counts": md.get("batchStats"),
+        "raw": data,
+    }
+
+
+def _inlined(container: Any) -> List[Dict[str, Any]]:
+    if isinstance(container, dict):
+        container = container.get("inlinedResponses")
+    return container if isinstance(container, list) else []
 
 
+def batch_results(batch: Dict[str, Any]) -> Iterator[Tuple[str, Optional[str], Optional[Dict[str, Any]], Optional[str]]]:
+    """Yield (custom_id, text, meta, error) for every request the ended batch reported on."""
+    data = batch.get("raw") or {}
+    if data.get("error"):
+        return
+    output = data.get("response") or (data.get("metadata") or {}).get("output") or {}
+    items = _inlined(output.get("inlinedResponses"))
+    if not items and output.get("responsesFile"):
+        # Large batches deliver results as a JSONL file instead of inline
+        key, base_url = _credentials()
+        resp, raw = get_pool().request(
+            "GET",
+            base_url.rstrip("/") + f"/download/v1beta/{output['responsesFile']}:download?alt=media",
+            b"",
+            _batch_headers(key),
+        )
+        if resp.status != 200:
+            _decode(resp.status, resp.reason, raw, resp.headers)
+        items = [json.loads(line) for line in raw.decode("utf-8", errors="ignore").splitlines() if line.strip()]
+    for item in items:
+        cid = ((item.get("metadata") or {}).get("key")) or item.get("key")
+        if item.get("error"):
+            err = item["error"]
+            yield cid, None, None, f"Gemini error {err.get('code')}: {err.get('message')}"
+            continue
+        text, meta = _parse_response(item.get("response") or {})
+        yield cid, text, meta, None
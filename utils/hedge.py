@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from .transport import CancelScope
+
+
+class Hedge:
+    """When to duplicate one call: after ``delay_s`` without an answer, if ``allow()`` grants the extra call."""
+
+    def __init__(self, delay_s: float, allow: Callable[[], bool]) -> None:
+        self.delay_s = max(0.0, float(delay_s))
+        self.allow = allow
+
+
+class _Timer:
+    """One daemon thread firing delayed callbacks, so arming a hedge costs no thread per call."""
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, Callable[[], None]]] = []
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, delay_s: float, fn: Callable[[], None]) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay_s, next(self._seq), fn))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="hedge-timer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(None if not self._heap else self._heap[0][0] - time.monotonic())
+                _, _, fn = heapq.heappop(self._heap)
+            try:
+                fn()
+            except Exception:
+                pass
+
+
+_TIMER = _Timer()
+
+
+class _Race:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.settled = False          # the caller has its answer (or error); no duplicate may start
+        self.primary = CancelScope()
+        self.backup: Optional[CancelScope] = None
+        self.backup_done = threading.Event()
+        self.backup_result: Any = None
+        self.backup_error: Optional[BaseException] = None
+
+
+def hedged_call(fn: Callable[[], Any], hedge: Hedge) -> Tuple[Any, Optional[str]]:
+    """Run fn() on the calling thread; if it is still running after hedge.delay_s, race a second fn().
+
+    Returns (result, winner) with winner None (no duplicate sent), "primary"
+    or "hedge". The first successful answer wins; an error only surfaces when
+    both attempts fail. The duplicate runs on a thread of its own, started
+    only when it is sent. The loser is cancelled: its connection is shut
+    down (see transport.CancelScope), so it stops reading at once.
+    """
+    race = _Race()
+
+    def launch() -> None:
+        with race.lock:
+            if race.settled or not hedge.allow():
+                return
+            race.backup = CancelScope()
+        threading.Thread(target=run_backup, name="hedged-call", daemon=True).start()
+
+    def run_backup() -> None:
+        try:
+            with race.backup:  # type: ignore[union-attr]
+                race.backup_result = fn()
+            # Won unless the primary already answered: stop the primary's request
+            race.primary.cancel()
+        except BaseException as e:
+            race.backup_error = e
+        finally:
+            race.backup_done.set()
+
+    _TIMER.schedule(hedge.delay_s, launch)
+    try:
+        with race.primary:
+            result = fn()
+    except BaseException as e:
+        with race.lock:
+            race.settled = True
+            backup = race.backup
+        if backup is None:
+            raise
+        race.backup_done.wait()
+        if race.backup_error is not None:
+            raise e
+        return race.backup_result, "hedge"
+    with race.lock:
+        race.settled = True
+        backup = race.backup
+    if backup is None:
+        return result, None
+    backup.cancel()
+    return result, "primary"
+
+
+async def ahedged_call(make_call: Callable[[], Awaitable[Any]], hedge: Hedge) -> Tuple[Any, Optional[str]]:
+    """Asyncio counterpart of hedged_call; the losing request is cancelled (its connection is closed)."""
+    primary = asyncio.ensure_future(make_call())
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge.delay_s)
+        if done or not hedge.allow():
+            return await primary, None
+        backup = asyncio.ensure_future(make_call())
+        tasks.add(backup)
+        names = {primary: "primary", backup: "hedge"}
+        pending = set(tasks)
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), names[task]
+                first_error = first_error or task.exception()
+        raise first_error  # type: ignore[misc]
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
@@ -1,52 +1,39 @@
+import hashlib
 import json
-import http.client
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 
 from .secrets import load_secrets, get_provider_key
+from .transport import Deadline, get_async_pool, get_pool
+from .errors import ProviderError, error_code, error_message, parse_rate_limit_headers, provider_error
+from .sse import StreamTimer, aiter_sse, iter_sse, sse_json
 
 
-def chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
-    secrets = load_secrets()
-    key = get_provider_key(secrets, "openai")
-    if not key:
-        raise RuntimeError("Missing OpenAI API key in secrets.json or OPENAI_API_KEY")
+DEFAULT_BASE_URL = "https://api.openai.com"
 
-    host = "api.openai.com"
-
-    def _request(path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        conn = http.client.HTTPSConnection(host)
-        conn.request(
-            "POST",
-            path,
-            json.dumps(payload),
-            headers={
-                "Host": host,
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {key}",
-                # Enable Responses API features per official docs
-                "OpenAI-Beta": "responses=v1",
-            },
-        )
-        response = conn.getresponse()
-        raw = response.read()
-        if response.status != 200:
-            try:
-                data = json.loads(raw)
-                message = data.get("error", {}).get("message", "")
-            except Exception:
-                message = raw.decode("utf-8", errors="ignore")
-            raise RuntimeError(f"OpenAI error {response.status} {response.reason}: {message}")
-        try:
-            data = json.loads(raw)
-        except Exception:
-            raise RuntimeError(f"OpenAI response is not JSON: {raw}")
-        finally:
-            conn.close()
-        return data
-
-    # Prefer Responses API for GPT-5 always; explicitly disable reasoning for "nothink" by setting effort=none
-    use_responses = (model.lower().startswith("gpt-5") or model == "gpt-5")
-    if use_responses:
+
+def _prompt_cache_key(cache_prefix: Optional[str]) -> Optional[str]:
+    # OpenAI caches prompt prefixes automatically; a key shared by every request with the same
+    # static head routes them to the same cache. See https://platform.openai.com/docs/guides/prompt-caching
+    if not cache_prefix:
+        return None
+    return "llmlog-" + hashlib.sha256(cache_prefix.encode()).hexdigest()[:32]
+
+
+def uses_responses(model: str) -> bool:
+    # Prefer Responses API for GPT-5 always
+    return model.lower().startswith("gpt-5") or model == "gpt-5"
+
+
+def supports_n(model: str) -> bool:
+    """Whether one request can return several samples (Chat Completions `n`; the Responses API has no equivalent)."""
+    return not uses_responses(model)
+
+
+def _build_request(messages: List[Dict[str, str]], model: str, max_tokens: Optional[int], temperature: float, seed: Optional[int], thinking: Optional[Dict[str, Any]], cache_prefix: Optional[str] = None, n: int = 1) -> Tuple[str, Dict[str, Any]]:
+    # Explicitly disable reasoning for "nothink" by setting effort=minimal
+    if uses_responses(model):
+        if n > 1:
+            raise ValueError(f"{model} uses the Responses API, which cannot return {n} samples per request")
         # Map chat messages -> Responses input format
         input_blocks: List[Dict[str, Any]] = []
         for m in messages:
@@ -61,6 +48,8 @@ def chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: Opti
             "model": model,
             "input": input_blocks,
         }
+        if cache_prefix:
+            payload["prompt_cache_key"] = _prompt_cache_key(cache_prefix)
         # NOTE: Responses API may not accept 'seed' at top-level; omit to avoid 400
         if max_tokens is not None:
             payload["max_output_tokens"] = int(max_tokens)
@@ -79,9 +68,37 @@ def chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: Opti
         else:
             # Minimal effort for nothink per Responses API
             payload["reasoning"] = {"effort": "minimal"}
+        return "/v1/responses", payload
+
+    # Default: Chat Completions API
+    call: Dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+    }
+    if seed is not None:
+        call["seed"] = seed
+    if cache_prefix:
+        call["prompt_cache_key"] = _prompt_cache_key(cache_prefix)
+    if n > 1:
+        # Several samples from one request (self-consistency); usage covers all of them
+        call["n"] = int(n)
+    if max_tokens is not None:
+        call["max_tokens"] = max_tokens
+    # Some chat models expose `reasoning` top-level; include effort if provided
+    if thinking:
+        eff = None
+        try:
+            eff = thinking.get("effort") or thinking.get("reasoning_effort")
+        except Exception:
+            eff = None
+        if isinstance(eff, str) and eff.lower() in ("low", "medium", "high"):
+            call["reasoning"] = {"effort": eff.lower()}
+    return "/v1/chat/completions", call
 
-        data = _request("/v1/responses", payload)
 
+def _parse_response(path: str, data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    if path == "/v1/responses":
         # Extract text and metadata per Responses API
         resp_obj = data.get("response") or data
         text_accum: List[str] = []
@@ -119,27 +136,6 @@ def chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: Opti
         }
         return (text_out or str(data)), meta
 
-    # Default: Chat Completions API
-    call: Dict[str, Any] = {
-        "model": model,
-        "messages": messages,
-        "temperature": temperature,
-    }
-    if seed is not None:
-        call["seed"] = seed
-    if max_tokens is not None:
-        call["max_tokens"] = max_tokens
-    # Some chat models expose `reasoning` top-level; include effort if provided
-    if thinking:
-        eff = None
-        try:
-            eff = thinking.get("effort") or thinking.get("reasoning_effort")
-        except Exception:
-            eff = None
-        if isinstance(eff, str) and eff.lower() in ("low", "medium", "high"):
-            call["reasoning"] = {"effort": eff.lower()}
-
-    data = _request("/v1/chat/completions", call)
     if "choices" not in data:
         raise RuntimeError("OpenAI response missing 'choices'")
     res = ""
@@ -150,11 +146,263 @@ def chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: Opti
             if res:
                 res += "\n"
             res += ch["text"].strip()
-    meta: Dict[str, Any] = {
+    meta = {
         "raw_response": data,
         "finish_reason": (data.get("choices", [{}])[0] or {}).get("finish_reason"),
         "usage": data.get("usage"),
     }
+    if len(data["choices"]) > 1:
+        # n > 1: one sample per choice, in index order; the first is the response text
+        choices = sorted(data["choices"], key=lambda ch: ch.get("index", 0))
+        meta["candidates"] = [((ch.get("message") or {}).get("content") or ch.get("text") or "") for ch in choices]
+        res = meta["candidates"][0]
     return res, meta
 
 
+def _credentials() -> Tuple[str, str]:
+    secrets = load_secrets()
+    key = get_provider_key(secrets, "openai")
+    if not key:
+        raise RuntimeError("Missing OpenAI API key in secrets.json or OPENAI_API_KEY")
+    return key, (get_provider_key(secrets, "openai", "base_url") or DEFAULT_BASE_URL)
+
+
+def _headers(key: str) -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {key}",
+        # Enable Responses API features per official docs
+        "OpenAI-Beta": "responses=v1",
+    }
+
+
+def _decode(status: int, reason: str, raw: bytes, headers: Any = None) -> Dict[str, Any]:
+    if status != 200:
+        message, code, retry_after = error_message(raw)
+        raise provider_error(f"OpenAI error {status} {reason}: {message}", provider="openai", status=status, code=code, headers=headers, retry_after=retry_after)
+    try:
+        return json.loads(raw)
+    except Exception:
+        raise RuntimeError(f"OpenAI response is not JSON: {raw}")
+
+
+def _stream_payload(path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    payload = dict(payload, stream=True)
+    if path == "/v1/chat/completions":
+        # Usage arrives in a final chunk with empty choices
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def _stream_error(obj: Dict[str, Any]) -> ProviderError:
+    err = (obj.get("response") or {}).get("error") or obj.get("error") or obj
+    message = err.get("message") if isinstance(err, dict) else str(err)
+    code = error_code(err)
+    return provider_error(f"OpenAI stream error{f' {code}' if code else ''}: {message}", provider="openai", code=code)
+
+
+class _StreamState:
+    """Accumulates one streamed Responses or Chat Completions call into the non-streamed result shape."""
+
+    def __init__(self, path: str, timer: StreamTimer) -> None:
+        self.path = path
+        self.timer = timer
+        self.text: List[str] = []
+        self.final: Optional[Dict[str, Any]] = None
+        self.chat: Dict[str, Any] = {"id": None, "model": None, "finish_reason": None, "usage": None}
+
+    def consume(self, event: Optional[str], data: str) -> None:
+        obj = sse_json(event, data)
+        if obj is None:
+            return
+        if self.path == "/v1/responses":
+            et = obj.get("type") or event
+            if et == "response.output_text.delta":
+                self.timer.token()
+                self.text.append(obj.get("delta") or "")
+            elif et in ("response.reasoning_summary_text.delta", "response.reasoning_text.delta"):
+                self.timer.token()
+            elif et in ("response.completed", "response.incomplete"):
+                self.final = obj.get("response") or {}
+            elif et in ("response.failed", "error"):
+                raise _stream_error(obj)
+            return
+        if obj.get("error"):
+            raise _stream_error(obj)
+        for ch in obj.get("choices") or []:
+            delta = ch.get("delta") or {}
+            if delta.get("content"):
+                self.timer.token()
+                self.text.append(delta["content"])
+            if ch.get("finish_reason"):
+                self.chat["finish_reason"] = ch["finish_reason"]
+        for k in ("id", "model", "usage"):
+            if obj.get(k):
+                self.chat[k] = obj[k]
+
+    def result(self) -> Tuple[str, Dict[str, Any]]:
+        self.timer.done()
+        if self.path == "/v1/responses":
+            if self.final is None:
+                raise RuntimeError("OpenAI stream ended before response.completed")
+            text, meta = _parse_response(self.path, self.final)
+            if self.text:
+                text = "".join(self.text).strip()
+        else:
+            if self.chat["finish_reason"] is None and not self.text:
+                raise RuntimeError("OpenAI stream ended without any choices")
+            # Same shape as a non-streamed chat.completion so downstream parsing is unchanged
+            data = {
+                "id": self.chat["id"],
+                "object": "chat.completion",
+                "model": self.chat["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(self.text)}, "finish_reason": self.chat["finish_reason"]}],
+                "usage": self.chat["usage"],
+            }
+            text, meta = _parse_response(self.path, data)
+        meta["latency"] = self.timer.as_meta()
+        return text, meta
+
+
+def _chat_stream(url: str, path: str, payload: Dict[str, Any], key: str, deadline: Optional[Deadline]) -> Tuple[str, Dict[str, Any]]:
+    state = _StreamState(path, StreamTimer())
+    response = get_pool().open("POST", url, json.dumps(_stream_payload(path, payload)).encode(), _headers(key), deadline)
+    try:
+        if response.status != 200:
+            _decode(response.status, response.reason, response.read(), response.headers)
+        for event, data in iter_sse(response.iter_chunks()):
+            state.consume(event, data)
+    finally:
+        response.close()
+    text, meta = state.result()
+    meta["rate_limit"] = parse_rate_limit_headers(response.headers)
+    return text, meta
+
+
+async def _achat_stream(url: str, path: str, payload: Dict[str, Any], key: str, deadline: Optional[Deadline]) -> Tuple[str, Dict[str, Any]]:
+    state = _StreamState(path, StreamTimer())
+    response = await get_async_pool().request("POST", url, json.dumps(_stream_payload(path, payload)).encode(), _headers(key), deadline)
+    try:
+        if response.status != 200:
+            _decode(response.status, response.reason, await response.read(), response.headers)
+        async for event, data in aiter_sse(response.iter_chunks()):
+            state.consume(event, data)
+    finally:
+        await response.aclose()
+    text, meta = state.result()
+    meta["rate_limit"] = parse_rate_limit_headers(response.headers)
+    return text, meta
+
+
+def chat_completion(messages: List[Dict[str, str]], model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None, n: int = 1) -> Tuple[str, Dict[str, Any]]:
+    key, base_url = _credentials()
+    path, payload = _build_request(messages, model, max_tokens, temperature, seed, thinking, cache_prefix, n)
+    if stream:
+        # SSE: text accumulates as it is generated; adds time-to-first/last-token to meta["latency"]
+        return _chat_stream(base_url.rstrip("/") + path, path, payload, key, deadline)
+    response, raw = get_pool().request("POST", base_url.rstrip("/") + path, json.dumps(payload).encode(), _headers(key), deadline)
+    text, meta = _parse_response(path, _decode(response.status, response.reason, raw, response.headers))
+    meta["rate_limit"] = parse_rate_limit_headers(response.headers)
+    return text, meta
+
+
+async def achat_completion(messages: List[Dict[str, str]], model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None, n: int = 1) -> Tuple[str, Dict[str, Any]]:
+    """Asyncio variant of chat_completion sharing the event loop's HTTP client."""
+    key, base_url = _credentials()
+    path, payload = _build_request(messages, model, max_tokens, temperature, seed, thinking, cache_prefix, n)
+    if stream:
+        return await _achat_stream(base_url.rstrip("/") + path, path, payload, key, deadline)
+    response = await get_async_pool().request("POST", base_url.rstrip("/") + path, json.dumps(payload).encode(), _headers(key), deadline)
+    raw = await response.read()
+    text, meta = _parse_response(path, _decode(response.status, response.reason, raw, response.headers))
+    meta["rate_limit"] = parse_rate_limit_headers(response.headers)
+    return text, meta
+
+
+# Batch API: https://platform.openai.com/docs/guides/batch
+BATCH_MAX_REQUESTS = 50000
+BATCH_MAX_BYTES = 190 * 1024 * 1024
+
+
+def batch_request(custom_id: str, messages: List[Dict[str, str]], model: str, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, cache_prefix: Optional[str] = None) -> Dict[str, Any]:
+    """One JSONL line of a batch input file; same endpoint and body as chat_completion."""
+    path, payload = _build_request(messages, model, max_tokens, temperature, seed, thinking, cache_prefix)
+    return {"custom_id": custom_id, "method": "POST", "url": path, "body": payload}
+
+
+def _get_json(url: str, key: str) -> Dict[str, Any]:
+    response, raw = get_pool().request("GET", url, b"", _headers(key))
+    return _decode(response.status, response.reason, raw, response.headers)
+
+
+def create_batch(model: str, requests: List[Dict[str, Any]]) -> str:
+    """Upload the requests as a batch input file and start a batch; returns the batch id."""
+    key, base_url = _credentials()
+    base = base_url.rstrip("/")
+    content = "".join(json.dumps(r) + "\n" for r in requests).encode()
+    boundary = "llmlog-batch-boundary"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"purpose\"\r\n\r\nbatch\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"batch.jsonl\"\r\n"
+        "Content-Type: application/jsonl\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    headers = {"Authorization": f"Bearer {key}", "Content-Type": f"multipart/form-data; boundary={boundary}"}
+    response, raw = get_pool().request("POST", base + "/v1/files", body, headers)
+    file_obj = _decode(response.status, response.reason, raw, response.headers)
+    payload = {
+        "input_file_id": file_obj["id"],
+        "endpoint": requests[0]["url"],
+        "completion_window": "24h",
+        "metadata": {"model": model},
+    }
+    response, raw = get_pool().request("POST", base + "/v1/batches", json.dumps(payload).encode(), _headers(key))
+    return _decode(response.status, response.reason, raw, response.headers)["id"]
+
+
+def get_batch(batch_id: str) -> Dict[str, Any]:
+    """Batch status as {state: running|ended, status, counts, raw}."""
+    key, base_url = _credentials()
+    data = _get_json(base_url.rstrip("/") + f"/v1/batches/{batch_id}", key)
+    status = data.get("status")
+    return {
+        "state": ("ended" if status in ("completed", "failed", "expired", "cancelled") else "running"),
+        "status": status,
+        "counts": data.get("request_counts"),
+        "raw": data,
+    }
+
+
+def batch_results(batch: Dict[str, Any]) -> Iterator[Tuple[str, Optional[str], Optional[Dict[str, Any]], Optional[str]]]:
+    """Yield (custom_id, text, meta, error) for every request the ended batch reported on."""
+    key, base_url = _credentials()
+    base = base_url.rstrip("/")
+    raw_batch = batch.get("raw") or {}
+    endpoint = raw_batch.get("endpoint") or "/v1/chat/completions"
+    for file_field in ("output_file_id", "error_file_id"):
+        file_id = raw_batch.get(file_field)
+        if not file_id:
+            continue
+        response, raw = get_pool().request("GET", base + f"/v1/files/{file_id}/content", b"", _headers(key))
+        if response.status != 200:
+            _decode(response.status, response.reason, raw, response.headers)
+        for line in raw.decode("utf-8", errors="ignore").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            cid = item.get("custom_id")
+            resp = item.get("response") or {}
+            status = resp.get("status_code")
+            if item.get("error") or status != 200:
+                err = item.get("error") or (resp.get("body") or {}).get("error") or {}
+                if isinstance(err, dict) and err.get("code") in ("batch_expired", "batch_cancelled"):
+                    # Never ran: leave it out so the caller resubmits it
+                    continue
+                message = err.get("message") if isinstance(err, dict) else str(err)
+                yield cid, None, None, f"OpenAI error {status}: {message}"
+                continue
+            try:
+                text, meta = _parse_response(endpoint, resp.get("body") or {})
+            except Exception as e:
+                yield cid, None, None, str(e)
+                continue
+            yield cid, text, meta, None
@@ -1,22 +1,140 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
-from .openai_client import chat_completion as openai_chat
-from .anthropic_client import chat_completion as anthropic_chat
-from .google_client import chat_completion as gemini_chat
+from . import anthropic_client, google_client, openai_client
+from .openai_client import chat_completion as openai_chat, achat_completion as openai_achat
+from .anthropic_client import chat_completion as anthropic_chat, achat_completion as anthropic_achat
+from .google_client import chat_completion as gemini_chat, achat_completion as gemini_achat
 from .response_meta import normalize_meta
+from .response_cache import cache_key, get_response_cache
+from .hedge import Hedge, ahedged_call, hedged_call
+from .transport import Deadline
 
 
-def run_chat(provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None) -> dict:
+def run_chat(provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, hedge: Optional[Hedge] = None, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None, n: int = 1) -> dict:
+    """Normalized chat result; served from the response cache (when configured) before going to the network.
+
+    stream=True uses SSE for OpenAI and Gemini (Anthropic always streams) and adds
+    result["latency"] = {ttft_ms, ttlt_ms, output_tokens_per_s}; it does not change the cache key.
+    With a hedge, a duplicate request races the first one once hedge.delay_s passes (see
+    utils.hedge); result["hedge"] names the winner ("primary" | "hedge") when one was sent.
+    A deadline bounds connect/read/total time (shared by a hedged pair); running past it
+    closes the connection and raises errors.RequestTimeout.
+    cache_prefix is the static head of prompt (same for every problem of a run) for provider
+    prompt caching: an Anthropic cache_control breakpoint, an OpenAI prompt_cache_key. It is
+    not part of the cache key; result["usage"]["cached_input_tokens"] reports the hits.
+    n > 1 asks for n samples in one request (see supports_candidates); they come back as
+    result["candidates"], the first of which is result["text"]. Such calls are never streamed.
+    """
+
+    def call() -> dict:
+        if hedge is None:
+            return _run_chat(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, stream, deadline, cache_prefix, n)
+        res, winner = hedged_call(lambda: _run_chat(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, stream, deadline, cache_prefix, n), hedge)
+        return dict(res, hedge=winner) if winner else res
+
+    cache = get_response_cache()
+    if cache is None:
+        return call()
+    # Hedging happens below the cache: the pair counts as one call for coalescing
+    key = cache_key(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, n)
+    return cache.get_or_call(key, call)
+
+
+def cached_chat(provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, cache_prefix: Optional[str] = None, n: int = 1) -> Optional[dict]:
+    """Cached result for exactly this request, or None; never touches the network."""
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    hit = cache.get(cache_key(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, n))
+    if hit is None:
+        return None
+    cache.hits += 1
+    return dict(hit, cached=True)
+
+
+def store_chat(result: dict, provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, cache_prefix: Optional[str] = None, n: int = 1) -> None:
+    """Record a result obtained outside run_chat (e.g. from a batch job) in the response cache."""
+    cache = get_response_cache()
+    if cache is not None:
+        cache.put(cache_key(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, n), result)
+
+
+def supports_candidates(provider: str, model: str) -> bool:
+    """Whether run_chat(n=...) can return several samples from one request: OpenAI Chat Completions `n`, Gemini `candidateCount`."""
+    p = (provider or "").lower()
+    if p in ("google", "gemini"):
+        return True
+    if p == "openai":
+        return openai_client.supports_n(model or "")
+    return False
+
+
+def _full_prefix(sysprompt: Optional[str], cache_prefix: Optional[str]) -> Optional[str]:
+    # Anthropic and Gemini get the system prompt merged in front of the user prompt, and so in front of the prefix
+    if cache_prefix and sysprompt:
+        return f"{sysprompt}\n{cache_prefix}"
+    return cache_prefix
+
+
+def _run_chat(provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None, n: int = 1) -> dict:
     provider = provider.lower()
+    if n > 1 and not supports_candidates(provider, model):
+        raise ValueError(f"{provider}:{model} cannot return {n} samples per request")
+    # Stream accumulators follow one candidate only
+    stream = stream and n == 1
     if provider == "anthropic":
         # System prompt gets merged into user prompt for Claude simple path
         full_prompt = f"{sysprompt}\n{prompt}" if sysprompt else prompt
-        text, meta = anthropic_chat(prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking)
+        text, meta = anthropic_chat(prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking, deadline=deadline, cache_prefix=_full_prefix(sysprompt, cache_prefix))
+        norm = normalize_meta("anthropic", model, meta)
+        return {"text": text, **norm}
+    elif provider in ("google", "gemini"):
+        # Gemini caches shared prompt prefixes implicitly; the static head already comes first
+        full_prompt = f"{sysprompt}\n{prompt}" if sysprompt else prompt
+        text, meta = gemini_chat(prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking, stream=stream, deadline=deadline, n=n)
+        norm = normalize_meta("google", model, meta)
+        return {"text": text, **norm}
+    elif provider == "openai":
+        messages: List[Dict[str, str]] = []
+        if sysprompt:
+            messages.append({"role": "system", "content": sysprompt})
+        messages.append({"role": "user", "content": prompt})
+        text, meta = openai_chat(messages=messages, model=model, max_tokens=max_tokens, temperature=temperature, seed=seed, thinking=thinking, stream=stream, deadline=deadline, cache_prefix=cache_prefix, n=n)
+        norm = normalize_meta("openai", model, meta)
+        return {"text": text, **norm}
+    else:
+        raise NotImplementedError(f"Provider not supported: {provider}")
+
+
+async def arun_chat(provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, hedge: Optional[Hedge] = None, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None, n: int = 1) -> dict:
+    """Asyncio counterpart of run_chat with the same normalized result shape, cache and hedging."""
+
+    async def call() -> dict:
+        if hedge is None:
+            return await _arun_chat(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, stream, deadline, cache_prefix, n)
+        res, winner = await ahedged_call(lambda: _arun_chat(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, stream, deadline, cache_prefix, n), hedge)
+        return dict(res, hedge=winner) if winner else res
+
+    cache = get_response_cache()
+    if cache is None:
+        return await call()
+    key = cache_key(provider, model, prompt, sysprompt, max_tokens, temperature, seed, thinking, n)
+    return await cache.aget_or_call(key, call)
+
+
+async def _arun_chat(provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, stream: bool = False, deadline: Optional[Deadline] = None, cache_prefix: Optional[str] = None, n: int = 1) -> dict:
+    provider = provider.lower()
+    if n > 1 and not supports_candidates(provider, model):
+        raise ValueError(f"{provider}:{model} cannot return {n} samples per request")
+    stream = stream and n == 1
+    if provider == "anthropic":
+        full_prompt = f"{sysprompt}\n{prompt}" if sysprompt else prompt
+        text, meta = await anthropic_achat(prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking, deadline=deadline, cache_prefix=_full_prefix(sysprompt, cache_prefix))
         norm = normalize_meta("anthropic", model, meta)
         return {"text": text, **norm}
     elif provider in ("google", "gemini"):
         full_prompt = f"{sysprompt}\n{prompt}" if sysprompt else prompt
-        text, meta = gemini_chat(prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking)
+        text, meta = await gemini_achat(prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking, stream=stream, deadline=deadline, n=n)
         norm = normalize_meta("google", model, meta)
         return {"text": text, **norm}
     elif provider == "openai":
@@ -24,10 +142,65 @@ def run_chat(provider: str, model: str, prompt: str, sysprompt: Optional[str] =
         if sysprompt:
             messages.append({"role": "system", "content": sysprompt})
         messages.append({"role": "user", "content": prompt})
-        text, meta = openai_chat(messages=messages, model=model, max_tokens=max_tokens, temperature=temperature, seed=seed, thinking=thinking)
+        text, meta = await openai_achat(messages=messages, model=model, max_tokens=max_tokens, temperature=temperature, seed=seed, thinking=thinking, stream=stream, deadline=deadline, cache_prefix=cache_prefix, n=n)
         norm = normalize_meta("openai", model, meta)
         return {"text": text, **norm}
     else:
         raise NotImplementedError(f"Provider not supported: {provider}")
 
 
+def _batch_module(provider: str) -> Any:
+    provider = provider.lower()
+    if provider == "anthropic":
+        return anthropic_client
+    if provider in ("google", "gemini"):
+        return google_client
+    if provider == "openai":
+        return openai_client
+    raise NotImplementedError(f"Batch mode not supported for provider: {provider}")
+
+
+def batch_limits(provider: str) -> Tuple[int, int]:
+    """(max requests, max serialized bytes) per provider batch job."""
+    mod = _batch_module(provider)
+    return mod.BATCH_MAX_REQUESTS, mod.BATCH_MAX_BYTES
+
+
+def batch_request(provider: str, model: str, custom_id: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: float = 0.0, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, cache_prefix: Optional[str] = None) -> Dict[str, Any]:
+    """Provider-native batch entry for one prompt, built exactly like the run_chat request."""
+    provider = provider.lower()
+    if provider == "anthropic":
+        full_prompt = f"{sysprompt}\n{prompt}" if sysprompt else prompt
+        return anthropic_client.batch_request(custom_id, prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking, cache_prefix=_full_prefix(sysprompt, cache_prefix))
+    elif provider in ("google", "gemini"):
+        full_prompt = f"{sysprompt}\n{prompt}" if sysprompt else prompt
+        return google_client.batch_request(custom_id, prompt=full_prompt, model=model, max_tokens=max_tokens, temperature=temperature, thinking=thinking)
+    elif provider == "openai":
+        messages: List[Dict[str, str]] = []
+        if sysprompt:
+            messages.append({"role": "system", "content": sysprompt})
+        messages.append({"role": "user", "content": prompt})
+        return openai_client.batch_request(custom_id, messages=messages, model=model, max_tokens=max_tokens, temperature=temperature, seed=seed, thinking=thinking, cache_prefix=cache_prefix)
+    else:
+        raise NotImplementedError(f"Batch mode not supported for provider: {provider}")
+
+
+def submit_batch(provider: str, model: str, requests: List[Dict[str, Any]]) -> str:
+    """Create a provider batch job; returns the handle to poll."""
+    return _batch_module(provider).create_batch(model, requests)
+
+
+def poll_batch(provider: str, handle: str) -> Dict[str, Any]:
+    """{state: running|ended, status: provider status, counts, raw}."""
+    return _batch_module(provider).get_batch(handle)
+
+
+def batch_results(provider: str, model: str, batch: Dict[str, Any]) -> Iterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """Yield (custom_id, normalized result like run_chat's or None, error) for an ended batch."""
+    provider_n = "google" if provider.lower() in ("google", "gemini") else provider.lower()
+    for custom_id, text, meta, err in _batch_module(provider).batch_results(batch):
+        if err:
+            yield custom_id, None, err
+            continue
+        norm = normalize_meta(provider_n, model, meta or {})
+        yield custom_id, {"text": text, **norm}, None
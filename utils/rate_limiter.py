@@ -0,0 +1,197 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+# Buckets hold this many seconds' worth of their per-minute allowance, so a
+# cold start cannot fire a whole minute of requests in one burst.
+BURST_SECONDS = 10.0
+# Prior for prompts with no usage history yet: ~4 characters per token.
+DEFAULT_TOKENS_PER_CHAR = 0.25
+# Weight of the newest observation in the per-key moving averages.
+EMA_ALPHA = 0.2
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at limit_per_min / 60 per second.
+
+    Reservations are taken immediately and may drive the level negative; the
+    caller then waits for the deficit to refill. Concurrent callers therefore
+    queue up behind each other instead of all waking at once.
+    """
+
+    def __init__(self, limit_per_min: float, burst_seconds: float = BURST_SECONDS) -> None:
+        self.rate = float(limit_per_min) / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount from the bucket; returns seconds until the reservation is covered."""
+        self._refill(now)
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def adjust(self, delta: float, now: float) -> None:
+        """Give back (delta > 0) or additionally charge (delta < 0) tokens after the fact."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + delta)
+
+    def set_limit(self, limit_per_min: float, burst_seconds: float = BURST_SECONDS) -> None:
+        self._refill(time.monotonic())
+        self.rate = float(limit_per_min) / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = min(self.level, self.capacity)
+
+
+class _KeyState:
+    def __init__(self) -> None:
+        self.requests: Optional[TokenBucket] = None
+        self.tokens: Optional[TokenBucket] = None
+        self.tokens_per_char = DEFAULT_TOKENS_PER_CHAR
+        self.output_tokens: Optional[float] = None
+        # monotonic time before which no call may start (Retry-After, exhausted quota windows)
+        self.blocked_until = 0.0
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits keyed by provider:model.
+
+    Thread-safe and never blocks while holding its lock, so one instance serves
+    every target, worker thread and event loop in the process.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._keys: Dict[str, _KeyState] = {}
+
+    def _state(self, key: str) -> _KeyState:
+        st = self._keys.get(key)
+        if st is None:
+            st = _KeyState()
+            self._keys[key] = st
+        return st
+
+    def configure(self, key: str, requests_per_min: Optional[float] = None, tokens_per_min: Optional[float] = None) -> None:
+        """Set (or update) the limits for key; None leaves that dimension unlimited."""
+        with self._lock:
+            st = self._state(key)
+            for attr, limit in (("requests", requests_per_min), ("tokens", tokens_per_min)):
+                bucket = getattr(st, attr)
+                if not limit or limit <= 0:
+                    setattr(st, attr, None)
+                elif bucket is None:
+                    setattr(st, attr, TokenBucket(limit))
+                else:
+                    bucket.set_limit(limit)
+
+    def estimate_tokens(self, key: str, prompt_chars: int, max_tokens: Optional[int] = None) -> int:
+        """Estimate input + output tokens of one call from prompt length and observed usage."""
+        with self._lock:
+            st = self._state(key)
+            est_in = prompt_chars * st.tokens_per_char
+            if st.output_tokens is not None:
+                est_out = st.output_tokens
+            else:
+                # No history yet: assume the worst case the provider will bill against
+                est_out = float(max_tokens or 1000)
+            if max_tokens:
+                est_out = min(est_out, float(max_tokens))
+        return int(math.ceil(est_in + est_out))
+
+    def reserve(self, key: str, tokens: int = 0) -> float:
+        """Reserve one request and tokens for key; returns seconds the caller must wait first."""
+        now = time.monotonic()
+        with self._lock:
+            st = self._state(key)
+            delay = max(0.0, st.blocked_until - now)
+            if st.requests is not None:
+                delay = max(delay, st.requests.reserve(1, now))
+            if st.tokens is not None and tokens > 0:
+                delay = max(delay, st.tokens.reserve(tokens, now))
+        return delay
+
+    def block(self, key: str, seconds: float) -> None:
+        """Hold every call for key for the next seconds (e.g. a provider's Retry-After)."""
+        if not seconds or seconds <= 0:
+            return
+        with self._lock:
+            st = self._state(key)
+            st.blocked_until = max(st.blocked_until, time.monotonic() + float(seconds))
+
+    def refund(self, key: str, tokens: int = 0) -> None:
+        """Return a reservation whose call never reached the provider (e.g. served from cache)."""
+        now = time.monotonic()
+        with self._lock:
+            st = self._state(key)
+            if st.requests is not None:
+                st.requests.adjust(1, now)
+            if st.tokens is not None and tokens > 0:
+                st.tokens.adjust(tokens, now)
+
+    def observe(self, key: str, reserved_tokens: int, prompt_chars: int, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+        """Reconcile a reservation with the usage the provider reported and update the estimators."""
+        now = time.monotonic()
+        with self._lock:
+            st = self._state(key)
+            if input_tokens and prompt_chars > 0:
+                ratio = float(input_tokens) / float(prompt_chars)
+                st.tokens_per_char = (1 - EMA_ALPHA) * st.tokens_per_char + EMA_ALPHA * ratio
+            if output_tokens is not None:
+                if st.output_tokens is None:
+                    st.output_tokens = float(output_tokens)
+                else:
+                    st.output_tokens = (1 - EMA_ALPHA) * st.output_tokens + EMA_ALPHA * float(output_tokens)
+            if st.tokens is not None and (input_tokens is not None or output_tokens is not None):
+                actual = (input_tokens or 0) + (output_tokens or 0)
+                st.tokens.adjust(reserved_tokens - actual, now)
+
+    def acquire(self, key: str, tokens: int = 0) -> float:
+        """Blocking reserve: sleeps out the delay; returns the seconds waited."""
+        delay = self.reserve(key, tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def aacquire(self, key: str, tokens: int = 0) -> float:
+        """Asyncio reserve: awaits the delay without blocking the loop; returns the seconds waited."""
+        delay = self.reserve(key, tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+_LIMITER = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide limiter shared by all targets and engines."""
+    return _LIMITER
+
+
+def rate_limit_key(provider: Optional[str], model: Optional[str]) -> str:
+    p = (provider or "").lower()
+    if p == "gemini":
+        p = "google"
+    return f"{p}:{model}"
+
+
+def billed_tokens(provider: Optional[str], usage: Optional[Dict[str, Optional[int]]]) -> Tuple[Optional[int], Optional[int]]:
+    """(input, output) tokens counted against TPM from a normalized usage dict."""
+    if not isinstance(usage, dict):
+        return None, None
+    inp = usage.get("input_tokens")
+    out = usage.get("output_tokens")
+    # Gemini reports thoughts separately from candidates; OpenAI/Anthropic already include them in output
+    if (provider or "").lower() in ("google", "gemini") and usage.get("reasoning_tokens"):
+        out = (out or 0) + usage.get("reasoning_tokens")
+    # Anthropic does not count prompt-cache reads against input tokens per minute
+    if (provider or "").lower() == "anthropic" and inp is not None and usage.get("cached_input_tokens"):
+        inp = max(0, inp - usage["cached_input_tokens"])
+    return inp, out
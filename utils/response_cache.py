@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+# Bump when the stored result shape changes so old entries are never served
+CACHE_VERSION = 1
+# Eviction trims to this fraction of the limits so it runs once per many writes, not on every one
+EVICT_TO = 0.9
+
+
+def cache_key(provider: str, model: str, prompt: str, sysprompt: Optional[str] = None, max_tokens: Optional[int] = None, temperature: Optional[float] = None, seed: Optional[int] = None, thinking: Optional[Dict[str, Any]] = None, n: int = 1) -> str:
+    """sha256 over everything that determines a response; identical requests share a key across runs and configs."""
+    p = (provider or "").lower()
+    if p == "gemini":
+        p = "google"
+    material = {
+        "v": CACHE_VERSION,
+        "provider": p,
+        "model": model,
+        "sysprompt": sysprompt,
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        "temperature": (float(temperature) if temperature is not None else None),
+        "seed": seed,
+        "thinking": thinking or None,
+    }
+    if n > 1:
+        # Multi-candidate requests (self-consistency samples); single-sample keys stay as they were
+        material["n"] = int(n)
+    return hashlib.sha256(json.dumps(material, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Normalized run_chat results in SQLite, keyed by cache_key.
+
+    Entries are evicted least-recently-used first once ``max_entries`` or
+    ``max_bytes`` (compressed size) is exceeded. WAL mode lets several runner
+    processes share one file. Identical requests issued while the first is
+    still in flight wait for its result instead of calling the API again.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30.0, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, provider TEXT, model TEXT, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._inflight: Dict[str, Future] = {}
+        # Running totals (other processes may write too; eviction recounts before trimming)
+        self._count, self._bytes = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        try:
+            return json.loads(zlib.decompress(row[0]))
+        except Exception:
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        # Rate-limit headers, stream timings and hedge outcome describe the original call, not a later replay
+        value = zlib.compress(json.dumps({k: v for k, v in result.items() if k not in ("rate_limit", "latency", "hedge")}).encode())
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, value, size, created, last_used, hits) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, result.get("provider"), result.get("model"), value, len(value), now, now),
+            )
+            self._count += 1
+            self._bytes += len(value)
+            if (self.max_entries and self._count > self.max_entries) or (self.max_bytes and self._bytes > self.max_bytes):
+                self._evict()
+
+    def _evict(self) -> None:
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        keep_entries = int(self.max_entries * EVICT_TO) if self.max_entries else None
+        keep_bytes = int(self.max_bytes * EVICT_TO) if self.max_bytes else None
+        victims = []
+        # Least recently used first until both limits fit again
+        for key, sz in self._db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if (keep_entries is None or count <= keep_entries) and (keep_bytes is None or size <= keep_bytes):
+                break
+            victims.append((key,))
+            count -= 1
+            size -= sz
+        self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._count, self._bytes = count, size
+
+    def _lookup_or_lead(self, key: str):
+        """(cached result, None, False) on a hit; else (None, future, is_leader)."""
+        hit = self.get(key)
+        if hit is not None:
+            self.hits += 1
+            return dict(hit, cached=True), None, False
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return None, fut, False
+            fut = Future()
+            self._inflight[key] = fut
+            self.misses += 1
+        return None, fut, True
+
+    def _finish(self, key: str, fut: Future, result: Optional[Dict[str, Any]], error: Optional[BaseException]) -> None:
+        # Store before releasing the in-flight slot so a late identical request finds the entry
+        if error is None:
+            try:
+                self.put(key, result)
+            except Exception:
+                pass
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+    def get_or_call(self, key: str, call: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Cached result for key, or the result of call() shared with concurrent identical requests."""
+        hit, fut, leader = self._lookup_or_lead(key)
+        if hit is not None:
+            return hit
+        if not leader:
+            return dict(fut.result(), cached=True)
+        try:
+            result = call()
+        except BaseException as e:
+            self._finish(key, fut, None, e)
+            raise
+        self._finish(key, fut, result, None)
+        return result
+
+    async def aget_or_call(self, key: str, call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Asyncio counterpart of get_or_call; followers await the leader without blocking the loop."""
+        hit, fut, leader = self._lookup_or_lead(key)
+        if hit is not None:
+            return hit
+        if not leader:
+            return dict(await asyncio.wrap_future(fut), cached=True)
+        try:
+            result = await call()
+        except BaseException as e:
+            self._finish(key, fut, None, e)
+            raise
+        self._finish(key, fut, result, None)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": size, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_CACHE: Optional[ResponseCache] = None
+
+
+def configure_cache(path: Optional[str], max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> Optional[ResponseCache]:
+    """Enable the process-wide cache at path (None disables it); returns the active cache."""
+    global _CACHE
+    if _CACHE is not None:
+        _CACHE.close()
+        _CACHE = None
+    if path:
+        _CACHE = ResponseCache(path, max_entries=max_entries, max_bytes=max_bytes)
+    return _CACHE
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _CACHE
@@ -12,6 +12,22 @@ def _safe_get(obj: Any, *keys: str) -> Optional[Any]:
 
 
 def normalize_meta(provider: str, model: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = _normalize(provider, model, meta)
+    # Streamed calls only: time to first / last token (ms from request start) and output throughput
+    latency = meta.get("latency")
+    if isinstance(latency, dict):
+        out = dict(latency)
+        ttlt = out.get("ttlt_ms")
+        tokens = normalized["usage"].get("output_tokens")
+        out["output_tokens_per_s"] = (round(tokens / (ttlt / 1000.0), 2) if (isinstance(tokens, (int, float)) and ttlt) else None)
+        normalized["latency"] = out
+    # n > 1 requests: every sample's text (OpenAI choices / Gemini candidates), first one first
+    if isinstance(meta.get("candidates"), list):
+        normalized["candidates"] = list(meta["candidates"])
+    return normalized
+
+
+def _normalize(provider: str, model: str, meta: Dict[str, Any]) -> Dict[str, Any]:
     provider_l = (provider or "").lower()
     normalized: Dict[str, Any] = {
         "provider": provider,
@@ -21,8 +37,12 @@ def normalize_meta(provider: str, model: str, meta: Dict[str, Any]) -> Dict[str,
             "input_tokens": None,
             "output_tokens": None,
             "reasoning_tokens": None,
+            # Part of input_tokens read from the provider's prompt cache (billed at a discount)
+            "cached_input_tokens": None,
         },
         "raw_response": meta.get("raw_response"),
+        # Parsed x-ratelimit-* / anthropic-ratelimit-* headers, when the client saw any
+        "rate_limit": meta.get("rate_limit"),
     }
 
     raw = meta.get("raw_response") or {}
@@ -32,6 +52,18 @@ def normalize_meta(provider: str, model: str, meta: Dict[str, Any]) -> Dict[str,
         usage = meta.get("usage") or _safe_get(raw, "usage") or {}
         normalized["usage"]["input_tokens"] = usage.get("input_tokens")
         normalized["usage"]["output_tokens"] = usage.get("output_tokens")
+        # Anthropic's input_tokens excludes cache reads and writes; fold them in so input_tokens is the whole prompt
+        cache_read = usage.get("cache_read_input_tokens")
+        cache_write = usage.get("cache_creation_input_tokens")
+        if cache_read is not None or cache_write is not None:
+            if usage.get("input_tokens") is not None:
+                normalized["usage"]["input_tokens"] = usage["input_tokens"] + (cache_read or 0) + (cache_write or 0)
+            normalized["usage"]["cached_input_tokens"] = cache_read or 0
+            normalized["usage"]["cache_write_input_tokens"] = cache_write or 0
+        # Visible thinking/text token counts (estimated or counted; see anthropic_client.VISIBLE_TOKEN_MODES)
+        for k in ("thinking_visible_tokens", "text_visible_tokens", "visible_tokens_source"):
+            if usage.get(k) is not None:
+                normalized["usage"][k] = usage.get(k)
         # If extended thinking is present (thinking or redacted_thinking blocks),
         # Anthropic bills thinking tokens as output tokens. Surface them as reasoning_tokens.
         try:
@@ -60,6 +92,8 @@ def normalize_meta(provider: str, model: str, meta: Dict[str, Any]) -> Dict[str,
         normalized["usage"]["reasoning_tokens"] = (
             usage_md.get("thoughtsTokenCount") or usage_md.get("thinking_tokens")
         )
+        # Implicit (prefix) and explicit cache hits; included in promptTokenCount
+        normalized["usage"]["cached_input_tokens"] = usage_md.get("cachedContentTokenCount")
         return normalized
 
     # OpenAI
@@ -76,14 +110,15 @@ def normalize_meta(provider: str, model: str, meta: Dict[str, Any]) -> Dict[str,
             # Responses API optional details
             details = usage.get("output_tokens_details") or {}
             normalized["usage"]["reasoning_tokens"] = details.get("reasoning_tokens")
+            in_details = usage.get("prompt_tokens_details") or usage.get("input_tokens_details") or {}
+            normalized["usage"]["cached_input_tokens"] = in_details.get("cached_tokens")
             return normalized
         # Try Responses API top-level shapes
         resp_obj = raw.get("response") or raw
         u2 = resp_obj.get("usage") if isinstance(resp_obj, dict) else None
         if isinstance(u2, dict):
-            normalized["usage"]["input_tokens"] = (
-                u2.get("input_tokens_details", {}).get("cached_tokens")
-            ) or u2.get("input_tokens")
+            normalized["usage"]["input_tokens"] = u2.get("input_tokens")
+            normalized["usage"]["cached_input_tokens"] = (u2.get("input_tokens_details") or {}).get("cached_tokens")
             normalized["usage"]["output_tokens"] = u2.get("output_tokens")
             out_details = u2.get("output_tokens_details") or {}
             normalized["usage"]["reasoning_tokens"] = out_details.get("reasoning_tokens")
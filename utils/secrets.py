@@ -1,13 +1,35 @@
 import json
 import os
+import threading
 from typing import Any, Dict, Optional
 
 
 SECRETS_FILE = "secrets.json"
 
+# Parsed secrets per file path; provider clients call load_secrets() on every request
+_CACHE: Dict[str, Dict[str, Any]] = {}
+_CACHE_LOCK = threading.Lock()
 
-def load_secrets(path: Optional[str] = None) -> Dict[str, Any]:
+
+def load_secrets(path: Optional[str] = None, reload: bool = False) -> Dict[str, Any]:
+    """Return secrets (file overlaid with environment variables), read once per process.
+
+    The returned dict is shared; treat it as read-only. Pass reload=True (or call
+    clear_secrets_cache) after changing the file or the environment.
+    """
     filepath = path or SECRETS_FILE
+    with _CACHE_LOCK:
+        if reload or filepath not in _CACHE:
+            _CACHE[filepath] = _read_secrets(filepath)
+        return _CACHE[filepath]
+
+
+def clear_secrets_cache() -> None:
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+
+def _read_secrets(filepath: str) -> Dict[str, Any]:
     try:
         with open(filepath, "r") as f:
             data = json.load(f)
@@ -17,11 +39,11 @@ def load_secrets(path: Optional[str] = None) -> Dict[str, Any]:
         raise RuntimeError(f"Could not load secrets file {filepath}: {e}")
     # overlay environment variables
     env_overrides = {
-        "anthropic": {"api_key": os.getenv("ANTHROPIC_API_KEY")},
-        "google": {"api_key": os.getenv("GOOGLE_API_KEY")},
-        "gemini": {"api_key": os.getenv("GEMINI_API_KEY")},
+        "anthropic": {"api_key": os.getenv("ANTHROPIC_API_KEY"), "base_url": os.getenv("ANTHROPIC_BASE_URL")},
+        "google": {"api_key": os.getenv("GOOGLE_API_KEY"), "base_url": os.getenv("GOOGLE_BASE_URL")},
+        "gemini": {"api_key": os.getenv("GEMINI_API_KEY"), "base_url": os.getenv("GEMINI_BASE_URL")},
         "groq": {"api_key": os.getenv("GROQ_API_KEY")},
-        "openai": {"api_key": os.getenv("OPENAI_API_KEY")},
+        "openai": {"api_key": os.getenv("OPENAI_API_KEY"), "base_url": os.getenv("OPENAI_BASE_URL")},
         "azure_openai": {
             "api_key": os.getenv("AZURE_OPENAI_API_KEY"),
             "endpoint": os.getenv("AZURE_OPENAI_ENDPOINT"),
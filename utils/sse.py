@@ -0,0 +1,89 @@
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class SSEDecoder:
+    """Incremental text/event-stream parser: feed body chunks, get (event, data) pairs back."""
+
+    def __init__(self) -> None:
+        self._buf = b""
+        self._event: Optional[str] = None
+        self._data: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[Tuple[Optional[str], str]]:
+        self._buf += chunk
+        out: List[Tuple[Optional[str], str]] = []
+        while True:
+            nl = self._buf.find(b"\n")
+            if nl < 0:
+                break
+            line = self._buf[:nl].rstrip(b"\r").decode("utf-8", errors="replace")
+            self._buf = self._buf[nl + 1:]
+            if not line:
+                # Blank line dispatches the pending event
+                if self._data:
+                    out.append((self._event, "\n".join(self._data)))
+                self._event, self._data = None, []
+            elif line.startswith(":"):
+                continue
+            else:
+                field, _, value = line.partition(":")
+                if value.startswith(" "):
+                    value = value[1:]
+                if field == "event":
+                    self._event = value
+                elif field == "data":
+                    self._data.append(value)
+        return out
+
+
+def sse_json(event: Optional[str], data: str) -> Optional[Dict[str, Any]]:
+    """JSON payload of one event; None for the OpenAI "[DONE]" sentinel or non-JSON data."""
+    if data.strip() == "[DONE]":
+        return None
+    try:
+        obj = json.loads(data)
+    except Exception:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def iter_sse(chunks: Iterable[bytes]) -> Iterator[Tuple[Optional[str], str]]:
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+
+
+async def aiter_sse(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[Optional[str], str]]:
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for item in decoder.feed(chunk):
+            yield item
+
+
+class StreamTimer:
+    """Time to first token / last token of one streamed call, measured from construction."""
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def token(self) -> None:
+        """Mark the arrival of generated content (text or reasoning)."""
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+        self.last = now
+
+    def done(self) -> None:
+        """Mark the end of the stream; counts as the last token if none arrived later."""
+        self.last = time.monotonic()
+
+    def as_meta(self) -> Dict[str, Any]:
+        # output_tokens_per_s is filled in by normalize_meta once output tokens are known
+        return {
+            "ttft_ms": (int((self.first - self.started) * 1000) if self.first is not None else None),
+            "ttlt_ms": (int((self.last - self.started) * 1000) if self.last is not None else None),
+        }
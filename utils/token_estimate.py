@@ -0,0 +1,24 @@
+import re
+
+
+# Word pieces, digit runs and single punctuation marks; long words split into ~4-character pieces
+_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Offline approximation of a BPE token count, for reporting rather than billing.
+
+    Used where an exact count would cost an API round trip per call. One regex
+    pass, so it is not cached: thinking traces are unique per call and large.
+    """
+    if not text:
+        return 0
+    n = 0
+    for piece in _PIECES.findall(text):
+        if piece[0].isalpha():
+            n += (len(piece) + 3) // 4 if len(piece) > 6 else 1
+        elif piece[0].isdigit():
+            n += (len(piece) + 2) // 3
+        else:
+            n += 1
+    return n
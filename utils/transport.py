@@ -0,0 +1,808 @@
+import asyncio
+import http.client
+import select
+import socket
+import ssl
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from .errors import ConnectionFailed, RequestTimeout
+
+
+# Keep-alive limits shared by the blocking and asyncio pools (see configure_pools)
+_POOL_SETTINGS = {"max_idle_per_host": 64, "idle_timeout_s": 60.0}
+
+
+def configure_pools(max_idle_per_host: Optional[int] = None, idle_timeout_s: Optional[float] = None) -> None:
+    """Set how many idle connections are kept per host and how long they may sit unused."""
+    if max_idle_per_host is not None:
+        _POOL_SETTINGS["max_idle_per_host"] = max(0, int(max_idle_per_host))
+    if idle_timeout_s is not None:
+        _POOL_SETTINGS["idle_timeout_s"] = max(0.0, float(idle_timeout_s))
+
+
+class Deadline:
+    """Time limits for one call, in seconds (None = unlimited).
+
+    connect_s bounds establishing a connection, read_s the wait for any next
+    bytes (response headers or the next body chunk), and total_s the whole
+    call counted from construction. Both pools enforce them by closing the
+    connection, so a timed-out request really stops.
+    """
+
+    def __init__(self, connect_s: Optional[float] = None, read_s: Optional[float] = None, total_s: Optional[float] = None) -> None:
+        self.connect_s = connect_s
+        self.read_s = read_s
+        self.total_s = total_s
+        self.expires_at = (time.monotonic() + total_s) if total_s else None
+
+    def remaining(self) -> Optional[float]:
+        return (self.expires_at - time.monotonic()) if self.expires_at is not None else None
+
+    def timeout(self, phase: str) -> Optional[float]:
+        """Longest wait allowed for the next connect/read step; raises RequestTimeout once the total is spent."""
+        limit = self.connect_s if phase == "connect" else self.read_s
+        left = self.remaining()
+        if left is None:
+            return limit
+        if left <= 0:
+            raise RequestTimeout("total", self.total_s)
+        return left if limit is None else min(limit, left)
+
+    def error(self, phase: str) -> RequestTimeout:
+        """The timeout to raise after a wait in phase ran out: the total deadline if it is spent, else the phase's own."""
+        left = self.remaining()
+        if left is not None and left <= 0.01:
+            return RequestTimeout("total", self.total_s)
+        return RequestTimeout(phase, self.connect_s if phase == "connect" else self.read_s)
+
+    def check(self) -> None:
+        left = self.remaining()
+        if left is not None and left <= 0:
+            raise RequestTimeout("total", self.total_s)
+
+    def httpx_timeout(self) -> httpx.Timeout:
+        """Per-request timeout for SDK calls; the total is re-checked by the caller between stream events."""
+        read = self.timeout("read")
+        return httpx.Timeout(connect=self.timeout("connect"), read=read, write=read, pool=None)
+
+
+def _timed_out(deadline: Optional[Deadline], phase: str) -> RequestTimeout:
+    # Sockets without a deadline can still time out at the OS level (e.g. connect ETIMEDOUT)
+    return deadline.error(phase) if deadline is not None else RequestTimeout(phase, None)
+
+
+def _broken(e: BaseException) -> ConnectionFailed:
+    """A response cut off or garbled on the wire: retriable like a dropped connection."""
+    return ConnectionFailed(f"connection broken: {type(e).__name__}: {e}")
+
+
+def _httpx_deadline(request: httpx.Request) -> Optional[Deadline]:
+    t = request.extensions.get("timeout") or {}
+    if t.get("connect") is None and t.get("read") is None:
+        return None
+    return Deadline(t.get("connect"), t.get("read"))
+
+
+def _origin_and_target(url: str) -> Tuple[Tuple[str, str, int], str, str]:
+    parts = urlsplit(url)
+    scheme = parts.scheme or "https"
+    port = parts.port or (443 if scheme == "https" else 80)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    return (scheme, parts.hostname or "", port), target, parts.netloc
+
+
+# ---------------------------------------------------------------------------
+# Blocking HTTP/1.1 client
+#
+# One process-wide pool of keep-alive http.client connections per
+# (scheme, host, port), safe to share between worker threads. A connection is
+# checked out for the duration of one request and returned once its response
+# body has been fully read.
+# ---------------------------------------------------------------------------
+
+# A response closed before its end (e.g. an SDK stream stopping at its final event) is drained
+# up to this many bytes / seconds so the connection can still be reused
+_DRAIN_MAX_BYTES = 64 * 1024
+_DRAIN_TIMEOUT_S = 0.1
+
+# Errors that mean a reused keep-alive connection was closed by the server while idle
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class CancelScope:
+    """Lets another thread stop the blocking requests a thread makes inside ``with scope:``.
+
+    Connections checked out inside the scope are registered with it until
+    they go back to the pool or are closed. cancel() shuts their sockets
+    down, so a read blocked on one fails at once instead of waiting for the
+    response or its read timeout; requests started after cancel() fail
+    before they are sent. Used to stop the loser of a hedged pair.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._conns: "set[_SyncConn]" = set()
+        self.cancelled = False
+
+    def __enter__(self) -> "CancelScope":
+        _scope_local.scope = self
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        _scope_local.scope = None
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            conns, self._conns = list(self._conns), set()
+            for c in conns:
+                c.abort()
+
+    def _add(self, conn: "_SyncConn") -> None:
+        with self._lock:
+            if self.cancelled:
+                raise ConnectionAbortedError("request cancelled")
+            self._conns.add(conn)
+            conn.scope = self
+
+    def _discard(self, conn: "_SyncConn") -> None:
+        with self._lock:
+            self._conns.discard(conn)
+
+
+_scope_local = threading.local()
+
+
+class _SyncConn:
+    def __init__(self, origin: Tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        self.origin = origin
+        self.conn = conn
+        self.last_used = time.monotonic()
+        self.scope: Optional[CancelScope] = None
+        self.aborted = False
+
+    def release_scope(self) -> None:
+        scope, self.scope = self.scope, None
+        if scope is not None:
+            scope._discard(self)
+
+    def abort(self) -> None:
+        # From another thread: shutdown (unlike close) wakes a recv blocked on the socket
+        self.aborted = True
+        sock = self.conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.release_scope()
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def usable(self, now: float) -> bool:
+        if now - self.last_used > _POOL_SETTINGS["idle_timeout_s"]:
+            return False
+        sock = self.conn.sock
+        if sock is None:
+            return False
+        try:
+            # An idle connection should have nothing to read; readable means EOF or junk
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+
+class PooledResponse:
+    """Blocking response; the connection returns to the pool once the body is consumed."""
+
+    def __init__(self, pool: "ConnectionPool", conn: _SyncConn, response: http.client.HTTPResponse, deadline: Optional[Deadline] = None) -> None:
+        self._pool = pool
+        self._conn: Optional[_SyncConn] = conn
+        self._response = response
+        self._deadline = deadline
+        self.status = response.status
+        self.reason = response.reason
+        self.header_list: List[Tuple[str, str]] = response.getheaders()
+        self.headers: Dict[str, str] = {k.lower(): v for k, v in self.header_list}
+
+    def iter_chunks(self, size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield decoded body chunks as they arrive."""
+        try:
+            while True:
+                self._arm()
+                data = self._response.read1(size)
+                if not data:
+                    if self._response.length:
+                        # read1() reports a connection closed short of Content-Length as a plain EOF
+                        raise http.client.IncompleteRead(b"", self._response.length)
+                    break
+                yield data
+        except (TimeoutError, RequestTimeout) as e:
+            self._abort()
+            raise (e if isinstance(e, RequestTimeout) else _timed_out(self._deadline, "read")) from None
+        except http.client.HTTPException as e:
+            self._abort()
+            raise _broken(e) from e
+        finally:
+            self.close()
+
+    def read(self) -> bytes:
+        if self._deadline is not None:
+            # Chunk by chunk so the total deadline is re-checked between socket reads
+            return b"".join(self.iter_chunks())
+        try:
+            return self._response.read()
+        except http.client.HTTPException as e:
+            self._abort()
+            raise _broken(e) from e
+        finally:
+            self.close()
+
+    def _arm(self) -> None:
+        conn = self._conn
+        if self._deadline is not None and conn is not None and conn.conn.sock is not None:
+            conn.conn.sock.settimeout(self._deadline.timeout("read"))
+
+    def _abort(self) -> None:
+        # A timed-out connection may still receive the rest of its response: never reuse it
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._response.close()
+            conn.close()
+
+    def _drain(self, conn: _SyncConn) -> None:
+        sock = conn.conn.sock
+        if sock is None or self._response.will_close:
+            return
+        try:
+            sock.settimeout(_DRAIN_TIMEOUT_S)
+            left = _DRAIN_MAX_BYTES
+            while left > 0 and not self._response.isclosed():
+                data = self._response.read1(left)
+                if not data:
+                    break
+                left -= len(data)
+            sock.settimeout(None)
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if not self._response.isclosed() and self._response.length == 0:
+            # read1() never marks a fully read Content-Length body as complete; read() does
+            self._response.read()
+        if not self._response.isclosed():
+            self._drain(conn)
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._put_idle(conn)
+        else:
+            self._response.close()
+            conn.close()
+
+
+class ConnectionPool:
+    """Thread-safe keep-alive pool of blocking connections per (scheme, host, port)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str, int], List[_SyncConn]] = {}
+
+    def _connect(self, origin: Tuple[str, str, int], deadline: Optional[Deadline]) -> _SyncConn:
+        scheme, host, port = origin
+        timeout = deadline.timeout("connect") if deadline is not None else None
+        if scheme == "http":
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        else:
+            conn = http.client.HTTPSConnection(host, port, timeout=timeout, context=_ssl_context())
+        try:
+            conn.connect()
+        except TimeoutError:
+            conn.close()
+            raise _timed_out(deadline, "connect") from None
+        return _SyncConn(origin, conn)
+
+    def _take_idle(self, origin: Tuple[str, str, int]) -> Optional[_SyncConn]:
+        now = time.monotonic()
+        stale: List[_SyncConn] = []
+        found: Optional[_SyncConn] = None
+        with self._lock:
+            idle = self._idle.get(origin)
+            while idle:
+                c = idle.pop()
+                if c.usable(now):
+                    found = c
+                    break
+                stale.append(c)
+        for c in stale:
+            c.close()
+        return found
+
+    def _put_idle(self, conn: _SyncConn) -> None:
+        conn.release_scope()
+        if conn.aborted:
+            conn.close()
+            return
+        conn.last_used = time.monotonic()
+        evicted: List[_SyncConn] = []
+        with self._lock:
+            idle = self._idle.setdefault(conn.origin, [])
+            idle.append(conn)
+            # Most recently used at the end; drop the oldest beyond the cap or past the idle timeout
+            cutoff = conn.last_used - _POOL_SETTINGS["idle_timeout_s"]
+            while idle and (len(idle) > _POOL_SETTINGS["max_idle_per_host"] or idle[0].last_used < cutoff):
+                evicted.append(idle.pop(0))
+        for c in evicted:
+            c.close()
+
+    def open(self, method: str, url: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None, deadline: Optional[Deadline] = None) -> PooledResponse:
+        """Send a request and return once the status line and headers have arrived."""
+        origin, target, _ = _origin_and_target(url)
+        scope: Optional[CancelScope] = getattr(_scope_local, "scope", None)
+        conn = self._take_idle(origin)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect(origin, deadline)
+            try:
+                if scope is not None:
+                    scope._add(conn)
+                # Pooled sockets keep the timeout of their last request; reset it for this one
+                conn.conn.sock.settimeout(deadline.timeout("read") if deadline is not None else None)
+                conn.conn.request(method, target, body, headers=(headers or {}))
+                response = conn.conn.getresponse()
+                return PooledResponse(self, conn, response, deadline)
+            except (TimeoutError, RequestTimeout) as e:
+                conn.close()
+                raise (e if isinstance(e, RequestTimeout) else _timed_out(deadline, "read")) from None
+            except _STALE_ERRORS as e:
+                conn.close()
+                if not reused or conn.aborted:
+                    if isinstance(e, http.client.HTTPException):
+                        raise _broken(e) from e
+                    raise
+                conn, reused = None, False
+            except http.client.HTTPException as e:
+                conn.close()
+                raise _broken(e) from e
+            except BaseException:
+                conn.close()
+                raise
+
+    def request(self, method: str, url: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None, deadline: Optional[Deadline] = None) -> Tuple[PooledResponse, bytes]:
+        """Send a request and read the whole body; returns (response, body)."""
+        response = self.open(method, url, body, headers, deadline)
+        return response, response.read()
+
+    def close(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for c in conns:
+            c.close()
+
+
+_SYNC_POOL = ConnectionPool()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide blocking connection pool."""
+    return _SYNC_POOL
+
+
+class _SyncPoolByteStream(httpx.SyncByteStream):
+    def __init__(self, response: PooledResponse) -> None:
+        self._response = response
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            yield from self._response.iter_chunks()
+        except RequestTimeout as e:
+            # httpx (and the SDKs above it) recognize their own timeout type
+            raise httpx.ReadTimeout(str(e)) from e
+        except ConnectionFailed as e:
+            raise httpx.RemoteProtocolError(str(e)) from e
+
+    def close(self) -> None:
+        self._response.close()
+
+
+class SyncPoolTransport(httpx.BaseTransport):
+    """httpx transport over ConnectionPool, so SDK clients share the process-wide pool."""
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self._pool = pool
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ("transfer-encoding", "host")}
+        try:
+            response = self._pool.open(request.method, str(request.url), body, headers, _httpx_deadline(request))
+        except RequestTimeout as e:
+            raise (httpx.ConnectTimeout if e.phase == "connect" else httpx.ReadTimeout)(str(e), request=request) from e
+        except ConnectionFailed as e:
+            raise httpx.RemoteProtocolError(str(e), request=request) from e
+        # Body framing is already decoded by http.client; content-encoding is left to httpx
+        out_headers = [(k, v) for k, v in response.header_list if k.lower() not in ("transfer-encoding", "content-length")]
+        return httpx.Response(response.status, headers=out_headers, stream=_SyncPoolByteStream(response), request=request)
+
+
+_sync_client_lock = threading.Lock()
+_sync_client: Optional[httpx.Client] = None
+
+
+def get_sync_client() -> httpx.Client:
+    """Return a process-wide httpx.Client for SDKs, backed by the blocking connection pool."""
+    global _sync_client
+    with _sync_client_lock:
+        if _sync_client is None or _sync_client.is_closed:
+            # No default timeout: long thinking calls may take minutes; callers pass per-request deadlines (Deadline.httpx_timeout)
+            _sync_client = httpx.Client(transport=SyncPoolTransport(_SYNC_POOL), timeout=httpx.Timeout(None))
+        return _sync_client
+
+
+# ---------------------------------------------------------------------------
+# Asyncio HTTP/1.1 client
+#
+# httpx/httpcore scan every pooled connection on each request event, which is
+# quadratic in the number of in-flight requests and dominates CPU beyond a few
+# hundred concurrent calls. This minimal keep-alive pool keeps per-request cost
+# constant so one event loop can carry thousands of long-running calls.
+# ---------------------------------------------------------------------------
+
+_SSL_CONTEXT: Optional[ssl.SSLContext] = None
+_READ_CHUNK = 64 * 1024
+
+
+def _ssl_context() -> ssl.SSLContext:
+    global _SSL_CONTEXT
+    if _SSL_CONTEXT is None:
+        _SSL_CONTEXT = ssl.create_default_context()
+    return _SSL_CONTEXT
+
+
+class _Conn:
+    def __init__(self, origin: Tuple[str, str, int], reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.origin = origin
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+    def abort(self) -> None:
+        # Drop the connection without flushing; a pending read then sees EOF
+        try:
+            self.writer.transport.abort()
+        except Exception:
+            pass
+
+
+async def _timed(conn: _Conn, aw: Any, deadline: Optional[Deadline], phase: str = "read") -> Any:
+    """Await one read on conn; past the deadline's limit the connection is aborted and RequestTimeout raised.
+
+    A timer handle per read rather than asyncio.wait_for, which would wrap every
+    body chunk of every in-flight call in its own task.
+    """
+    if deadline is None:
+        return await aw
+    try:
+        limit = deadline.timeout(phase)
+    except RequestTimeout:
+        aw.close()
+        conn.abort()
+        raise
+    if limit is None:
+        return await aw
+    fired = False
+
+    def expire() -> None:
+        nonlocal fired
+        fired = True
+        conn.abort()
+
+    handle = asyncio.get_running_loop().call_later(limit, expire)
+    try:
+        result = await aw
+    except (asyncio.IncompleteReadError, ConnectionError, OSError):
+        if fired:
+            raise deadline.error(phase) from None
+        raise
+    finally:
+        handle.cancel()
+    if fired:
+        raise deadline.error(phase)
+    return result
+
+
+class AsyncHTTPResponse:
+    """Response whose body is read lazily; the connection returns to the pool once the body is consumed."""
+
+    def __init__(self, pool: "AsyncConnectionPool", conn: _Conn, status: int, reason: str, headers: List[Tuple[str, str]], method: str, deadline: Optional[Deadline] = None) -> None:
+        self._pool = pool
+        self._conn: Optional[_Conn] = conn
+        self._deadline = deadline
+        self.status = status
+        self.reason = reason
+        self.header_list = headers
+        self.headers: Dict[str, str] = {k.lower(): v for k, v in headers}
+        te = self.headers.get("transfer-encoding", "").lower()
+        self._chunked = "chunked" in te
+        length = self.headers.get("content-length")
+        self._remaining: Optional[int] = int(length) if (length is not None and not self._chunked) else None
+        self._no_body = method == "HEAD" or status in (204, 304) or 100 <= status < 200
+        self._keep_alive = self.headers.get("connection", "").lower() != "close" and (self._chunked or self._remaining is not None or self._no_body)
+        self._done = False
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        """Yield decoded body chunks as they arrive."""
+        conn = self._conn
+        if conn is None or self._done:
+            return
+        reader = conn.reader
+        deadline = self._deadline
+        try:
+            if self._no_body:
+                pass
+            elif self._chunked:
+                while True:
+                    size_line = await _timed(conn, reader.readuntil(b"\r\n"), deadline)
+                    try:
+                        size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                    except ValueError:
+                        raise ConnectionFailed(f"connection broken: bad chunk size line {size_line[:40]!r}") from None
+                    if size == 0:
+                        # Skip trailers up to the terminating blank line
+                        while (await _timed(conn, reader.readuntil(b"\r\n"), deadline)) != b"\r\n":
+                            pass
+                        break
+                    data = await _timed(conn, reader.readexactly(size + 2), deadline)
+                    yield data[:-2]
+            elif self._remaining is not None:
+                while self._remaining > 0:
+                    data = await _timed(conn, reader.read(min(_READ_CHUNK, self._remaining)), deadline)
+                    if not data:
+                        raise ConnectionFailed(f"connection broken: closed {self._remaining} bytes short of Content-Length")
+                    self._remaining -= len(data)
+                    yield data
+            else:
+                while True:
+                    data = await _timed(conn, reader.read(_READ_CHUNK), deadline)
+                    if not data:
+                        break
+                    yield data
+            self._done = True
+        except asyncio.IncompleteReadError as e:
+            raise _broken(e) from e
+        finally:
+            self._release()
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self.iter_chunks()])
+
+    async def aclose(self) -> None:
+        if self._conn is not None and not self._done and self._keep_alive:
+            # Drain a small remainder so the connection can be reused
+            try:
+                await asyncio.wait_for(self._drain(), _DRAIN_TIMEOUT_S)
+            except Exception:
+                pass
+        self._release()
+
+    async def _drain(self) -> None:
+        left = _DRAIN_MAX_BYTES
+        chunks = self.iter_chunks()
+        try:
+            async for chunk in chunks:
+                left -= len(chunk)
+                if left <= 0:
+                    break
+        finally:
+            await chunks.aclose()
+
+    def _release(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._done and self._keep_alive:
+            self._pool._put_idle(conn)
+        else:
+            conn.close()
+
+
+class AsyncConnectionPool:
+    """Keep-alive HTTP/1.1 connections per (scheme, host, port) for one event loop."""
+
+    def __init__(self) -> None:
+        self._idle: Dict[Tuple[str, str, int], List[_Conn]] = {}
+        self._closed = False
+
+    async def _connect(self, origin: Tuple[str, str, int]) -> _Conn:
+        scheme, host, port = origin
+        reader, writer = await asyncio.open_connection(
+            host,
+            port,
+            ssl=(_ssl_context() if scheme == "https" else None),
+            server_hostname=(host if scheme == "https" else None),
+            limit=2 ** 20,
+        )
+        return _Conn(origin, reader, writer)
+
+    def _put_idle(self, conn: _Conn) -> None:
+        if self._closed:
+            conn.close()
+            return
+        conn.last_used = time.monotonic()
+        idle = self._idle.setdefault(conn.origin, [])
+        idle.append(conn)
+        cutoff = conn.last_used - _POOL_SETTINGS["idle_timeout_s"]
+        while idle and (len(idle) > _POOL_SETTINGS["max_idle_per_host"] or idle[0].last_used < cutoff):
+            idle.pop(0).close()
+
+    def _take_idle(self, origin: Tuple[str, str, int]) -> Optional[_Conn]:
+        idle = self._idle.get(origin)
+        cutoff = time.monotonic() - _POOL_SETTINGS["idle_timeout_s"]
+        while idle:
+            conn = idle.pop()
+            if conn.last_used >= cutoff and not conn.reader.at_eof() and not conn.writer.is_closing():
+                return conn
+            conn.close()
+        return None
+
+    async def request(self, method: str, url: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None, deadline: Optional[Deadline] = None) -> AsyncHTTPResponse:
+        origin, target, netloc = _origin_and_target(url)
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {netloc}"]
+        sent = {"host", "content-length"}
+        for k, v in (headers or {}).items():
+            if k.lower() in sent:
+                continue
+            lines.append(f"{k}: {v}")
+        lines.append(f"Content-Length: {len(body)}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        # A pooled connection may have been closed by the server while idle; retry once on a fresh one
+        conn = self._take_idle(origin)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = await self._connect_within(origin, deadline)
+            try:
+                status_head = await _timed(conn, self._exchange(conn, head + body), deadline)
+                break
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                conn.close()
+                if not reused:
+                    if isinstance(e, asyncio.IncompleteReadError):
+                        raise _broken(e) from e
+                    raise
+                conn, reused = None, False
+            except BaseException:
+                conn.close()
+                raise
+        status_lines = status_head.decode("latin-1").split("\r\n")
+        proto_status = status_lines[0].split(" ", 2)
+        try:
+            status = int(proto_status[1])
+        except (IndexError, ValueError):
+            conn.close()
+            raise ConnectionFailed(f"connection broken: bad status line {status_lines[0][:80]!r}") from None
+        reason = proto_status[2] if len(proto_status) > 2 else ""
+        resp_headers: List[Tuple[str, str]] = []
+        for ln in status_lines[1:]:
+            if ":" in ln:
+                k, v = ln.split(":", 1)
+                resp_headers.append((k.strip(), v.strip()))
+        return AsyncHTTPResponse(self, conn, status, reason, resp_headers, method, deadline)
+
+    async def _connect_within(self, origin: Tuple[str, str, int], deadline: Optional[Deadline]) -> _Conn:
+        limit = deadline.timeout("connect") if deadline is not None else None
+        if limit is None:
+            return await self._connect(origin)
+        try:
+            # Cancelling the connect attempt closes its half-open socket
+            return await asyncio.wait_for(self._connect(origin), limit)
+        except asyncio.TimeoutError:
+            raise deadline.error("connect") from None
+
+    @staticmethod
+    async def _exchange(conn: _Conn, data: bytes) -> bytes:
+        conn.writer.write(data)
+        await conn.writer.drain()
+        return await conn.reader.readuntil(b"\r\n\r\n")
+
+    async def aclose(self) -> None:
+        self._closed = True
+        for conns in self._idle.values():
+            for conn in conns:
+                conn.close()
+        self._idle.clear()
+
+
+class _PoolByteStream(httpx.AsyncByteStream):
+    def __init__(self, response: AsyncHTTPResponse) -> None:
+        self._response = response
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._response.iter_chunks():
+                yield chunk
+        except RequestTimeout as e:
+            raise httpx.ReadTimeout(str(e)) from e
+        except ConnectionFailed as e:
+            raise httpx.RemoteProtocolError(str(e)) from e
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    """httpx transport over AsyncConnectionPool, so SDK clients share the scalable pool."""
+
+    def __init__(self, pool: AsyncConnectionPool) -> None:
+        self._pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        headers = {k: v for k, v in request.headers.items() if k.lower() != "transfer-encoding"}
+        try:
+            response = await self._pool.request(request.method, str(request.url), body, headers, _httpx_deadline(request))
+        except RequestTimeout as e:
+            raise (httpx.ConnectTimeout if e.phase == "connect" else httpx.ReadTimeout)(str(e), request=request) from e
+        except ConnectionFailed as e:
+            raise httpx.RemoteProtocolError(str(e), request=request) from e
+        # Body framing is already decoded by the pool; content-encoding is left to httpx
+        out_headers = [(k, v) for k, v in response.header_list if k.lower() not in ("transfer-encoding", "content-length")]
+        return httpx.Response(response.status, headers=out_headers, stream=_PoolByteStream(response), request=request)
+
+
+# One pool (and one httpx client on top of it) per running event loop
+_async_pools: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_pool() -> AsyncConnectionPool:
+    """Return the keep-alive connection pool bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = AsyncConnectionPool()
+        _async_pools[loop] = pool
+    return pool
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return an httpx.AsyncClient for SDKs, backed by the running loop's connection pool."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        # No default timeout: long thinking calls may take minutes; callers pass per-request deadlines (Deadline.httpx_timeout)
+        client = httpx.AsyncClient(transport=PoolTransport(get_async_pool()), timeout=httpx.Timeout(None))
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client() -> None:
+    """Close the running loop's connection pool and SDK client, if any."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+    pool = _async_pools.pop(loop, None)
+    if pool is not None:
+        await pool.aclose()